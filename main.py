@@ -1,13 +1,29 @@
 import os
+import sys
+# المجلد الأب في المسار حتى يستورد التطبيق وحداته بالبادئة src كما تفعل المسارات والأدوات
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 from flask import Flask, send_from_directory
 from flask_cors import CORS
 
-from models.user import db
-from routes.auth import auth_bp
-from routes.products import products_bp
-from routes.orders import orders_bp
-from routes.notifications import notifications_bp
-from routes.admin import admin_bp
+from src.models.user import db
+from src.routes.auth import auth_bp
+from src.routes.products import products_bp
+from src.routes.orders import orders_bp
+from src.routes.notifications import notifications_bp
+from src.routes.admin import admin_bp
+from src.routes.follows import follows_bp
+from src.routes.payouts import payouts_bp
+from src.utils.schema import ensure_schema
+from src.utils.search import ensure_search_index
+from src.utils.reputation import ensure_reputations, rebuild_reputations
+from src.utils.notifications import ensure_unread_counters, repair_unread_counters
+from src.utils.images import find_original, IMMUTABLE_MAX_AGE
+from src.utils.ranking import refresh_all_scores, refresh_queued_scores
+from src.utils.order_stats import reset_order_stats
+from src.utils.payments import sweep_overdue_payments
+from src.utils.subscriptions import run_subscription_jobs
+from src.utils.scheduler import start_periodic_job
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
 app.config['SECRET_KEY'] = 'asdf#FGSgvasgf$5$WGT'
@@ -18,7 +34,7 @@ CORS(app, supports_credentials=True)
 # قاعدة البيانات SQLite
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 db_path = os.path.join(BASE_DIR, 'app.db')
-app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', f'sqlite:///{db_path}')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 db.init_app(app)
@@ -26,6 +42,14 @@ db.init_app(app)
 # إنشاء الجداول
 with app.app_context():
     db.create_all()
+    # الأعمدة والفهارس الجديدة على جداول قاعدة بيانات قائمة
+    ensure_schema()
+    # فهرس البحث النصي للمنتجات
+    ensure_search_index()
+    # سجل الزبائن حسب رقم الهاتف
+    ensure_reputations()
+    # مشغلات عداد الإشعارات غير المقروءة
+    ensure_unread_counters()
 
 # مسارات API
 app.register_blueprint(auth_bp, url_prefix='/api/auth')
@@ -33,6 +57,47 @@ app.register_blueprint(products_bp, url_prefix='/api/products')
 app.register_blueprint(orders_bp, url_prefix='/api/orders')
 app.register_blueprint(notifications_bp, url_prefix='/api/notifications')
 app.register_blueprint(admin_bp, url_prefix='/api/admin')
+app.register_blueprint(follows_bp, url_prefix='/api/follows')
+app.register_blueprint(payouts_bp, url_prefix='/api/payouts')
+
+# أوامر الصيانة الدورية
+@app.cli.command('refresh-rankings')
+def refresh_rankings_command():
+    updated = refresh_all_scores()
+    print(f'تم تحديث درجة ترتيب {updated} منتج')
+
+@app.cli.command('refresh-queued-rankings')
+def refresh_queued_rankings_command():
+    # درجات المنتجات التي تغيرت طلباتها أو بيانات تاجرها منذ آخر تشغيل
+    updated = refresh_queued_scores()
+    print(f'تم تحديث درجة ترتيب {updated} منتج')
+
+@app.cli.command('reset-order-stats')
+def reset_order_stats_command():
+    # تُعاد الإحصائيات من جدول الطلبات عند أول طلب لها
+    deleted = reset_order_stats()
+    print(f'تم حذف {deleted} ملخص إحصائيات')
+
+@app.cli.command('rebuild-customer-reputations')
+def rebuild_customer_reputations_command():
+    rebuild_reputations()
+    print('تمت إعادة بناء سجل الزبائن')
+
+@app.cli.command('repair-notification-counters')
+def repair_notification_counters_command():
+    repair_unread_counters()
+    print('تمت إعادة حساب عدادات الإشعارات غير المقروءة')
+
+@app.cli.command('sweep-overdue-payments')
+def sweep_overdue_payments_command():
+    delayed = sweep_overdue_payments()
+    print(f'تم تحويل {delayed} طلب إلى دفع متأخر')
+
+# عند التشغيل عبر خادم WSGI تُجدول هذه الأوامر في cron، وما تبطله يصل لعمليات الخادم عبر سجل الإبطال
+@app.cli.command('expire-subscriptions')
+def expire_subscriptions_command():
+    reminded, expired = run_subscription_jobs()
+    print(f'تم إرسال {reminded} تذكير وإنهاء {expired} اشتراك')
 
 # مسار للتحقق من الصحة
 @app.route('/api/health', methods=['GET'])
@@ -44,6 +109,16 @@ def health_check():
 @app.route('/<path:path>')
 def serve(path):
     static_folder_path = app.static_folder
+    if path.startswith('uploads/'):
+        # الصور المرفوعة مسماة ببصمة محتواها فلا تتغير أبداً
+        if os.path.exists(os.path.join(static_folder_path, path)):
+            response = send_from_directory(static_folder_path, path, max_age=IMMUTABLE_MAX_AGE)
+            response.cache_control.immutable = True
+            return response
+        original = find_original(static_folder_path, path)
+        if original:
+            return send_from_directory(static_folder_path, original, max_age=60)
+        return "image not found", 404
     if path != "" and os.path.exists(os.path.join(static_folder_path, path)):
         return send_from_directory(static_folder_path, path)
     else:
@@ -56,4 +131,19 @@ def serve(path):
 # نقطة التشغيل
 if __name__ == '__main__':
     port = int(os.environ.get("PORT", 10000))  # Render يستخدم PORT من environment
+    # فحص الدفعات المتأخرة كل ساعة افتراضياً، والقيمة 0 توقفه
+    sweep_interval = int(os.environ.get("PAYMENT_SWEEP_INTERVAL", 3600))
+    if sweep_interval > 0:
+        start_periodic_job(app, 'payment-sweeper', sweep_interval, sweep_overdue_payments)
+    # إعادة حساب درجات الترتيب المتغيرة كل دقيقة افتراضياً
+    rank_interval = int(os.environ.get("RANK_REFRESH_INTERVAL", 60))
+    if rank_interval > 0:
+        start_periodic_job(app, 'rank-refresh', rank_interval, refresh_queued_scores)
+    subscription_interval = int(os.environ.get("SUBSCRIPTION_SWEEP_INTERVAL", 3600))
+    if subscription_interval > 0:
+        start_periodic_job(app, 'subscription-expiry', subscription_interval, run_subscription_jobs)
+    # مطابقة عدادات الإشعارات مع الجدول مرة يومياً احتياطاً
+    counters_interval = int(os.environ.get("NOTIFICATION_COUNTERS_REPAIR_INTERVAL", 86400))
+    if counters_interval > 0:
+        start_periodic_job(app, 'notification-counters', counters_interval, repair_unread_counters)
     app.run(host='0.0.0.0', port=port)
@@ -1,4 +1,5 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, DDL
 from datetime import datetime
 from enum import Enum
 
@@ -27,6 +28,10 @@ class SubscriptionStatus(Enum):
     EXPIRED = "expired"
     CANCELLED = "cancelled"
 
+class PayoutStatus(Enum):
+    PENDING = "pending"
+    PAID = "paid"
+
 class NotificationType(Enum):
     ORDER_UPDATE = "order_update"
     NEW_ORDER = "new_order"
@@ -61,10 +66,18 @@ class UserProfile(db.Model):
     payment_details = db.Column(db.String(200), nullable=True)  # رقم المحفظة
     is_verified = db.Column(db.Boolean, default=False)
     completed_orders = db.Column(db.Integer, default=0)
+    followers_count = db.Column(db.Integer, nullable=False, default=0)  # متابعو التاجر من المسوقين
+    fanout_paused_at = db.Column(db.DateTime, nullable=True)  # توقف نسخ منتجات التاجر لخطوط المتابعين منذ هذا الوقت
     subscription_status = db.Column(db.Enum(SubscriptionStatus), default=SubscriptionStatus.INACTIVE)
     subscription_expiry = db.Column(db.DateTime, nullable=True)
+    expiry_reminder_sent_at = db.Column(db.DateTime, nullable=True)  # يُصفَّر عند كل تفعيل
     is_banned = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # فهرس لمهمة انتهاء الاشتراكات وتذكيراتها
+    __table_args__ = (
+        db.Index('ix_user_profiles_subscription_expiry', 'subscription_status', 'subscription_expiry'),
+    )
 
 class Product(db.Model):
     __tablename__ = 'products'
@@ -79,10 +92,28 @@ class Product(db.Model):
     suggested_price = db.Column(db.Float, nullable=True)
     is_active = db.Column(db.Boolean, default=True)
     category = db.Column(db.String(100), nullable=True)
+    sku = db.Column(db.String(100), nullable=True)  # رمز المنتج لدى التاجر
+    rank_score = db.Column(db.Float, nullable=False, default=0)  # درجة الترتيب المحسوبة من سجل الطلبات
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # العلاقات
     orders = db.relationship('Order', backref='product', lazy=True)
+    
+    # فهارس لترقيم الكتالوج بالمؤشر والتصفية حسب التصنيف ومنتجات التاجر
+    __table_args__ = (
+        db.Index('ix_products_active_created', 'is_active', 'created_at', 'id'),
+        db.Index('ix_products_active_category_created', 'is_active', 'category', 'created_at'),
+        db.Index('ix_products_merchant_created', 'merchant_id', 'created_at'),
+        db.Index('ix_products_merchant_sku', 'merchant_id', 'sku', unique=True),
+        db.Index('ix_products_active_rank', 'is_active', 'rank_score', 'id'),
+    )
+
+class RankRefresh(db.Model):
+    __tablename__ = 'rank_refreshes'
+
+    # منتجات وتجار تغيرت مدخلات درجة ترتيبهم، تعيد حسابها مهمة دورية خارج مسار الطلب
+    scope = db.Column(db.String(20), primary_key=True)  # product/merchant
+    target_id = db.Column(db.Integer, primary_key=True)
 
 class Order(db.Model):
     __tablename__ = 'orders'
@@ -102,6 +133,81 @@ class Order(db.Model):
     payment_due_date = db.Column(db.DateTime, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # مفتاح يرسله المسوق لمنع تكرار الطلب عند إعادة الإرسال
+    idempotency_key = db.Column(db.String(100), nullable=True)
+    payout_batch_id = db.Column(db.Integer, db.ForeignKey('payout_batches.id'), nullable=True)
+    
+    __table_args__ = (
+        db.Index('ix_orders_product', 'product_id'),
+        db.Index('ix_orders_marketer_idempotency', 'marketer_id', 'idempotency_key', unique=True),
+        db.Index('ix_orders_payment_due', 'payment_status', 'payment_due_date'),
+        db.Index('ix_orders_payout_batch', 'payout_batch_id', 'marketer_id'),
+        db.Index('ix_orders_merchant_created', 'merchant_id', 'created_at'),
+        db.Index('ix_orders_marketer_created', 'marketer_id', 'created_at'),
+    )
+
+class PayoutBatch(db.Model):
+    __tablename__ = 'payout_batches'
+    
+    # دفعة تسوية تجمع كل مستحقات المسوقين لدى التاجر وقت إنشائها
+    id = db.Column(db.Integer, primary_key=True)
+    merchant_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    status = db.Column(db.Enum(PayoutStatus), nullable=False, default=PayoutStatus.PENDING)
+    orders_count = db.Column(db.Integer, nullable=False, default=0)
+    marketers_count = db.Column(db.Integer, nullable=False, default=0)
+    total_amount = db.Column(db.Float, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    paid_at = db.Column(db.DateTime, nullable=True)
+    
+    __table_args__ = (
+        db.Index('ix_payout_batches_merchant_created', 'merchant_id', 'created_at'),
+    )
+
+class OrderEvent(db.Model):
+    __tablename__ = 'order_events'
+    
+    # سجل إضافي فقط لكل تغيير على حالة الطلب أو حالة الدفع
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False)
+    actor_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)  # فارغ للمهام الآلية
+    kind = db.Column(db.String(20), nullable=False)  # created/status/payment
+    from_value = db.Column(db.String(20), nullable=True)
+    to_value = db.Column(db.String(20), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_order_events_created', 'created_at'),
+        db.Index('ix_order_events_order', 'order_id', 'created_at'),
+    )
+
+class CustomerReputation(db.Model):
+    __tablename__ = 'customer_reputations'
+    
+    # سجل الزبون حسب رقم الهاتف بعد توحيد صيغته، يُحدَّث مع كل تغيير في حالة الطلب
+    phone = db.Column(db.String(20), primary_key=True)
+    total_orders = db.Column(db.Integer, nullable=False, default=0)
+    completed_orders = db.Column(db.Integer, nullable=False, default=0)
+    rejected_orders = db.Column(db.Integer, nullable=False, default=0)
+    not_serious_orders = db.Column(db.Integer, nullable=False, default=0)
+
+class OrderStats(db.Model):
+    __tablename__ = 'order_stats'
+    
+    # ملخص طلبات المستخدم بصفته تاجراً أو مسوقاً، يُحدَّث مع كل تغيير على الطلبات
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    role = db.Column(db.String(20), primary_key=True)  # merchant/marketer
+    total_orders = db.Column(db.Integer, nullable=False, default=0)
+    completed_orders = db.Column(db.Integer, nullable=False, default=0)
+    paid_profit = db.Column(db.Float, nullable=False, default=0)
+    pending_profit = db.Column(db.Float, nullable=False, default=0)
+
+class MarketerDebt(db.Model):
+    __tablename__ = 'marketer_debts'
+    
+    # المبالغ المستحقة من كل تاجر لكل مسوق عن الطلبات المكتملة غير المدفوعة
+    merchant_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    marketer_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    amount = db.Column(db.Float, nullable=False, default=0)
 
 class Notification(db.Model):
     __tablename__ = 'notifications'
@@ -114,6 +220,40 @@ class Notification(db.Model):
     is_read = db.Column(db.Boolean, default=False)
     related_order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # فهرس لترقيم إشعارات المستخدم بالمؤشر
+    __table_args__ = (
+        db.Index('ix_notifications_user_created', 'user_id', 'created_at', 'id'),
+    )
+
+class NotificationCounter(db.Model):
+    __tablename__ = 'notification_counters'
+    
+    # عدد الإشعارات غير المقروءة لكل مستخدم، تحدّثه مشغلات SQLite على جدول الإشعارات
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    unread_count = db.Column(db.Integer, nullable=False, default=0)
+
+# مشغلات تحدّث عداد غير المقروء مع كل إدراج أو تعديل أو حذف مهما كان مصدره
+NOTIFICATION_COUNTER_TRIGGERS = [
+    "CREATE TRIGGER IF NOT EXISTS trg_notifications_unread_insert "
+    "AFTER INSERT ON notifications WHEN NEW.is_read = 0 BEGIN "
+    "INSERT INTO notification_counters (user_id, unread_count) VALUES (NEW.user_id, 1) "
+    "ON CONFLICT(user_id) DO UPDATE SET unread_count = unread_count + 1; "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS trg_notifications_unread_update "
+    "AFTER UPDATE OF is_read ON notifications WHEN OLD.is_read IS NOT NEW.is_read BEGIN "
+    "INSERT INTO notification_counters (user_id, unread_count) VALUES (NEW.user_id, (NEW.is_read = 0) - (OLD.is_read = 0)) "
+    "ON CONFLICT(user_id) DO UPDATE SET unread_count = unread_count + (NEW.is_read = 0) - (OLD.is_read = 0); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS trg_notifications_unread_delete "
+    "AFTER DELETE ON notifications WHEN OLD.is_read = 0 BEGIN "
+    "UPDATE notification_counters SET unread_count = unread_count - 1 WHERE user_id = OLD.user_id; "
+    "END",
+]
+
+# تُنشأ المشغلات مع جدول الإشعارات في كل create_all
+for _trigger in NOTIFICATION_COUNTER_TRIGGERS:
+    event.listen(Notification.__table__, 'after_create', DDL(_trigger))
 
 class MerchantFollow(db.Model):
     __tablename__ = 'merchant_follows'
@@ -123,8 +263,27 @@ class MerchantFollow(db.Model):
     merchant_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    # فهرس فريد لمنع المتابعة المكررة
-    __table_args__ = (db.UniqueConstraint('marketer_id', 'merchant_id', name='unique_follow'),)
+    # فهرس فريد لمنع المتابعة المكررة، وفهرس لعد متابعي التاجر
+    __table_args__ = (
+        db.UniqueConstraint('marketer_id', 'merchant_id', name='unique_follow'),
+        db.Index('ix_merchant_follows_merchant', 'merchant_id'),
+    )
+
+class FeedEntry(db.Model):
+    __tablename__ = 'feed_entries'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    marketer_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
+    merchant_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    product_created_at = db.Column(db.DateTime, nullable=False)
+    
+    # الخط الزمني لكل مسوق مرتب بتاريخ إنشاء المنتج
+    __table_args__ = (
+        db.UniqueConstraint('marketer_id', 'product_id', name='unique_feed_entry'),
+        db.Index('ix_feed_entries_timeline', 'marketer_id', 'product_created_at', 'product_id'),
+        db.Index('ix_feed_entries_product', 'product_id'),
+    )
 
 class Subscription(db.Model):
     __tablename__ = 'subscriptions'
@@ -139,3 +298,19 @@ class Subscription(db.Model):
     product_count = db.Column(db.Integer, nullable=True)  # للتجار
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+
+class CacheInvalidation(db.Model):
+    __tablename__ = 'cache_invalidations'
+    
+    # سجل التغييرات التي تبطل ما في ذاكرة العمليات، تقرؤه كل عملية لتلحق بتغييرات غيرها
+    id = db.Column(db.Integer, primary_key=True)
+    scope = db.Column(db.String(20), nullable=False)  # merchant/product/user/access_tokens/refresh_tokens
+    target_id = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.Float, nullable=False)  # time.time() ليُقارن بوقت إصدار الرموز
+    
+    # المعرفات لا يُعاد استخدامها حتى يظهر أي سجل محذوف كفجوة
+    __table_args__ = (
+        db.Index('ix_cache_invalidations_created', 'created_at'),
+        db.Index('ix_cache_invalidations_scope', 'scope', 'created_at'),
+        {'sqlite_autoincrement': True},
+    )
@@ -1,28 +1,18 @@
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, request, jsonify
 from src.models.user import db, User, UserProfile, Product, Order, Notification, UserType, SubscriptionStatus, NotificationType
-from sqlalchemy import func, and_
+from src.utils.auth_context import require_admin, invalidate_auth_cache
+from src.utils.tokens import revoke_user_tokens
+from src.utils.imports import iter_upload_rows, chunked, non_text_field
+from src.routes.auth import validate_registration, build_profile_data
+from src.routes.orders import order_export_query, export_orders_response, apply_order_filters
+from src.utils.catalog import catalog_snapshot, product_detail_cache, invalidate_merchant_products
+from src.utils.ranking import refresh_merchant_scores
+from sqlalchemy import func
+from sqlalchemy.orm import aliased
 from datetime import datetime, timedelta
 
 admin_bp = Blueprint('admin', __name__)
 
-def require_admin():
-    user_id = session.get('user_id')
-    if not user_id:
-        return None, jsonify({'error': 'غير مسجل الدخول'}), 401
-    
-    user = User.query.get(user_id)
-    if not user:
-        return None, jsonify({'error': 'المستخدم غير موجود'}), 404
-    
-    profile = UserProfile.query.filter_by(user_id=user_id).first()
-    if not profile:
-        return None, jsonify({'error': 'الملف الشخصي غير موجود'}), 404
-    
-    if profile.user_type != UserType.ADMIN:
-        return None, jsonify({'error': 'هذه الخدمة للمديرين فقط'}), 403
-    
-    return {'user': user, 'profile': profile}, None, None
-
 @admin_bp.route('/dashboard', methods=['GET'])
 def get_admin_dashboard():
     try:
@@ -71,6 +61,21 @@ def get_admin_dashboard():
     except Exception as e:
         return jsonify({'error': f'خطأ في جلب لوحة التحكم: {str(e)}'}), 500
 
+@admin_bp.route('/cache-stats', methods=['GET'])
+def get_cache_stats():
+    try:
+        auth_result, error_response, status_code = require_admin()
+        if error_response:
+            return error_response, status_code
+        
+        return jsonify({
+            'product_detail': product_detail_cache.stats(),
+            'catalog_version': catalog_snapshot.version
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'خطأ في جلب إحصائيات الذاكرة المؤقتة: {str(e)}'}), 500
+
 @admin_bp.route('/users', methods=['GET'])
 def get_all_users():
     try:
@@ -135,6 +140,102 @@ def get_all_users():
     except Exception as e:
         return jsonify({'error': f'خطأ في جلب المستخدمين: {str(e)}'}), 500
 
+# الحقول النصية في ملف استيراد المستخدمين
+USER_IMPORT_TEXT_FIELDS = ['email', 'name', 'user_type', 'phone', 'business_name', 'business_type', 'payment_method', 'payment_details']
+
+@admin_bp.route('/users/import', methods=['POST'])
+def import_users():
+    try:
+        auth_result, error_response, status_code = require_admin()
+        if error_response:
+            return error_response, status_code
+        
+        created_count = 0
+        errors = []
+        seen_emails = set()
+        
+        for chunk in chunked(iter_upload_rows()):
+            valid_rows = []
+            for line_number, row, error in chunk:
+                if not error:
+                    field = non_text_field(row, USER_IMPORT_TEXT_FIELDS)
+                    if field:
+                        error = f'حقل {field} يجب أن يكون نصاً'
+                if not error:
+                    try:
+                        fields, error = validate_registration(row)
+                    except (ValueError, TypeError, AttributeError):
+                        error = 'بيانات السطر غير صحيحة'
+                if not error and fields['user_type'] == 'admin':
+                    error = 'لا يمكن استيراد حسابات المديرين'
+                if not error and fields['email'] in seen_emails:
+                    error = 'البريد الإلكتروني مكرر في الملف'
+                
+                if error:
+                    errors.append({'row': line_number, 'email': (row or {}).get('email'), 'error': error})
+                    continue
+                
+                seen_emails.add(fields['email'])
+                valid_rows.append((line_number, fields, row))
+            
+            if not valid_rows:
+                continue
+            
+            # التحقق من البريد الإلكتروني للدفعة كاملة باستعلام واحد
+            existing_emails = {email for (email,) in db.session.query(User.email).filter(
+                User.email.in_([fields['email'] for _, fields, _ in valid_rows])
+            )}
+            
+            new_rows = []
+            for line_number, fields, row in valid_rows:
+                if fields['email'] in existing_emails:
+                    errors.append({'row': line_number, 'email': fields['email'], 'error': 'البريد الإلكتروني مستخدم بالفعل'})
+                else:
+                    new_rows.append((fields, row))
+            
+            if not new_rows:
+                continue
+            
+            now = datetime.utcnow()
+            db.session.execute(User.__table__.insert(), [{
+                'email': fields['email'],
+                'name': fields['name'],
+                'phone': fields['phone'],
+                'created_at': now
+            } for fields, _ in new_rows])
+            
+            user_ids = dict(db.session.query(User.email, User.id).filter(
+                User.email.in_([fields['email'] for fields, _ in new_rows])
+            ))
+            
+            profile_rows = []
+            for fields, row in new_rows:
+                profile_data = {
+                    'business_name': None,
+                    'business_type': None,
+                    'payment_method': None,
+                    'payment_details': None,
+                    'created_at': now
+                }
+                profile_data.update(build_profile_data(fields['user_type'], row))
+                profile_data['user_id'] = user_ids[fields['email']]
+                profile_rows.append(profile_data)
+            
+            db.session.execute(UserProfile.__table__.insert(), profile_rows)
+            db.session.commit()
+            created_count += len(new_rows)
+        
+        return jsonify({
+            'message': f'تم استيراد {created_count} مستخدم',
+            'created': created_count,
+            'failed': len(errors),
+            'errors': errors
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'خطأ في استيراد المستخدمين: {str(e)}'}), 500
+
 @admin_bp.route('/users/<int:user_id>/ban', methods=['PUT'])
 def ban_user(user_id):
     try:
@@ -163,6 +264,9 @@ def ban_user(user_id):
         
         db.session.add(notification)
         db.session.commit()
+        invalidate_auth_cache(user_id)
+        catalog_snapshot.refresh_merchant(user_id)
+        revoke_user_tokens(user_id)
         
         return jsonify({'message': 'تم حظر المستخدم بنجاح'}), 200
         
@@ -194,6 +298,7 @@ def unban_user(user_id):
         
         db.session.add(notification)
         db.session.commit()
+        invalidate_auth_cache(user_id)
         
         return jsonify({'message': 'تم إلغاء حظر المستخدم بنجاح'}), 200
         
@@ -213,6 +318,8 @@ def verify_user(user_id):
             return jsonify({'error': 'المستخدم غير موجود'}), 404
         
         profile.is_verified = True
+        if profile.user_type == UserType.MERCHANT:
+            refresh_merchant_scores(user_id)
         
         # إرسال إشعار للمستخدم
         notification = Notification(
@@ -225,6 +332,9 @@ def verify_user(user_id):
         
         db.session.add(notification)
         db.session.commit()
+        invalidate_auth_cache(user_id)
+        catalog_snapshot.refresh_merchant(user_id)
+        invalidate_merchant_products(user_id)
         
         return jsonify({'message': 'تم توثيق المستخدم بنجاح'}), 200
         
@@ -255,6 +365,7 @@ def update_user_subscription(user_id):
         if status == 'active':
             expiry_days = data.get('expiry_days', 30)
             profile.subscription_expiry = datetime.utcnow() + timedelta(days=expiry_days)
+            profile.expiry_reminder_sent_at = None
         
         # إرسال إشعار للمستخدم
         status_messages = {
@@ -274,6 +385,9 @@ def update_user_subscription(user_id):
         
         db.session.add(notification)
         db.session.commit()
+        invalidate_auth_cache(user_id)
+        catalog_snapshot.refresh_merchant(user_id)
+        revoke_user_tokens(user_id, include_refresh=False)
         
         return jsonify({'message': 'تم تحديث حالة الاشتراك بنجاح'}), 200
         
@@ -356,13 +470,18 @@ def get_all_orders():
         per_page = request.args.get('per_page', 20, type=int)
         status = request.args.get('status')
         
-        # بناء الاستعلام
-        query = db.session.query(Order, Product, UserProfile, UserProfile).join(
+        # بناء الاستعلام مع أسماء التاجر والمسوق دون استعلامات إضافية لكل صف
+        merchant = aliased(User)
+        merchant_profile = aliased(UserProfile)
+        marketer = aliased(User)
+        query = db.session.query(Order, Product, merchant, merchant_profile, marketer).join(
             Product, Order.product_id == Product.id
         ).join(
-            UserProfile, Order.merchant_id == UserProfile.user_id
+            merchant, Order.merchant_id == merchant.id
+        ).join(
+            merchant_profile, Order.merchant_id == merchant_profile.user_id
         ).join(
-            UserProfile, Order.marketer_id == UserProfile.user_id
+            marketer, Order.marketer_id == marketer.id
         )
         
         # تصفية حسب الحالة
@@ -375,10 +494,7 @@ def get_all_orders():
         )
         
         orders_data = []
-        for order, product, merchant_profile, marketer_profile in orders.items:
-            merchant = User.query.get(merchant_profile.user_id)
-            marketer = User.query.get(marketer_profile.user_id)
-            
+        for order, product, merchant, merchant_profile, marketer in orders.items:
             orders_data.append({
                 'id': order.id,
                 'product': {
@@ -419,6 +535,31 @@ def get_all_orders():
     except Exception as e:
         return jsonify({'error': f'خطأ في جلب الطلبات: {str(e)}'}), 500
 
+@admin_bp.route('/orders/export', methods=['GET'])
+def export_all_orders():
+    try:
+        auth_result, error_response, status_code = require_admin()
+        if error_response:
+            return error_response, status_code
+        
+        try:
+            query = apply_order_filters(order_export_query())
+        except ValueError:
+            return jsonify({'error': 'معايير التصفية غير صحيحة'}), 400
+        
+        # تصفية إضافية حسب التاجر أو المسوق
+        merchant_id = request.args.get('merchant_id', type=int)
+        marketer_id = request.args.get('marketer_id', type=int)
+        if merchant_id:
+            query = query.filter(Order.merchant_id == merchant_id)
+        if marketer_id:
+            query = query.filter(Order.marketer_id == marketer_id)
+        
+        return export_orders_response(query)
+        
+    except Exception as e:
+        return jsonify({'error': f'خطأ في تصدير الطلبات: {str(e)}'}), 500
+
 @admin_bp.route('/broadcast', methods=['POST'])
 def broadcast_notification():
     try:
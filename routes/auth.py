@@ -1,5 +1,9 @@
 from flask import Blueprint, request, jsonify, session
 from src.models.user import db, User, UserProfile, UserType, SubscriptionStatus
+from src.utils.auth_context import invalidate_auth_cache
+from src.utils.tokens import issue_tokens, verify_refresh_token, TokenError
+from src.utils.catalog import catalog_snapshot, invalidate_merchant_products
+from src.utils import invalidation
 from werkzeug.security import generate_password_hash, check_password_hash
 import re
 
@@ -14,34 +18,65 @@ def validate_phone(phone):
     pattern = r'^(07[3-9]|075)\d{8}$'
     return re.match(pattern, phone) is not None
 
+def validate_registration(data):
+    # التحقق من البيانات المطلوبة
+    required_fields = ['email', 'name', 'user_type']
+    for field in required_fields:
+        if field not in data or not data[field]:
+            return None, f'حقل {field} مطلوب'
+    
+    email = data['email'].lower().strip()
+    name = data['name'].strip()
+    user_type = data['user_type']
+    phone = (data.get('phone') or '').strip()
+    
+    # التحقق من صحة البيانات
+    if not validate_email(email):
+        return None, 'البريد الإلكتروني غير صحيح'
+    
+    if len(name) < 2:
+        return None, 'الاسم يجب أن يكون أكثر من حرفين'
+    
+    if user_type not in ['merchant', 'marketer', 'admin']:
+        return None, 'نوع المستخدم غير صحيح'
+    
+    if phone and not validate_phone(phone):
+        return None, 'رقم الهاتف غير صحيح'
+    
+    return {'email': email, 'name': name, 'user_type': user_type, 'phone': phone}, None
+
+def build_profile_data(user_type, data):
+    profile_data = {
+        'user_type': UserType(user_type),
+        'is_verified': user_type == 'admin',
+        'subscription_status': SubscriptionStatus.ACTIVE if user_type == 'admin' else SubscriptionStatus.INACTIVE
+    }
+    
+    # إضافة البيانات الإضافية للتاجر
+    if user_type == 'merchant':
+        profile_data['business_name'] = (data.get('business_name') or '').strip()
+        profile_data['business_type'] = (data.get('business_type') or '').strip()
+    
+    # إضافة بيانات الدفع للمسوق
+    elif user_type == 'marketer':
+        profile_data['payment_method'] = (data.get('payment_method') or '').strip()
+        profile_data['payment_details'] = (data.get('payment_details') or '').strip()
+    
+    return profile_data
+
 @auth_bp.route('/register', methods=['POST'])
 def register():
     try:
         data = request.get_json()
         
-        # التحقق من البيانات المطلوبة
-        required_fields = ['email', 'name', 'user_type']
-        for field in required_fields:
-            if field not in data or not data[field]:
-                return jsonify({'error': f'حقل {field} مطلوب'}), 400
-        
-        email = data['email'].lower().strip()
-        name = data['name'].strip()
-        user_type = data['user_type']
-        phone = data.get('phone', '').strip()
-        
-        # التحقق من صحة البيانات
-        if not validate_email(email):
-            return jsonify({'error': 'البريد الإلكتروني غير صحيح'}), 400
-        
-        if len(name) < 2:
-            return jsonify({'error': 'الاسم يجب أن يكون أكثر من حرفين'}), 400
+        fields, error = validate_registration(data)
+        if error:
+            return jsonify({'error': error}), 400
         
-        if user_type not in ['merchant', 'marketer', 'admin']:
-            return jsonify({'error': 'نوع المستخدم غير صحيح'}), 400
-        
-        if phone and not validate_phone(phone):
-            return jsonify({'error': 'رقم الهاتف غير صحيح'}), 400
+        email = fields['email']
+        name = fields['name']
+        user_type = fields['user_type']
+        phone = fields['phone']
         
         # التحقق من عدم وجود المستخدم
         existing_user = User.query.filter_by(email=email).first()
@@ -59,22 +94,8 @@ def register():
         db.session.flush()  # للحصول على معرف المستخدم
         
         # إنشاء الملف الشخصي
-        profile_data = {
-            'user_id': user.id,
-            'user_type': UserType(user_type),
-            'is_verified': user_type == 'admin',
-            'subscription_status': SubscriptionStatus.ACTIVE if user_type == 'admin' else SubscriptionStatus.INACTIVE
-        }
-        
-        # إضافة البيانات الإضافية للتاجر
-        if user_type == 'merchant':
-            profile_data['business_name'] = data.get('business_name', '').strip()
-            profile_data['business_type'] = data.get('business_type', '').strip()
-        
-        # إضافة بيانات الدفع للمسوق
-        elif user_type == 'marketer':
-            profile_data['payment_method'] = data.get('payment_method', '').strip()
-            profile_data['payment_details'] = data.get('payment_details', '').strip()
+        profile_data = build_profile_data(user_type, data)
+        profile_data['user_id'] = user.id
         
         profile = UserProfile(**profile_data)
         db.session.add(profile)
@@ -94,7 +115,8 @@ def register():
                 'user_type': user_type,
                 'is_verified': profile.is_verified,
                 'subscription_status': profile.subscription_status.value
-            }
+            },
+            'tokens': issue_tokens(user, profile)
         }), 201
         
     except Exception as e:
@@ -139,12 +161,45 @@ def login():
                 'business_type': profile.business_type,
                 'payment_method': profile.payment_method,
                 'payment_details': profile.payment_details
-            }
+            },
+            'tokens': issue_tokens(user, profile)
         }), 200
         
     except Exception as e:
         return jsonify({'error': f'خطأ في تسجيل الدخول: {str(e)}'}), 500
 
+@auth_bp.route('/refresh', methods=['POST'])
+def refresh_tokens():
+    try:
+        data = request.get_json() or {}
+        
+        refresh_token = data.get('refresh_token', '').strip()
+        if not refresh_token:
+            return jsonify({'error': 'رمز التجديد مطلوب'}), 400
+        
+        # رموز ألغتها عملية أخرى
+        invalidation.sync()
+        try:
+            claims = verify_refresh_token(refresh_token)
+        except TokenError as e:
+            return jsonify({'error': str(e)}), 401
+        
+        # إعادة قراءة الصلاحيات من قاعدة البيانات عند كل تجديد
+        row = db.session.query(User, UserProfile).join(
+            UserProfile, UserProfile.user_id == User.id
+        ).filter(User.id == claims['uid']).first()
+        if not row:
+            return jsonify({'error': 'المستخدم غير موجود'}), 404
+        
+        user, profile = row
+        if profile.is_banned:
+            return jsonify({'error': 'الحساب محظور'}), 403
+        
+        return jsonify({'tokens': issue_tokens(user, profile)}), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'خطأ في تجديد الرمز: {str(e)}'}), 500
+
 @auth_bp.route('/logout', methods=['POST'])
 def logout():
     session.pop('user_id', None)
@@ -223,6 +278,10 @@ def update_profile():
                 profile.payment_details = data['payment_details'].strip()
         
         db.session.commit()
+        invalidate_auth_cache(user_id)
+        if profile.user_type == UserType.MERCHANT:
+            catalog_snapshot.refresh_merchant(user_id)
+            invalidate_merchant_products(user_id)
         
         return jsonify({'message': 'تم تحديث الملف الشخصي بنجاح'}), 200
         
@@ -0,0 +1,132 @@
+from flask import Blueprint, request, jsonify
+from sqlalchemy.exc import IntegrityError
+from src.models.user import db, User, UserProfile, MerchantFollow, UserType
+from src.utils.auth_context import require_auth
+from src.utils.pagination import get_page_size, decode_cursor, next_cursor, CursorError
+from src.utils.catalog import serialize_catalog_product
+from src.utils import feed
+
+follows_bp = Blueprint('follows', __name__)
+
+@follows_bp.route('/merchants/<int:merchant_id>', methods=['POST'])
+def follow_merchant(merchant_id):
+    try:
+        auth_result, error_response, status_code = require_auth()
+        if error_response:
+            return error_response, status_code
+        
+        user = auth_result['user']
+        profile = auth_result['profile']
+        
+        if profile.user_type != UserType.MARKETER:
+            return jsonify({'error': 'هذه الخدمة للمسوقين فقط'}), 403
+        
+        merchant_profile = UserProfile.query.filter_by(user_id=merchant_id).first()
+        if not merchant_profile or merchant_profile.user_type != UserType.MERCHANT:
+            return jsonify({'error': 'التاجر غير موجود'}), 404
+        
+        if MerchantFollow.query.filter_by(marketer_id=user.id, merchant_id=merchant_id).first():
+            return jsonify({'message': 'أنت تتابع هذا التاجر بالفعل'}), 200
+        
+        db.session.add(MerchantFollow(marketer_id=user.id, merchant_id=merchant_id))
+        feed.count_follower(merchant_id, 1)
+        
+        # إضافة آخر منتجات التاجر إلى الخط الزمني
+        feed.backfill_follow(user.id, merchant_id)
+        db.session.commit()
+        
+        return jsonify({'message': 'تمت متابعة التاجر بنجاح'}), 201
+        
+    except IntegrityError:
+        # متابعة مماثلة حُفظت في نفس اللحظة
+        db.session.rollback()
+        return jsonify({'message': 'أنت تتابع هذا التاجر بالفعل'}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'خطأ في متابعة التاجر: {str(e)}'}), 500
+
+@follows_bp.route('/merchants/<int:merchant_id>', methods=['DELETE'])
+def unfollow_merchant(merchant_id):
+    try:
+        auth_result, error_response, status_code = require_auth()
+        if error_response:
+            return error_response, status_code
+        
+        user = auth_result['user']
+        
+        follow = MerchantFollow.query.filter_by(marketer_id=user.id, merchant_id=merchant_id).first()
+        if not follow:
+            return jsonify({'error': 'أنت لا تتابع هذا التاجر'}), 404
+        
+        db.session.delete(follow)
+        feed.count_follower(merchant_id, -1)
+        feed.remove_follow(user.id, merchant_id)
+        db.session.commit()
+        
+        return jsonify({'message': 'تم إلغاء متابعة التاجر بنجاح'}), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'خطأ في إلغاء متابعة التاجر: {str(e)}'}), 500
+
+@follows_bp.route('/merchants', methods=['GET'])
+def get_followed_merchants():
+    try:
+        auth_result, error_response, status_code = require_auth()
+        if error_response:
+            return error_response, status_code
+        
+        user = auth_result['user']
+        
+        merchants = db.session.query(User, UserProfile, MerchantFollow.created_at).join(
+            MerchantFollow, MerchantFollow.merchant_id == User.id
+        ).join(
+            UserProfile, UserProfile.user_id == User.id
+        ).filter(MerchantFollow.marketer_id == user.id).order_by(MerchantFollow.created_at.desc()).all()
+        
+        merchants_data = []
+        for merchant, merchant_profile, followed_at in merchants:
+            merchants_data.append({
+                'id': merchant.id,
+                'name': merchant.name,
+                'business_name': merchant_profile.business_name,
+                'is_verified': merchant_profile.is_verified,
+                'completed_orders': merchant_profile.completed_orders,
+                'followed_at': followed_at.isoformat()
+            })
+        
+        return jsonify({'merchants': merchants_data}), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'خطأ في جلب التجار المتابعين: {str(e)}'}), 500
+
+@follows_bp.route('/feed', methods=['GET'])
+def get_feed():
+    try:
+        auth_result, error_response, status_code = require_auth()
+        if error_response:
+            return error_response, status_code
+        
+        user = auth_result['user']
+        profile = auth_result['profile']
+        
+        if profile.user_type != UserType.MARKETER:
+            return jsonify({'error': 'هذه الخدمة للمسوقين فقط'}), 403
+        
+        limit = get_page_size()
+        cursor = request.args.get('cursor')
+        cursor_values = decode_cursor(cursor) if cursor else None
+        
+        products, has_more = feed.feed_page(user.id, cursor_values, limit)
+        
+        last_product = products[-1][0] if products else None
+        return jsonify({
+            'products': [serialize_catalog_product(product, merchant_profile) for product, merchant_profile in products],
+            'next_cursor': next_cursor(has_more, last_product.created_at, last_product.id) if last_product else None,
+            'has_more': has_more
+        }), 200
+        
+    except CursorError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'خطأ في جلب منتجات التجار المتابعين: {str(e)}'}), 500
@@ -1,24 +1,12 @@
 from flask import Blueprint, request, jsonify, session
 from src.models.user import db, User, UserProfile, Notification, Order, Product
+from src.utils.auth_context import require_auth
+from src.utils.pagination import get_page_size, keyset_page, next_cursor, CursorError
+from src.utils.notifications import get_unread_counter
 from sqlalchemy import and_
 
 notifications_bp = Blueprint('notifications', __name__)
 
-def require_auth():
-    user_id = session.get('user_id')
-    if not user_id:
-        return None, jsonify({'error': 'غير مسجل الدخول'}), 401
-    
-    user = User.query.get(user_id)
-    if not user:
-        return None, jsonify({'error': 'المستخدم غير موجود'}), 404
-    
-    profile = UserProfile.query.filter_by(user_id=user_id).first()
-    if not profile:
-        return None, jsonify({'error': 'الملف الشخصي غير موجود'}), 404
-    
-    return {'user': user, 'profile': profile}, None, None
-
 @notifications_bp.route('/', methods=['GET'])
 def get_notifications():
     try:
@@ -28,17 +16,25 @@ def get_notifications():
         
         user = auth_result['user']
         
-        # جلب الإشعارات مع معلومات الطلب المرتبط إن وجد
-        notifications = db.session.query(Notification).outerjoin(
+        # جلب الإشعارات مع معلومات الطلب المرتبط والمنتج باستعلام واحد
+        query = db.session.query(
+            Notification,
+            Order.id, Order.customer_name, Order.status, Order.payment_status,
+            Product.name
+        ).outerjoin(
             Order, Notification.related_order_id == Order.id
         ).outerjoin(
             Product, Order.product_id == Product.id
-        ).filter(Notification.user_id == user.id).order_by(
-            Notification.created_at.desc()
-        ).all()
+        ).filter(Notification.user_id == user.id)
+        
+        # إظهار غير المقروءة فقط
+        if request.args.get('unread_only', '').lower() in ('1', 'true'):
+            query = query.filter(Notification.is_read == False)
+        
+        rows, has_more = keyset_page(query, Notification.created_at, Notification.id, get_page_size())
         
         notifications_data = []
-        for notification in notifications:
+        for notification, order_id, customer_name, order_status, payment_status, product_name in rows:
             notification_data = {
                 'id': notification.id,
                 'title': notification.title,
@@ -50,22 +46,26 @@ def get_notifications():
             }
             
             # إضافة معلومات الطلب المرتبط إن وجد
-            if notification.related_order_id:
-                order = Order.query.get(notification.related_order_id)
-                if order:
-                    product = Product.query.get(order.product_id)
-                    notification_data['related_order'] = {
-                        'id': order.id,
-                        'product_name': product.name if product else 'منتج محذوف',
-                        'customer_name': order.customer_name,
-                        'status': order.status.value,
-                        'payment_status': order.payment_status.value
-                    }
+            if order_id:
+                notification_data['related_order'] = {
+                    'id': order_id,
+                    'product_name': product_name or 'منتج محذوف',
+                    'customer_name': customer_name,
+                    'status': order_status.value,
+                    'payment_status': payment_status.value
+                }
             
             notifications_data.append(notification_data)
         
-        return jsonify({'notifications': notifications_data}), 200
+        last_notification = rows[-1][0] if rows else None
+        return jsonify({
+            'notifications': notifications_data,
+            'next_cursor': next_cursor(has_more, last_notification.created_at, last_notification.id) if last_notification else None,
+            'has_more': has_more
+        }), 200
         
+    except CursorError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': f'خطأ في جلب الإشعارات: {str(e)}'}), 500
 
@@ -78,11 +78,8 @@ def get_unread_count():
         
         user = auth_result['user']
         
-        unread_count = Notification.query.filter(
-            and_(Notification.user_id == user.id, Notification.is_read == False)
-        ).count()
-        
-        return jsonify({'unread_count': unread_count}), 200
+        # العداد يُحدَّث مع كل تغيير على الإشعارات فيكفي قراءته بالمفتاح الأساسي
+        return jsonify({'unread_count': get_unread_counter(user.id)}), 200
         
     except Exception as e:
         return jsonify({'error': f'خطأ في جلب عدد الإشعارات غير المقروءة: {str(e)}'}), 500
@@ -112,6 +109,50 @@ def mark_notification_read(notification_id):
         db.session.rollback()
         return jsonify({'error': f'خطأ في تحديث الإشعار: {str(e)}'}), 500
 
+# الحد الأقصى لعدد الإشعارات في التحديد الجماعي
+MARK_READ_MAX_IDS = 500
+
+@notifications_bp.route('/mark-read', methods=['PUT'])
+def mark_notifications_read():
+    try:
+        auth_result, error_response, status_code = require_auth()
+        if error_response:
+            return error_response, status_code
+        
+        user = auth_result['user']
+        
+        data = request.get_json() or {}
+        notification_ids = data.get('ids')
+        
+        if not isinstance(notification_ids, list) or not notification_ids:
+            return jsonify({'error': 'قائمة الإشعارات مطلوبة'}), 400
+        
+        if len(notification_ids) > MARK_READ_MAX_IDS:
+            return jsonify({'error': f'الحد الأقصى {MARK_READ_MAX_IDS} إشعار في المرة الواحدة'}), 400
+        
+        notification_ids = [int(notification_id) for notification_id in notification_ids]
+        
+        # تحديث إشعارات المستخدم فقط بجملة واحدة، وإشعارات غيره تُتجاهل
+        updated = Notification.query.filter(
+            Notification.user_id == user.id,
+            Notification.id.in_(notification_ids),
+            Notification.is_read == False
+        ).update({'is_read': True}, synchronize_session=False)
+        db.session.commit()
+        
+        return jsonify({
+            'message': 'تم تحديد الإشعارات كمقروءة',
+            'updated': updated,
+            'unread_count': get_unread_counter(user.id)
+        }), 200
+        
+    except (ValueError, TypeError):
+        db.session.rollback()
+        return jsonify({'error': 'البيانات المدخلة غير صحيحة'}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'خطأ في تحديث الإشعارات: {str(e)}'}), 500
+
 @notifications_bp.route('/mark-all-read', methods=['PUT'])
 def mark_all_notifications_read():
     try:
@@ -1,24 +1,127 @@
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, request, jsonify
 from src.models.user import db, User, UserProfile, Product, Order, Notification, UserType, OrderStatus, PaymentStatus, NotificationType, SubscriptionStatus
-from datetime import datetime, timedelta
-from sqlalchemy import and_, or_
+from src.utils.auth_context import require_auth
+from src.utils.catalog import catalog_snapshot, invalidate_merchant_products
+from src.utils.ranking import queue_product_scores
+from src.utils.pagination import get_page_size, keyset_page, next_cursor, CursorError
+from src.utils.order_stats import get_order_stats, get_marketer_debts
+from src.utils.order_flow import record_order_changes, order_change, can_change_status, can_change_payment, sources_for_status, add_completed_orders
+from src.utils.notifications import bulk_insert_notifications
+from src.utils.export import export_response, iter_keyset_chunks
+from src.utils.reputation import get_reputation, get_reputations
+from src.utils.payments import remove_from_batch_totals
+from datetime import datetime, date, timedelta
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
 
 orders_bp = Blueprint('orders', __name__)
 
-def require_auth():
-    user_id = session.get('user_id')
-    if not user_id:
-        return None, jsonify({'error': 'غير مسجل الدخول'}), 401
+# الحالات التي يمكن للتاجر نقل الطلب إليها، مع نص الإشعار المرسل للمسوق
+STATUS_MESSAGES = {
+    'in_progress': 'قيد التنفيذ',
+    'completed': 'تم التوصيل',
+    'rejected': 'مرفوض',
+    'not_serious': 'غير جدي'
+}
+
+# الحد الأقصى لعدد الطلبات في التحديث الجماعي
+BULK_STATUS_MAX_ORDERS = 500
+
+# الحد الأقصى لعدد الطلبات في الدفعة الواحدة
+BATCH_ORDER_MAX = 200
+
+IDEMPOTENCY_KEY_MAX_LENGTH = 100
+
+def validate_order_data(data):
+    # التحقق من بيانات طلب واحد، وإرجاع (الحقول، رسالة الخطأ)
+    required_fields = ['product_id', 'customer_name', 'customer_phone', 'sale_price', 'quantity']
+    for field in required_fields:
+        if field not in data or not data[field]:
+            return None, f'حقل {field} مطلوب'
+    
+    fields = {
+        'product_id': int(data['product_id']),
+        'customer_name': data['customer_name'].strip(),
+        'customer_phone': data['customer_phone'].strip(),
+        'sale_price': float(data['sale_price']),
+        'quantity': int(data['quantity'])
+    }
+    
+    if fields['quantity'] <= 0:
+        return None, 'الكمية يجب أن تكون أكبر من صفر'
+    
+    if fields['sale_price'] <= 0:
+        return None, 'سعر البيع يجب أن يكون أكبر من صفر'
+    
+    return fields, None
+
+def calculate_marketer_profit(product, sale_price, quantity):
+    # حساب ربح المسوق والتحقق من أنه لا يقل عن الحد الأدنى
+    total_sale_price = sale_price * quantity
+    total_base_price = product.base_price * quantity
+    marketer_profit = total_sale_price - total_base_price
+    
+    min_total_profit = product.min_marketer_profit * quantity
+    if marketer_profit < min_total_profit:
+        return None, f'الربح يجب أن لا يقل عن {min_total_profit} دينار'
     
-    user = User.query.get(user_id)
-    if not user:
-        return None, jsonify({'error': 'المستخدم غير موجود'}), 404
+    return marketer_profit, None
+
+def get_idempotency_key(data):
+    key = request.headers.get('Idempotency-Key') or data.get('idempotency_key')
+    if key is None:
+        return None
+    key = str(key).strip()
+    if not key or len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise ValueError('مفتاح عدم التكرار غير صالح')
+    return key
+
+def build_order(fields, product, marketer_id, marketer_profit, idempotency_key):
+    return Order(
+        product_id=product.id,
+        merchant_id=product.merchant_id,
+        marketer_id=marketer_id,
+        customer_name=fields['customer_name'],
+        customer_phone=fields['customer_phone'],
+        sale_price=fields['sale_price'],
+        quantity=fields['quantity'],
+        marketer_profit=marketer_profit,
+        status=OrderStatus.PENDING,
+        payment_status=PaymentStatus.PENDING,
+        idempotency_key=idempotency_key
+    )
+
+def new_order_notification(order, product_name):
+    return {
+        'user_id': order.merchant_id,
+        'title': 'طلب جديد',
+        'message': f'لديك طلب جديد على منتج: {product_name}',
+        'type': NotificationType.NEW_ORDER,
+        'is_read': False,
+        'related_order_id': order.id
+    }
+
+def transition_error(current, new):
+    return f'لا يمكن نقل الطلب من الحالة {current.value} إلى {new.value}'
+
+def status_update_values(new_status):
+    now = datetime.utcnow()
+    values = {Order.status: new_status, Order.updated_at: now}
     
-    profile = UserProfile.query.filter_by(user_id=user_id).first()
-    if not profile:
-        return None, jsonify({'error': 'الملف الشخصي غير موجود'}), 404
+    # إذا تم إكمال الطلب، تحديد تاريخ التوصيل وموعد الدفع
+    if new_status == OrderStatus.COMPLETED:
+        values[Order.delivery_date] = now
+        values[Order.payment_due_date] = now + timedelta(days=5)  # 5 أيام عمل
     
-    return {'user': user, 'profile': profile}, None, None
+    return values
+
+def find_orders_by_keys(marketer_id, keys):
+    if not keys:
+        return {}
+    rows = db.session.query(Order.idempotency_key, Order.id).filter(
+        Order.marketer_id == marketer_id, Order.idempotency_key.in_(keys)
+    )
+    return {key: order_id for key, order_id in rows}
 
 @orders_bp.route('/create', methods=['POST'])
 def create_order():
@@ -38,28 +141,23 @@ def create_order():
             return jsonify({'error': 'يجب تفعيل الاشتراك أولاً'}), 403
         
         data = request.get_json()
+        idempotency_key = get_idempotency_key(data)
         
-        # التحقق من البيانات المطلوبة
-        required_fields = ['product_id', 'customer_name', 'customer_phone', 'sale_price', 'quantity']
-        for field in required_fields:
-            if field not in data or not data[field]:
-                return jsonify({'error': f'حقل {field} مطلوب'}), 400
-        
-        product_id = int(data['product_id'])
-        customer_name = data['customer_name'].strip()
-        customer_phone = data['customer_phone'].strip()
-        sale_price = float(data['sale_price'])
-        quantity = int(data['quantity'])
+        # إعادة إرسال نفس الطلب تُرجع النتيجة الأصلية دون إنشاء طلب جديد
+        existing = find_orders_by_keys(user.id, [idempotency_key] if idempotency_key else [])
+        if existing:
+            return jsonify({
+                'message': 'تم إنشاء الطلب بنجاح',
+                'order_id': existing[idempotency_key]
+            }), 201
         
-        # التحقق من صحة البيانات
-        if quantity <= 0:
-            return jsonify({'error': 'الكمية يجب أن تكون أكبر من صفر'}), 400
-        
-        if sale_price <= 0:
-            return jsonify({'error': 'سعر البيع يجب أن يكون أكبر من صفر'}), 400
+        # التحقق من البيانات المطلوبة
+        fields, error = validate_order_data(data)
+        if error:
+            return jsonify({'error': error}), 400
         
         # الحصول على المنتج
-        product = Product.query.get(product_id)
+        product = Product.query.get(fields['product_id'])
         if not product:
             return jsonify({'error': 'المنتج غير موجود'}), 404
         
@@ -67,56 +165,283 @@ def create_order():
             return jsonify({'error': 'المنتج غير مفعل'}), 400
         
         # حساب ربح المسوق
-        total_sale_price = sale_price * quantity
-        total_base_price = product.base_price * quantity
-        marketer_profit = total_sale_price - total_base_price
+        marketer_profit, error = calculate_marketer_profit(product, fields['sale_price'], fields['quantity'])
+        if error:
+            return jsonify({'error': error}), 400
         
-        # التحقق من أن الربح لا يقل عن الحد الأدنى
-        min_total_profit = product.min_marketer_profit * quantity
-        if marketer_profit < min_total_profit:
-            return jsonify({'error': f'الربح يجب أن لا يقل عن {min_total_profit} دينار'}), 400
+        # سجل الزبون قبل هذا الطلب لتنبيه المسوق إلى الأرقام الخطرة
+        customer_reputation = get_reputation(fields['customer_phone'])
         
         # إنشاء الطلب
-        order = Order(
-            product_id=product_id,
-            merchant_id=product.merchant_id,
-            marketer_id=user.id,
-            customer_name=customer_name,
-            customer_phone=customer_phone,
-            sale_price=sale_price,
-            quantity=quantity,
-            marketer_profit=marketer_profit,
-            status=OrderStatus.PENDING,
-            payment_status=PaymentStatus.PENDING
-        )
+        order = build_order(fields, product, user.id, marketer_profit, idempotency_key)
         
         db.session.add(order)
         db.session.flush()  # للحصول على معرف الطلب
+        record_order_changes([order_change(order, None, None)], user.id)
         
         # إرسال إشعار للتاجر
-        notification = Notification(
-            user_id=product.merchant_id,
-            title='طلب جديد',
-            message=f'لديك طلب جديد على منتج: {product.name}',
-            type=NotificationType.NEW_ORDER,
-            is_read=False,
-            related_order_id=order.id
-        )
-        
-        db.session.add(notification)
+        db.session.add(Notification(**new_order_notification(order, product.name)))
         db.session.commit()
         
         return jsonify({
             'message': 'تم إنشاء الطلب بنجاح',
-            'order_id': order.id
+            'order_id': order.id,
+            'customer_reputation': customer_reputation
         }), 201
         
+    except IntegrityError:
+        # طلب مماثل بنفس المفتاح حُفظ في نفس اللحظة
+        db.session.rollback()
+        existing = find_orders_by_keys(user.id, [idempotency_key])
+        if not existing:
+            return jsonify({'error': 'خطأ في إنشاء الطلب'}), 500
+        return jsonify({
+            'message': 'تم إنشاء الطلب بنجاح',
+            'order_id': existing[idempotency_key]
+        }), 201
     except ValueError as e:
         return jsonify({'error': 'البيانات المدخلة غير صحيحة'}), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': f'خطأ في إنشاء الطلب: {str(e)}'}), 500
 
+@orders_bp.route('/batch', methods=['POST'])
+def create_orders_batch():
+    try:
+        auth_result, error_response, status_code = require_auth()
+        if error_response:
+            return error_response, status_code
+        
+        user = auth_result['user']
+        profile = auth_result['profile']
+        
+        if profile.user_type != UserType.MARKETER:
+            return jsonify({'error': 'هذه الخدمة للمسوقين فقط'}), 403
+        
+        if profile.subscription_status != SubscriptionStatus.ACTIVE:
+            return jsonify({'error': 'يجب تفعيل الاشتراك أولاً'}), 403
+        
+        data = request.get_json() or {}
+        lines = data.get('orders')
+        if not isinstance(lines, list) or not lines:
+            return jsonify({'error': 'قائمة الطلبات مطلوبة'}), 400
+        
+        if len(lines) > BATCH_ORDER_MAX:
+            return jsonify({'error': f'الحد الأقصى {BATCH_ORDER_MAX} طلب في الدفعة الواحدة'}), 400
+        
+        # مفتاح كل سطر: مفتاحه الخاص إن وجد، وإلا مفتاح الدفعة مع رقم السطر
+        batch_key = get_idempotency_key(data)
+        keys = []
+        for index, line in enumerate(lines):
+            if not isinstance(line, dict):
+                keys.append(None)
+                continue
+            key = line.get('idempotency_key')
+            if key is None and batch_key:
+                key = f'{batch_key}:{index}'
+            key = str(key).strip() if key is not None else None
+            if key is not None and (not key or len(key) > IDEMPOTENCY_KEY_MAX_LENGTH):
+                raise ValueError('مفتاح عدم التكرار غير صالح')
+            keys.append(key)
+        
+        existing = find_orders_by_keys(user.id, [key for key in keys if key])
+        
+        # جلب كل المنتجات المطلوبة باستعلام واحد
+        product_ids = set()
+        for line in lines:
+            try:
+                product_ids.add(int(line['product_id']))
+            except (KeyError, TypeError, ValueError):
+                pass
+        products = {product.id: product for product in Product.query.filter(Product.id.in_(product_ids))} if product_ids else {}
+        
+        results = [None] * len(lines)
+        new_orders = []
+        for index, (line, key) in enumerate(zip(lines, keys)):
+            if key in existing:
+                results[index] = {'index': index, 'order_id': existing[key], 'status': 'duplicate'}
+                continue
+            
+            if not isinstance(line, dict):
+                results[index] = {'index': index, 'error': 'البيانات المدخلة غير صحيحة'}
+                continue
+            
+            try:
+                fields, error = validate_order_data(line)
+            except (ValueError, TypeError, AttributeError):
+                fields, error = None, 'البيانات المدخلة غير صحيحة'
+            if error:
+                results[index] = {'index': index, 'error': error}
+                continue
+            
+            product = products.get(fields['product_id'])
+            if not product:
+                results[index] = {'index': index, 'error': 'المنتج غير موجود'}
+                continue
+            
+            if not product.is_active:
+                results[index] = {'index': index, 'error': 'المنتج غير مفعل'}
+                continue
+            
+            marketer_profit, error = calculate_marketer_profit(product, fields['sale_price'], fields['quantity'])
+            if error:
+                results[index] = {'index': index, 'error': error}
+                continue
+            
+            order = build_order(fields, product, user.id, marketer_profit, key)
+            new_orders.append((index, order, product))
+            if key:
+                # تكرار نفس المفتاح داخل الدفعة يُنشئ طلباً واحداً فقط
+                existing[key] = order
+        
+        if new_orders:
+            reputations = get_reputations({order.customer_phone for _, order, _ in new_orders})
+            
+            # إدراج الطلبات دفعة واحدة ثم إشعاراتها
+            db.session.add_all([order for _, order, _ in new_orders])
+            db.session.flush()
+            
+            bulk_insert_notifications([new_order_notification(order, product.name) for _, order, product in new_orders])
+            record_order_changes([order_change(order, None, None) for _, order, _ in new_orders], user.id)
+            
+            for index, order, _ in new_orders:
+                results[index] = {
+                    'index': index, 'order_id': order.id, 'status': 'created',
+                    'customer_reputation': reputations[order.customer_phone]
+                }
+            
+            # الأسطر المكررة داخل نفس الدفعة تشير إلى الطلب الذي أُنشئ للتو
+            for result in results:
+                if isinstance(result.get('order_id'), Order):
+                    result['order_id'] = result['order_id'].id
+            
+            db.session.commit()
+        
+        return jsonify({
+            'message': 'تمت معالجة الطلبات',
+            'created': sum(1 for result in results if result.get('status') == 'created'),
+            'results': results
+        }), 201
+        
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': 'دفعة بنفس المفتاح قيد المعالجة، أعد المحاولة لاحقاً'}), 409
+    except ValueError:
+        return jsonify({'error': 'البيانات المدخلة غير صحيحة'}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'خطأ في إنشاء الطلبات: {str(e)}'}), 500
+
+def apply_order_filters(query):
+    # التصفية حسب حالة الطلب وحالة الدفع والفترة الزمنية
+    status = request.args.get('status')
+    payment_status = request.args.get('payment_status')
+    date_from = request.args.get('date_from')
+    date_to = request.args.get('date_to')
+    
+    if status:
+        query = query.filter(Order.status == OrderStatus(status))
+    if payment_status:
+        query = query.filter(Order.payment_status == PaymentStatus(payment_status))
+    if date_from:
+        query = query.filter(Order.created_at >= datetime.fromisoformat(date_from))
+    if date_to:
+        query = query.filter(date_to_condition(date_to))
+    
+    return query
+
+def date_to_condition(date_to):
+    # التاريخ بلا وقت يشمل اليوم كاملاً، فالحد هو بداية اليوم التالي
+    try:
+        day = date.fromisoformat(date_to)
+    except ValueError:
+        return Order.created_at <= datetime.fromisoformat(date_to)
+    return Order.created_at < datetime.combine(day + timedelta(days=1), datetime.min.time())
+
+def serialize_order(order, product_id, product_name):
+    return {
+        'id': order.id,
+        'product': {
+            'id': product_id,
+            'name': product_name if product_id else 'منتج محذوف'
+        },
+        'customer_name': order.customer_name,
+        'customer_phone': order.customer_phone,
+        'sale_price': order.sale_price,
+        'quantity': order.quantity,
+        'marketer_profit': order.marketer_profit,
+        'status': order.status.value,
+        'payment_status': order.payment_status.value,
+        'delivery_date': order.delivery_date.isoformat() if order.delivery_date else None,
+        'payment_due_date': order.payment_due_date.isoformat() if order.payment_due_date else None,
+        'created_at': order.created_at.isoformat(),
+        'updated_at': order.updated_at.isoformat()
+    }
+
+# أعمدة ملف تصدير الطلبات بالترتيب
+ORDER_EXPORT_COLUMNS = [
+    'id', 'created_at', 'updated_at', 'status', 'payment_status',
+    'product_id', 'product_name', 'merchant_id', 'merchant_name', 'merchant_business_name',
+    'marketer_id', 'marketer_name', 'customer_name', 'customer_phone',
+    'sale_price', 'quantity', 'marketer_profit', 'delivery_date', 'payment_due_date'
+]
+
+def order_export_query():
+    # صف مسطح لكل طلب مع أسماء المنتج والتاجر والمسوق باستعلام واحد
+    merchant = aliased(User)
+    merchant_profile = aliased(UserProfile)
+    marketer = aliased(User)
+    return db.session.query(
+        Order.id, Order.created_at, Order.updated_at, Order.status, Order.payment_status,
+        Order.product_id, Product.name, Order.merchant_id, merchant.name, merchant_profile.business_name,
+        Order.marketer_id, marketer.name, Order.customer_name, Order.customer_phone,
+        Order.sale_price, Order.quantity, Order.marketer_profit, Order.delivery_date, Order.payment_due_date
+    ).outerjoin(
+        Product, Order.product_id == Product.id
+    ).outerjoin(
+        merchant, merchant.id == Order.merchant_id
+    ).outerjoin(
+        merchant_profile, merchant_profile.user_id == Order.merchant_id
+    ).outerjoin(
+        marketer, marketer.id == Order.marketer_id
+    )
+
+def export_orders_response(query):
+    fmt = request.args.get('format', 'csv').lower()
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({'error': 'صيغة التصدير غير مدعومة'}), 400
+    
+    filename = f"orders-{datetime.utcnow().strftime('%Y%m%d')}"
+    return export_response(filename, ORDER_EXPORT_COLUMNS, iter_keyset_chunks(query, Order.id), fmt)
+
+@orders_bp.route('/export', methods=['GET'])
+def export_orders():
+    try:
+        auth_result, error_response, status_code = require_auth()
+        if error_response:
+            return error_response, status_code
+        
+        user = auth_result['user']
+        profile = auth_result['profile']
+        
+        query = order_export_query()
+        if profile.user_type == UserType.MERCHANT:
+            query = query.filter(Order.merchant_id == user.id)
+        elif profile.user_type == UserType.MARKETER:
+            query = query.filter(Order.marketer_id == user.id)
+        else:
+            return jsonify({'error': 'هذه الخدمة للتجار والمسوقين فقط'}), 403
+        
+        try:
+            query = apply_order_filters(query)
+        except ValueError:
+            return jsonify({'error': 'معايير التصفية غير صحيحة'}), 400
+        
+        return export_orders_response(query)
+        
+    except Exception as e:
+        return jsonify({'error': f'خطأ في تصدير الطلبات: {str(e)}'}), 500
+
 @orders_bp.route('/marketer', methods=['GET'])
 def get_marketer_orders():
     try:
@@ -126,32 +451,25 @@ def get_marketer_orders():
         
         user = auth_result['user']
         
-        orders = Order.query.filter_by(marketer_id=user.id).order_by(Order.created_at.desc()).all()
+        # جلب الطلبات مع اسم المنتج باستعلام واحد
+        query = db.session.query(Order, Product.id, Product.name).outerjoin(
+            Product, Order.product_id == Product.id
+        ).filter(Order.marketer_id == user.id)
+        query = apply_order_filters(query)
         
-        orders_data = []
-        for order in orders:
-            product = Product.query.get(order.product_id)
-            orders_data.append({
-                'id': order.id,
-                'product': {
-                    'id': product.id if product else None,
-                    'name': product.name if product else 'منتج محذوف'
-                },
-                'customer_name': order.customer_name,
-                'customer_phone': order.customer_phone,
-                'sale_price': order.sale_price,
-                'quantity': order.quantity,
-                'marketer_profit': order.marketer_profit,
-                'status': order.status.value,
-                'payment_status': order.payment_status.value,
-                'delivery_date': order.delivery_date.isoformat() if order.delivery_date else None,
-                'payment_due_date': order.payment_due_date.isoformat() if order.payment_due_date else None,
-                'created_at': order.created_at.isoformat(),
-                'updated_at': order.updated_at.isoformat()
-            })
-        
-        return jsonify({'orders': orders_data}), 200
+        orders, has_more = keyset_page(query, Order.created_at, Order.id, get_page_size())
         
+        orders_data = [serialize_order(order, product_id, product_name) for order, product_id, product_name in orders]
+        
+        last_order = orders[-1][0] if orders else None
+        return jsonify({
+            'orders': orders_data,
+            'next_cursor': next_cursor(has_more, last_order.created_at, last_order.id) if last_order else None,
+            'has_more': has_more
+        }), 200
+        
+    except (ValueError, CursorError):
+        return jsonify({'error': 'معايير التصفية غير صحيحة'}), 400
     except Exception as e:
         return jsonify({'error': f'خطأ في جلب الطلبات: {str(e)}'}), 500
 
@@ -164,36 +482,38 @@ def get_merchant_orders():
         
         user = auth_result['user']
         
-        orders = Order.query.filter_by(merchant_id=user.id).order_by(Order.created_at.desc()).all()
+        # جلب الطلبات مع اسم المنتج وبيانات دفع المسوق باستعلام واحد
+        query = db.session.query(
+            Order, Product.id, Product.name, UserProfile.payment_method, UserProfile.payment_details
+        ).outerjoin(
+            Product, Order.product_id == Product.id
+        ).outerjoin(
+            UserProfile, UserProfile.user_id == Order.marketer_id
+        ).filter(Order.merchant_id == user.id)
+        query = apply_order_filters(query)
+        
+        orders, has_more = keyset_page(query, Order.created_at, Order.id, get_page_size())
+        
+        # سجل زبائن الصفحة باستعلام واحد بالمفتاح الأساسي
+        reputations = get_reputations({order.customer_phone for order, *_ in orders})
         
         orders_data = []
-        for order in orders:
-            product = Product.query.get(order.product_id)
-            marketer_profile = UserProfile.query.filter_by(user_id=order.marketer_id).first()
-            
-            orders_data.append({
-                'id': order.id,
-                'product': {
-                    'id': product.id if product else None,
-                    'name': product.name if product else 'منتج محذوف'
-                },
-                'customer_name': order.customer_name,
-                'customer_phone': order.customer_phone,
-                'sale_price': order.sale_price,
-                'quantity': order.quantity,
-                'marketer_profit': order.marketer_profit,
-                'status': order.status.value,
-                'payment_status': order.payment_status.value,
-                'marketer_payment_method': marketer_profile.payment_method if marketer_profile else None,
-                'marketer_payment_details': marketer_profile.payment_details if marketer_profile else None,
-                'delivery_date': order.delivery_date.isoformat() if order.delivery_date else None,
-                'payment_due_date': order.payment_due_date.isoformat() if order.payment_due_date else None,
-                'created_at': order.created_at.isoformat(),
-                'updated_at': order.updated_at.isoformat()
-            })
-        
-        return jsonify({'orders': orders_data}), 200
+        for order, product_id, product_name, payment_method, payment_details in orders:
+            order_data = serialize_order(order, product_id, product_name)
+            order_data['marketer_payment_method'] = payment_method
+            order_data['marketer_payment_details'] = payment_details
+            order_data['customer_reputation'] = reputations[order.customer_phone]
+            orders_data.append(order_data)
+        
+        last_order = orders[-1][0] if orders else None
+        return jsonify({
+            'orders': orders_data,
+            'next_cursor': next_cursor(has_more, last_order.created_at, last_order.id) if last_order else None,
+            'has_more': has_more
+        }), 200
         
+    except (ValueError, CursorError):
+        return jsonify({'error': 'معايير التصفية غير صحيحة'}), 400
     except Exception as e:
         return jsonify({'error': f'خطأ في جلب الطلبات: {str(e)}'}), 500
 
@@ -209,7 +529,7 @@ def update_order_status(order_id):
         data = request.get_json()
         status = data.get('status')
         
-        if status not in ['in_progress', 'completed', 'rejected', 'not_serious']:
+        if status not in STATUS_MESSAGES:
             return jsonify({'error': 'حالة الطلب غير صحيحة'}), 400
         
         order = Order.query.get(order_id)
@@ -219,32 +539,30 @@ def update_order_status(order_id):
         if order.merchant_id != user.id:
             return jsonify({'error': 'غير مسموح لك بتعديل هذا الطلب'}), 403
         
-        order.status = OrderStatus(status)
-        order.updated_at = datetime.utcnow()
+        new_status = OrderStatus(status)
+        if not can_change_status(order.status, new_status):
+            return jsonify({'error': transition_error(order.status, new_status)}), 400
         
-        # إذا تم إكمال الطلب، تحديد تاريخ التوصيل وموعد الدفع
-        if status == 'completed':
-            order.delivery_date = datetime.utcnow()
-            order.payment_due_date = datetime.utcnow() + timedelta(days=5)  # 5 أيام عمل
+        # تحديث مشروط بالحالة المقروءة حتى لا يتجاوز طلبان متزامنان جدول الانتقالات
+        if not Order.query.filter(
+            Order.id == order_id, Order.status == order.status
+        ).update(status_update_values(new_status), synchronize_session=False):
+            db.session.rollback()
+            return jsonify({'error': 'تم تعديل الطلب للتو، أعد المحاولة'}), 409
         
         # إرسال إشعار للمسوق
-        status_messages = {
-            'in_progress': 'قيد التنفيذ',
-            'completed': 'تم التوصيل',
-            'rejected': 'مرفوض',
-            'not_serious': 'غير جدي'
-        }
-        
         notification = Notification(
             user_id=order.marketer_id,
             title='تحديث حالة الطلب',
-            message=f'تم تحديث حالة طلبك إلى: {status_messages[status]}',
+            message=f'تم تحديث حالة طلبك إلى: {STATUS_MESSAGES[status]}',
             type=NotificationType.ORDER_UPDATE,
             is_read=False,
             related_order_id=order_id
         )
         
         db.session.add(notification)
+        record_order_changes([order_change(order, order.status, order.payment_status, new_status)], user.id)
+        queue_product_scores([order.product_id])
         db.session.commit()
         
         return jsonify({'message': 'تم تحديث حالة الطلب بنجاح'}), 200
@@ -253,6 +571,92 @@ def update_order_status(order_id):
         db.session.rollback()
         return jsonify({'error': f'خطأ في تحديث حالة الطلب: {str(e)}'}), 500
 
+@orders_bp.route('/bulk-status', methods=['PUT'])
+def bulk_update_order_status():
+    try:
+        auth_result, error_response, status_code = require_auth()
+        if error_response:
+            return error_response, status_code
+        
+        user = auth_result['user']
+        
+        data = request.get_json() or {}
+        status = data.get('status')
+        order_ids = data.get('order_ids')
+        
+        if status not in STATUS_MESSAGES:
+            return jsonify({'error': 'حالة الطلب غير صحيحة'}), 400
+        
+        if not isinstance(order_ids, list) or not order_ids:
+            return jsonify({'error': 'قائمة الطلبات مطلوبة'}), 400
+        
+        if len(order_ids) > BULK_STATUS_MAX_ORDERS:
+            return jsonify({'error': f'الحد الأقصى {BULK_STATUS_MAX_ORDERS} طلب في المرة الواحدة'}), 400
+        
+        new_status = OrderStatus(status)
+        order_ids = list(dict.fromkeys(int(order_id) for order_id in order_ids))
+        
+        # التحقق من وجود الطلبات وملكيتها باستعلام واحد
+        rows = db.session.query(
+            Order.id, Order.merchant_id, Order.marketer_id, Order.product_id,
+            Order.marketer_profit, Order.status, Order.payment_status, Order.customer_phone
+        ).filter(Order.id.in_(order_ids)).all()
+        found = {row.id: row for row in rows}
+        
+        failed = []
+        allowed = []
+        for order_id in order_ids:
+            row = found.get(order_id)
+            if not row:
+                failed.append({'order_id': order_id, 'error': 'الطلب غير موجود'})
+            elif row.merchant_id != user.id:
+                failed.append({'order_id': order_id, 'error': 'غير مسموح لك بتعديل هذا الطلب'})
+            elif not can_change_status(row.status, new_status):
+                failed.append({'order_id': order_id, 'error': transition_error(row.status, new_status)})
+            else:
+                allowed.append(row)
+        
+        if allowed:
+            values = status_update_values(new_status)
+            
+            # تحديث مشروط لكل حالة مصدر، وأي اختلاف في العدد يعني تعديلاً متزامناً
+            for source in sources_for_status(new_status):
+                source_ids = [row.id for row in allowed if row.status == source]
+                if source_ids and Order.query.filter(
+                    Order.id.in_(source_ids), Order.status == source
+                ).update(values, synchronize_session=False) != len(source_ids):
+                    db.session.rollback()
+                    return jsonify({'error': 'تم تعديل بعض الطلبات للتو، أعد المحاولة'}), 409
+            
+            # إرسال إشعار لكل مسوق بدفعة واحدة
+            bulk_insert_notifications([{
+                'user_id': row.marketer_id,
+                'title': 'تحديث حالة الطلب',
+                'message': f'تم تحديث حالة طلبك إلى: {STATUS_MESSAGES[status]}',
+                'type': NotificationType.ORDER_UPDATE,
+                'is_read': False,
+                'related_order_id': row.id
+            } for row in allowed])
+            
+            record_order_changes([
+                order_change(row, row.status, row.payment_status, new_status) for row in allowed
+            ], user.id)
+            queue_product_scores(row.product_id for row in allowed)
+            db.session.commit()
+        
+        return jsonify({
+            'message': 'تم تحديث حالة الطلبات',
+            'updated': [row.id for row in allowed],
+            'failed': failed
+        }), 200
+        
+    except ValueError:
+        db.session.rollback()
+        return jsonify({'error': 'البيانات المدخلة غير صحيحة'}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'خطأ في تحديث حالة الطلبات: {str(e)}'}), 500
+
 @orders_bp.route('/<int:order_id>/confirm-payment', methods=['PUT'])
 def confirm_payment_received(order_id):
     try:
@@ -262,7 +666,10 @@ def confirm_payment_received(order_id):
         
         user = auth_result['user']
         
-        order = Order.query.get(order_id)
+        order = db.session.query(
+            Order.id, Order.merchant_id, Order.marketer_id,
+            Order.marketer_profit, Order.status, Order.payment_status, Order.payout_batch_id
+        ).filter(Order.id == order_id).first()
         if not order:
             return jsonify({'error': 'الطلب غير موجود'}), 404
         
@@ -272,24 +679,37 @@ def confirm_payment_received(order_id):
         if order.status != OrderStatus.COMPLETED:
             return jsonify({'error': 'الطلب يجب أن يكون مكتملاً أولاً'}), 400
         
-        order.payment_status = PaymentStatus.PAID
-        order.updated_at = datetime.utcnow()
-        
-        # تحديث عدد الطلبات المكتملة للمسوق والتاجر
-        marketer_profile = UserProfile.query.filter_by(user_id=order.marketer_id).first()
-        merchant_profile = UserProfile.query.filter_by(user_id=order.merchant_id).first()
-        
-        if marketer_profile:
-            marketer_profile.completed_orders += 1
-            if marketer_profile.completed_orders >= 5:
-                marketer_profile.is_verified = True
-        
-        if merchant_profile:
-            merchant_profile.completed_orders += 1
-            if merchant_profile.completed_orders >= 3:
-                merchant_profile.is_verified = True
-        
+        if not can_change_payment(order.status, order.payment_status, PaymentStatus.PAID):
+            return jsonify({'error': 'تم تأكيد استلام الدفع مسبقاً'}), 400
+        
+        # تحديث مشروط: لا يُطبَّق إلا إذا لم تتغير حالة الطلب منذ قراءته
+        updated = Order.query.filter(
+            Order.id == order_id,
+            Order.status == OrderStatus.COMPLETED,
+            Order.payment_status == order.payment_status
+        ).update({
+            Order.payment_status: PaymentStatus.PAID,
+            Order.payout_batch_id: None,
+            Order.updated_at: datetime.utcnow()
+        }, synchronize_session=False)
+        if not updated:
+            db.session.rollback()
+            return jsonify({'error': 'تم تعديل الطلب للتو، أعد المحاولة'}), 409
+        
+        # الطلب المدفوع منفرداً يخرج من دفعة التسوية المعلقة التي ضمته
+        if order.payout_batch_id:
+            remove_from_batch_totals(order.payout_batch_id, order.marketer_id, order.marketer_profit)
+        
+        changes = [order_change(order, order.status, order.payment_status, new_payment_status=PaymentStatus.PAID)]
+        
+        # زيادة عدد الطلبات المكتملة للمسوق والتاجر وتوثيقهما بجملة واحدة
+        # درجات الترتيب وعدد طلبات التاجر في الكتالوج تُحدَّث لاحقاً من طابور إعادة الحساب
+        verified_merchants = add_completed_orders(changes)
+        record_order_changes(changes, user.id)
         db.session.commit()
+        if verified_merchants:
+            catalog_snapshot.refresh_merchant(order.merchant_id)
+            invalidate_merchant_products(order.merchant_id)
         
         return jsonify({'message': 'تم تأكيد استلام الدفع بنجاح'}), 200
         
@@ -313,8 +733,23 @@ def report_payment_delay(order_id):
         if order.marketer_id != user.id:
             return jsonify({'error': 'غير مسموح لك بالإبلاغ عن هذا الطلب'}), 403
         
-        order.payment_status = PaymentStatus.DELAYED
-        order.updated_at = datetime.utcnow()
+        if not can_change_payment(order.status, order.payment_status, PaymentStatus.DELAYED):
+            return jsonify({'error': 'لا يمكن الإبلاغ عن تأخير الدفع لهذا الطلب'}), 400
+        
+        if not Order.query.filter(
+            Order.id == order_id,
+            Order.status == order.status,
+            Order.payment_status == order.payment_status
+        ).update({
+            Order.payment_status: PaymentStatus.DELAYED,
+            Order.updated_at: datetime.utcnow()
+        }, synchronize_session=False):
+            db.session.rollback()
+            return jsonify({'error': 'تم تعديل الطلب للتو، أعد المحاولة'}), 409
+        
+        record_order_changes([
+            order_change(order, order.status, order.payment_status, new_payment_status=PaymentStatus.DELAYED)
+        ], user.id)
         
         # إرسال إشعار للتاجر
         notification = Notification(
@@ -344,12 +779,13 @@ def get_marketer_stats():
         
         user = auth_result['user']
         
-        orders = Order.query.filter_by(marketer_id=user.id).all()
+        # الملخص محفوظ مسبقاً ويُحدَّث مع كل تغيير على الطلبات
+        stats = get_order_stats(user.id, 'marketer')
         
-        total_orders = len(orders)
-        completed_orders = len([o for o in orders if o.status == OrderStatus.COMPLETED])
-        total_profit = sum([o.marketer_profit for o in orders if o.payment_status == PaymentStatus.PAID])
-        pending_profit = sum([o.marketer_profit for o in orders if o.status == OrderStatus.COMPLETED and o.payment_status == PaymentStatus.PENDING])
+        total_orders = stats.total_orders
+        completed_orders = stats.completed_orders
+        total_profit = stats.paid_profit
+        pending_profit = stats.pending_profit
         
         success_rate = (completed_orders / total_orders * 100) if total_orders > 0 else 0
         
@@ -373,21 +809,16 @@ def get_merchant_stats():
         
         user = auth_result['user']
         
-        orders = Order.query.filter_by(merchant_id=user.id).all()
+        stats = get_order_stats(user.id, 'merchant')
         
-        total_orders = len(orders)
-        completed_orders = len([o for o in orders if o.status == OrderStatus.COMPLETED])
-        total_owed_to_marketers = sum([o.marketer_profit for o in orders if o.status == OrderStatus.COMPLETED and o.payment_status == PaymentStatus.PENDING])
+        total_orders = stats.total_orders
+        completed_orders = stats.completed_orders
+        total_owed_to_marketers = stats.pending_profit
         
         success_rate = (completed_orders / total_orders * 100) if total_orders > 0 else 0
         
-        # حساب المبالغ المستحقة لكل مسوق
-        marketer_debts = {}
-        for order in orders:
-            if order.status == OrderStatus.COMPLETED and order.payment_status == PaymentStatus.PENDING:
-                if order.marketer_id not in marketer_debts:
-                    marketer_debts[order.marketer_id] = 0
-                marketer_debts[order.marketer_id] += order.marketer_profit
+        # المبالغ المستحقة لكل مسوق
+        marketer_debts = get_marketer_debts(user.id)
         
         return jsonify({
             'total_orders': total_orders,
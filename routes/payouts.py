@@ -0,0 +1,260 @@
+from flask import Blueprint, jsonify
+from src.models.user import db, User, UserProfile, Order, PayoutBatch, UserType, OrderStatus, PaymentStatus, PayoutStatus, NotificationType
+from src.utils.auth_context import require_auth
+from src.utils.order_flow import record_order_changes, order_change, add_completed_orders
+from src.utils.notifications import bulk_insert_notifications
+from src.utils.catalog import catalog_snapshot, invalidate_merchant_products
+from src.utils.export import export_response, EXPORT_CHUNK_ROWS
+from src.utils.payments import refresh_batch_totals
+from src.utils.order_stats import OUTSTANDING_PAYMENT_STATUSES
+from datetime import datetime
+from sqlalchemy import func, update
+
+payouts_bp = Blueprint('payouts', __name__)
+
+# الطلبات المكتملة التي لم يُدفع ربح المسوق عنها بعد، وهي نفسها ما تعده الإحصائيات مستحقاً
+PAYABLE_PAYMENT_STATUSES = OUTSTANDING_PAYMENT_STATUSES
+
+def serialize_batch(batch):
+    return {
+        'id': batch.id,
+        'status': batch.status.value,
+        'orders_count': batch.orders_count,
+        'marketers_count': batch.marketers_count,
+        'total_amount': batch.total_amount,
+        'created_at': batch.created_at.isoformat(),
+        'paid_at': batch.paid_at.isoformat() if batch.paid_at else None
+    }
+
+def batch_lines_query(batch_id):
+    # مستحقات كل مسوق في الدفعة مع وسيلة الدفع الخاصة به باستعلام تجميعي واحد
+    return db.session.query(
+        Order.marketer_id,
+        User.name,
+        UserProfile.payment_method,
+        UserProfile.payment_details,
+        func.count(Order.id),
+        func.sum(Order.marketer_profit)
+    ).join(
+        User, User.id == Order.marketer_id
+    ).outerjoin(
+        UserProfile, UserProfile.user_id == Order.marketer_id
+    ).filter(
+        Order.payout_batch_id == batch_id
+    ).group_by(
+        Order.marketer_id, User.name, UserProfile.payment_method, UserProfile.payment_details
+    ).order_by(Order.marketer_id)
+
+def get_merchant_batch(batch_id):
+    # إرجاع (الدفعة، رد الخطأ، رمز الحالة)
+    auth_result, error_response, status_code = require_auth()
+    if error_response:
+        return None, error_response, status_code
+    
+    batch = PayoutBatch.query.get(batch_id)
+    if not batch:
+        return None, jsonify({'error': 'دفعة التسوية غير موجودة'}), 404
+    
+    if batch.merchant_id != auth_result['user'].id:
+        return None, jsonify({'error': 'غير مسموح لك بالوصول لهذه الدفعة'}), 403
+    
+    return batch, None, None
+
+@payouts_bp.route('/', methods=['POST'])
+def create_payout_batch():
+    try:
+        auth_result, error_response, status_code = require_auth()
+        if error_response:
+            return error_response, status_code
+        
+        user = auth_result['user']
+        profile = auth_result['profile']
+        
+        if profile.user_type != UserType.MERCHANT:
+            return jsonify({'error': 'هذه الخدمة للتجار فقط'}), 403
+        
+        batch = PayoutBatch(merchant_id=user.id, status=PayoutStatus.PENDING)
+        db.session.add(batch)
+        db.session.flush()
+        
+        # ضم كل الطلبات المستحقة غير المضافة لدفعة أخرى بجملة UPDATE واحدة
+        Order.query.filter(
+            Order.merchant_id == user.id,
+            Order.status == OrderStatus.COMPLETED,
+            Order.payment_status.in_(PAYABLE_PAYMENT_STATUSES),
+            Order.payout_batch_id == None
+        ).update({Order.payout_batch_id: batch.id}, synchronize_session=False)
+        
+        lines = batch_lines_query(batch.id).all()
+        if not lines:
+            db.session.rollback()
+            return jsonify({'error': 'لا توجد مستحقات غير مدفوعة للمسوقين'}), 400
+        
+        batch.orders_count = sum(line[4] for line in lines)
+        batch.marketers_count = len(lines)
+        batch.total_amount = sum(line[5] for line in lines)
+        db.session.commit()
+        
+        return jsonify({
+            'message': 'تم إنشاء دفعة التسوية بنجاح',
+            'batch': serialize_batch(batch)
+        }), 201
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'خطأ في إنشاء دفعة التسوية: {str(e)}'}), 500
+
+@payouts_bp.route('/', methods=['GET'])
+def get_payout_batches():
+    try:
+        auth_result, error_response, status_code = require_auth()
+        if error_response:
+            return error_response, status_code
+        
+        user = auth_result['user']
+        
+        batches = PayoutBatch.query.filter_by(merchant_id=user.id).order_by(
+            PayoutBatch.created_at.desc()
+        ).all()
+        
+        return jsonify({'batches': [serialize_batch(batch) for batch in batches]}), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'خطأ في جلب دفعات التسوية: {str(e)}'}), 500
+
+@payouts_bp.route('/<int:batch_id>', methods=['GET'])
+def get_payout_batch(batch_id):
+    try:
+        batch, error_response, status_code = get_merchant_batch(batch_id)
+        if error_response:
+            return error_response, status_code
+        
+        lines = [{
+            'marketer_id': marketer_id,
+            'marketer_name': name,
+            'payment_method': payment_method,
+            'payment_details': payment_details,
+            'orders_count': orders_count,
+            'amount': amount
+        } for marketer_id, name, payment_method, payment_details, orders_count, amount in batch_lines_query(batch.id)]
+        
+        return jsonify({'batch': serialize_batch(batch), 'lines': lines}), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'خطأ في جلب دفعة التسوية: {str(e)}'}), 500
+
+@payouts_bp.route('/<int:batch_id>/export', methods=['GET'])
+def export_payout_batch(batch_id):
+    try:
+        batch, error_response, status_code = get_merchant_batch(batch_id)
+        if error_response:
+            return error_response, status_code
+        
+        header = ['marketer_id', 'marketer_name', 'payment_method', 'payment_details', 'orders_count', 'amount']
+        rows = batch_lines_query(batch.id).yield_per(EXPORT_CHUNK_ROWS)
+        
+        return export_response(f'payout-{batch.id}', header, rows)
+        
+    except Exception as e:
+        return jsonify({'error': f'خطأ في تصدير دفعة التسوية: {str(e)}'}), 500
+
+@payouts_bp.route('/<int:batch_id>/mark-paid', methods=['PUT'])
+def mark_payout_batch_paid(batch_id):
+    try:
+        batch, error_response, status_code = get_merchant_batch(batch_id)
+        if error_response:
+            return error_response, status_code
+        
+        # تحديث مشروط حتى لا تُدفع الدفعة مرتين عند الطلبات المتزامنة
+        if not PayoutBatch.query.filter(
+            PayoutBatch.id == batch.id, PayoutBatch.status == PayoutStatus.PENDING
+        ).update({
+            PayoutBatch.status: PayoutStatus.PAID,
+            PayoutBatch.paid_at: datetime.utcnow()
+        }, synchronize_session=False):
+            db.session.rollback()
+            return jsonify({'error': 'تم دفع هذه الدفعة مسبقاً'}), 400
+        
+        rows = db.session.query(
+            Order.id, Order.merchant_id, Order.marketer_id,
+            Order.marketer_profit, Order.status, Order.payment_status
+        ).filter(
+            Order.payout_batch_id == batch.id,
+            Order.status == OrderStatus.COMPLETED,
+            Order.payment_status.in_(PAYABLE_PAYMENT_STATUSES)
+        ).all()
+        
+        # الطلبات التي أكد المسوق استلامها منفردة في نفس اللحظة يستبعدها الشرط
+        paid_ids = set(db.session.execute(update(Order).where(
+            Order.id.in_([row.id for row in rows]),
+            Order.status == OrderStatus.COMPLETED,
+            Order.payment_status.in_(PAYABLE_PAYMENT_STATUSES)
+        ).values(
+            payment_status=PaymentStatus.PAID, updated_at=datetime.utcnow()
+        ).returning(Order.id)).scalars()) if rows else set()
+        rows = [row for row in rows if row.id in paid_ids]
+        
+        # الدفعة تبقى مرتبطة بما دفعته فقط، فتطابق تفاصيلها وتصديرها ما سُوّي فعلاً
+        Order.query.filter(
+            Order.payout_batch_id == batch.id, Order.id.notin_(paid_ids)
+        ).update({Order.payout_batch_id: None}, synchronize_session=False)
+        refresh_batch_totals(batch.id)
+        
+        changes = [order_change(row, row.status, row.payment_status, new_payment_status=PaymentStatus.PAID) for row in rows]
+        verified_merchants = add_completed_orders(changes)
+        record_order_changes(changes, batch.merchant_id)
+        
+        # إشعار واحد لكل مسوق بإجمالي ما دُفع له
+        totals = {}
+        for row in rows:
+            count, amount = totals.get(row.marketer_id, (0, 0))
+            totals[row.marketer_id] = (count + 1, amount + row.marketer_profit)
+        bulk_insert_notifications([{
+            'user_id': marketer_id,
+            'title': 'تم دفع مستحقاتك',
+            'message': f'تم دفع {round(amount, 2)} دينار عن {count} طلب',
+            'type': NotificationType.PAYMENT,
+            'is_read': False,
+            'related_order_id': None
+        } for marketer_id, (count, amount) in totals.items()])
+        
+        db.session.commit()
+        if verified_merchants:
+            catalog_snapshot.refresh_merchant(batch.merchant_id)
+            invalidate_merchant_products(batch.merchant_id)
+        
+        return jsonify({
+            'message': 'تم تأكيد دفع الدفعة بنجاح',
+            'orders_paid': len(rows),
+            'amount_paid': sum(row.marketer_profit for row in rows)
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'خطأ في تأكيد دفع الدفعة: {str(e)}'}), 500
+
+@payouts_bp.route('/<int:batch_id>', methods=['DELETE'])
+def cancel_payout_batch(batch_id):
+    try:
+        batch, error_response, status_code = get_merchant_batch(batch_id)
+        if error_response:
+            return error_response, status_code
+        
+        # الحذف مشروط بأن الدفعة لم تُدفع بعد
+        if not PayoutBatch.query.filter(
+            PayoutBatch.id == batch.id, PayoutBatch.status == PayoutStatus.PENDING
+        ).delete(synchronize_session=False):
+            db.session.rollback()
+            return jsonify({'error': 'لا يمكن إلغاء دفعة مدفوعة'}), 400
+        
+        # إعادة الطلبات لتدخل في دفعة لاحقة
+        Order.query.filter(Order.payout_batch_id == batch.id).update(
+            {Order.payout_batch_id: None}, synchronize_session=False
+        )
+        db.session.commit()
+        
+        return jsonify({'message': 'تم إلغاء دفعة التسوية بنجاح'}), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'خطأ في إلغاء دفعة التسوية: {str(e)}'}), 500
@@ -1,23 +1,56 @@
-from flask import Blueprint, request, jsonify, session
-from src.models.user import db, User, UserProfile, Product, UserType, SubscriptionStatus
-from sqlalchemy import and_
+from flask import Blueprint, request, jsonify, make_response, current_app
+from src.models.user import db, UserProfile, Product, UserType, SubscriptionStatus
+from src.utils.auth_context import require_auth
+from src.utils.pagination import get_page_size, keyset_page, next_cursor, decode_cursor, CursorError
+from src.utils import search, feed, invalidation
+from src.utils.catalog import catalog_snapshot, catalog_query, serialize_catalog_product, product_detail_cache, invalidate_merchant_products
+from src.utils.imports import iter_upload_rows, chunked, non_text_field
+from src.utils.images import store_image, image_variants, ImageError
+from src.utils.ranking import refresh_product_scores
+from sqlalchemy import bindparam, update
+from datetime import datetime
+import math
 
 products_bp = Blueprint('products', __name__)
 
-def require_auth():
-    user_id = session.get('user_id')
-    if not user_id:
-        return None, jsonify({'error': 'غير مسجل الدخول'}), 401
+def validate_prices(base_price, min_marketer_profit, suggested_price):
+    # التحقق من صحة الأسعار
+    if base_price <= 0 or min_marketer_profit <= 0:
+        return 'الأسعار يجب أن تكون أكبر من صفر'
     
-    user = User.query.get(user_id)
-    if not user:
-        return None, jsonify({'error': 'المستخدم غير موجود'}), 404
+    if suggested_price and suggested_price < base_price + min_marketer_profit:
+        return 'السعر المقترح يجب أن يكون أكبر من السعر الأساسي + أقل ربح للمسوق'
     
-    profile = UserProfile.query.filter_by(user_id=user_id).first()
-    if not profile:
-        return None, jsonify({'error': 'الملف الشخصي غير موجود'}), 404
+    return None
+
+def validate_product_data(data):
+    # التحقق من البيانات المطلوبة
+    required_fields = ['name', 'description', 'base_price', 'min_marketer_profit']
+    for field in required_fields:
+        if field not in data or not data[field]:
+            return None, f'حقل {field} مطلوب'
+    
+    suggested_price = data.get('suggested_price')
+    category = (data.get('category') or '').strip()
+    image_url = (data.get('image_url') or '').strip()
+    sku = (data.get('sku') or '').strip()
+    
+    fields = {
+        'name': data['name'].strip(),
+        'description': data['description'].strip(),
+        'base_price': float(data['base_price']),
+        'min_marketer_profit': float(data['min_marketer_profit']),
+        'suggested_price': float(suggested_price) if suggested_price else None,
+        'category': category if category else None,
+        'image_url': image_url if image_url else None,
+        'sku': sku if sku else None
+    }
+    
+    error = validate_prices(fields['base_price'], fields['min_marketer_profit'], fields['suggested_price'])
+    if error:
+        return None, error
     
-    return {'user': user, 'profile': profile}, None, None
+    return fields, None
 
 @products_bp.route('/create', methods=['POST'])
 def create_product():
@@ -38,44 +71,28 @@ def create_product():
         
         data = request.get_json()
         
-        # التحقق من البيانات المطلوبة
-        required_fields = ['name', 'description', 'base_price', 'min_marketer_profit']
-        for field in required_fields:
-            if field not in data or not data[field]:
-                return jsonify({'error': f'حقل {field} مطلوب'}), 400
-        
-        name = data['name'].strip()
-        description = data['description'].strip()
-        base_price = float(data['base_price'])
-        min_marketer_profit = float(data['min_marketer_profit'])
-        suggested_price = data.get('suggested_price')
-        category = data.get('category', '').strip()
-        image_url = data.get('image_url', '').strip()
-        
-        # التحقق من صحة الأسعار
-        if base_price <= 0 or min_marketer_profit <= 0:
-            return jsonify({'error': 'الأسعار يجب أن تكون أكبر من صفر'}), 400
-        
-        if suggested_price:
-            suggested_price = float(suggested_price)
-            if suggested_price < base_price + min_marketer_profit:
-                return jsonify({'error': 'السعر المقترح يجب أن يكون أكبر من السعر الأساسي + أقل ربح للمسوق'}), 400
+        fields, error = validate_product_data(data)
+        if error:
+            return jsonify({'error': error}), 400
+        
+        if fields['sku'] and Product.query.filter_by(merchant_id=user.id, sku=fields['sku']).first():
+            return jsonify({'error': 'رمز المنتج مستخدم بالفعل'}), 400
         
         # إنشاء المنتج
         product = Product(
             merchant_id=user.id,
-            name=name,
-            description=description,
-            image_url=image_url if image_url else None,
-            base_price=base_price,
-            min_marketer_profit=min_marketer_profit,
-            suggested_price=suggested_price,
-            category=category if category else None,
-            is_active=True
+            is_active=True,
+            **fields
         )
         
         db.session.add(product)
+        db.session.flush()  # للحصول على معرف المنتج
+        search.index_product(product)
+        # نشر المنتج في الخط الزمني لمتابعي التاجر
+        feed.fan_out_products(user.id, [product.id])
+        refresh_product_scores([product.id])
         db.session.commit()
+        catalog_snapshot.upsert_product(product)
         
         return jsonify({
             'message': 'تم إنشاء المنتج بنجاح',
@@ -88,6 +105,7 @@ def create_product():
                 'min_marketer_profit': product.min_marketer_profit,
                 'suggested_price': product.suggested_price,
                 'category': product.category,
+                'sku': product.sku,
                 'is_active': product.is_active
             }
         }), 201
@@ -98,6 +116,246 @@ def create_product():
         db.session.rollback()
         return jsonify({'error': f'خطأ في إنشاء المنتج: {str(e)}'}), 500
 
+@products_bp.route('/images', methods=['POST'])
+def upload_product_image():
+    try:
+        auth_result, error_response, status_code = require_auth()
+        if error_response:
+            return error_response, status_code
+        
+        profile = auth_result['profile']
+        
+        if profile.user_type != UserType.MERCHANT:
+            return jsonify({'error': 'هذه الخدمة للتجار فقط'}), 403
+        
+        upload = request.files.get('image')
+        if not upload:
+            return jsonify({'error': 'حقل image مطلوب'}), 400
+        
+        image_data = store_image(upload, current_app.static_folder)
+        
+        return jsonify({
+            'message': 'تم رفع الصورة بنجاح',
+            **image_data
+        }), 201
+        
+    except ImageError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'خطأ في رفع الصورة: {str(e)}'}), 500
+
+# الحقول النصية في ملف استيراد المنتجات
+PRODUCT_IMPORT_TEXT_FIELDS = ['sku', 'name', 'description', 'category', 'image_url']
+
+# أعمدة لا يغيرها الاستيراد في المنتج الموجود إلا إن وردت في السطر (عمود CSV فارغ يمسح القيمة)
+PRODUCT_OPTIONAL_COLUMNS = ['suggested_price', 'category', 'image_url']
+
+@products_bp.route('/import', methods=['POST'])
+def import_products():
+    try:
+        auth_result, error_response, status_code = require_auth()
+        if error_response:
+            return error_response, status_code
+        
+        user = auth_result['user']
+        profile = auth_result['profile']
+        
+        if profile.user_type != UserType.MERCHANT:
+            return jsonify({'error': 'هذه الخدمة للتجار فقط'}), 403
+        
+        if profile.subscription_status != SubscriptionStatus.ACTIVE:
+            return jsonify({'error': 'يجب تفعيل الاشتراك أولاً'}), 403
+        
+        results = []
+        created_count = 0
+        updated_count = 0
+        seen_skus = set()
+        
+        for chunk in chunked(iter_upload_rows()):
+            valid_rows = []
+            for line_number, row, error in chunk:
+                sku = None
+                if not error:
+                    field = non_text_field(row, PRODUCT_IMPORT_TEXT_FIELDS)
+                    if field:
+                        error = f'حقل {field} يجب أن يكون نصاً'
+                if not error:
+                    sku = (row.get('sku') or '').strip()
+                    if not sku:
+                        error = 'حقل sku مطلوب'
+                if not error and sku in seen_skus:
+                    error = 'رمز المنتج مكرر في الملف'
+                if not error:
+                    try:
+                        fields, error = validate_product_data(row)
+                    except (ValueError, TypeError, AttributeError):
+                        error = 'الأسعار يجب أن تكون أرقام صحيحة'
+                
+                if error:
+                    results.append({'row': line_number, 'sku': sku or None, 'status': 'error', 'error': error})
+                    continue
+                
+                seen_skus.add(sku)
+                valid_rows.append((line_number, fields, [column for column in PRODUCT_OPTIONAL_COLUMNS if column in row]))
+            
+            if not valid_rows:
+                continue
+            
+            # جلب المنتجات الموجودة للدفعة كاملة باستعلام واحد
+            existing = {sku: (product_id, suggested_price) for sku, product_id, suggested_price in db.session.query(
+                Product.sku, Product.id, Product.suggested_price
+            ).filter(
+                Product.merchant_id == user.id,
+                Product.sku.in_([fields['sku'] for _, fields, _ in valid_rows])
+            )}
+            
+            now = datetime.utcnow()
+            inserts = []
+            updates = {}
+            for line_number, fields, provided in valid_rows:
+                if fields['sku'] not in existing:
+                    inserts.append(dict(fields, merchant_id=user.id, is_active=True, created_at=now))
+                    continue
+                
+                product_id, suggested_price = existing[fields['sku']]
+                if 'suggested_price' not in provided:
+                    error = validate_prices(fields['base_price'], fields['min_marketer_profit'], suggested_price)
+                    if error:
+                        results.append({'row': line_number, 'sku': fields['sku'], 'status': 'error', 'error': error})
+                        continue
+                
+                # الأعمدة الاختيارية الغائبة عن السطر تبقى بقيمتها المحفوظة
+                values = {key: value for key, value in fields.items() if key not in PRODUCT_OPTIONAL_COLUMNS or key in provided}
+                updates.setdefault(tuple(sorted(values)), []).append(dict(values, product_id=product_id))
+                results.append({'row': line_number, 'sku': fields['sku'], 'status': 'updated', 'id': product_id})
+            
+            if inserts:
+                db.session.execute(Product.__table__.insert(), inserts)
+            # جملة واحدة لكل مجموعة أسطر تحمل نفس الأعمدة
+            products_table = Product.__table__
+            for rows in updates.values():
+                db.session.execute(
+                    products_table.update().where(products_table.c.id == bindparam('product_id')),
+                    rows
+                )
+            
+            # تحديث فهرس البحث للمنتجات المتأثرة ضمن نفس المعاملة
+            products = Product.query.filter(
+                Product.merchant_id == user.id,
+                Product.sku.in_([fields['sku'] for _, fields, _ in valid_rows])
+            ).all()
+            search.index_products(products)
+            new_product_ids = [product.id for product in products if product.sku not in existing]
+            feed.fan_out_products(user.id, new_product_ids)
+            refresh_product_scores(new_product_ids)
+            db.session.commit()
+            
+            product_ids = {product.sku: product.id for product in products}
+            for line_number, fields, _ in valid_rows:
+                if fields['sku'] not in existing:
+                    results.append({'row': line_number, 'sku': fields['sku'], 'status': 'created', 'id': product_ids[fields['sku']]})
+            created_count += len(inserts)
+            updated_count += sum(len(rows) for rows in updates.values())
+            
+            # إبطال ما في الذاكرة بعد كل دفعة محفوظة حتى لو فشلت دفعة لاحقة
+            catalog_snapshot.refresh_merchant(user.id)
+            invalidate_merchant_products(user.id)
+        
+        results.sort(key=lambda result: result['row'])
+        return jsonify({
+            'message': f'تم إنشاء {created_count} منتج وتحديث {updated_count} منتج',
+            'created': created_count,
+            'updated': updated_count,
+            'failed': len([result for result in results if result['status'] == 'error']),
+            'results': results
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'خطأ في استيراد المنتجات: {str(e)}'}), 500
+
+@products_bp.route('/bulk-price', methods=['PUT'])
+def bulk_update_prices():
+    try:
+        auth_result, error_response, status_code = require_auth()
+        if error_response:
+            return error_response, status_code
+        
+        user = auth_result['user']
+        profile = auth_result['profile']
+        
+        if profile.user_type != UserType.MERCHANT:
+            return jsonify({'error': 'هذه الخدمة للتجار فقط'}), 403
+        
+        if profile.subscription_status != SubscriptionStatus.ACTIVE:
+            return jsonify({'error': 'يجب تفعيل الاشتراك أولاً'}), 403
+        
+        data = request.get_json() or {}
+        
+        mode = data.get('mode')
+        if mode not in ['percent', 'amount']:
+            return jsonify({'error': 'نوع التعديل غير صحيح'}), 400
+        
+        # التحقق من كل المدخلات قبل أي استعلام، فالقيم الفارغة أو من نوع خاطئ خطأ في الطلب
+        value = data.get('value')
+        try:
+            value = None if isinstance(value, bool) else float(value)
+        except (TypeError, ValueError):
+            value = None
+        if value is None or not math.isfinite(value):
+            return jsonify({'error': 'قيمة التعديل يجب أن تكون رقماً'}), 400
+        
+        product_ids = data.get('product_ids') or []
+        skus = data.get('skus') or []
+        category = data.get('category') or ''
+        try:
+            if not isinstance(product_ids, list) or any(isinstance(product_id, bool) for product_id in product_ids):
+                raise ValueError
+            product_ids = [int(product_id) for product_id in product_ids]
+        except (TypeError, ValueError):
+            return jsonify({'error': 'قائمة المنتجات غير صحيحة'}), 400
+        if not isinstance(skus, list) or not all(isinstance(sku, str) for sku in skus):
+            return jsonify({'error': 'قائمة رموز المنتجات غير صحيحة'}), 400
+        if not isinstance(category, str):
+            return jsonify({'error': 'التصنيف يجب أن يكون نصاً'}), 400
+        
+        if mode == 'percent':
+            new_price = Product.base_price * (1 + value / 100)
+        else:
+            new_price = Product.base_price + value
+        
+        query = Product.query.filter(Product.merchant_id == user.id)
+        if product_ids:
+            query = query.filter(Product.id.in_(product_ids))
+        elif skus:
+            query = query.filter(Product.sku.in_([sku.strip() for sku in skus]))
+        if category.strip():
+            query = query.filter(Product.category == category.strip())
+        
+        matched_ids = [product_id for (product_id,) in query.with_entities(Product.id)]
+        
+        # تعديل الأسعار بجملة واحدة مع نفس شروط صحة الأسعار، وما يخالفها يُعاد في skipped
+        updated_ids = set(db.session.execute(update(Product).where(
+            Product.id.in_(matched_ids),
+            new_price > 0,
+            (Product.suggested_price == None) | (Product.suggested_price >= new_price + Product.min_marketer_profit)
+        ).values(base_price=new_price).returning(Product.id)).scalars()) if matched_ids else set()
+        db.session.commit()
+        
+        if updated_ids:
+            catalog_snapshot.refresh_merchant(user.id)
+            invalidate_merchant_products(user.id)
+        
+        return jsonify({
+            'message': f'تم تحديث أسعار {len(updated_ids)} منتج',
+            'updated': len(updated_ids),
+            'skipped': [product_id for product_id in matched_ids if product_id not in updated_ids]
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'خطأ في تحديث الأسعار: {str(e)}'}), 500
+
 @products_bp.route('/my-products', methods=['GET'])
 def get_merchant_products():
     try:
@@ -124,8 +382,10 @@ def get_merchant_products():
                 'min_marketer_profit': product.min_marketer_profit,
                 'suggested_price': product.suggested_price,
                 'category': product.category,
+                'sku': product.sku,
                 'is_active': product.is_active,
-                'created_at': product.created_at.isoformat()
+                'created_at': product.created_at.isoformat(),
+                **image_variants(product.image_url)
             })
         
         return jsonify({'products': products_data}), 200
@@ -145,34 +405,132 @@ def get_active_products():
         if profile.user_type != UserType.MARKETER:
             return jsonify({'error': 'هذه الخدمة للمسوقين فقط'}), 403
         
+        limit = get_page_size()
+        category = request.args.get('category', '').strip()
+        min_price = request.args.get('min_price', type=float)
+        max_price = request.args.get('max_price', type=float)
+        verified_only = request.args.get('verified_only', '').lower() in ('1', 'true')
+        sort_by_score = request.args.get('sort') == 'score'
+        
+        # الطلب بدون تصفية يُخدم من النسخة الجاهزة في الذاكرة
+        if not (category or verified_only or sort_by_score or min_price is not None or max_price is not None):
+            cursor = request.args.get('cursor')
+            cursor_values = decode_cursor(cursor) if cursor else None
+            
+            catalog_snapshot.ensure_loaded()
+            etag = catalog_snapshot.etag(cursor, limit)
+            if request.if_none_match.contains(etag):
+                response = make_response('', 304)
+                response.set_etag(etag)
+                return response
+            
+            response = jsonify(catalog_snapshot.page(cursor_values, limit))
+            response.set_etag(etag)
+            return response
+        
         # جلب المنتجات المفعلة مع معلومات التاجر
-        products = db.session.query(Product, UserProfile).join(
+        query = catalog_query()
+        
+        # التصفية من جهة الخادم
+        if category:
+            query = query.filter(Product.category == category)
+        if min_price is not None:
+            query = query.filter(Product.base_price >= min_price)
+        if max_price is not None:
+            query = query.filter(Product.base_price <= max_price)
+        if verified_only:
+            query = query.filter(UserProfile.is_verified == True)
+        
+        # ترقيم الصفحات بالمؤشر على (درجة الترتيب أو تاريخ الإنشاء، المعرف)
+        sort_column = Product.rank_score if sort_by_score else Product.created_at
+        products, has_more = keyset_page(query, sort_column, Product.id, limit, is_datetime=not sort_by_score)
+        
+        products_data = [serialize_catalog_product(product, merchant_profile) for product, merchant_profile in products]
+        
+        last_product = products[-1][0] if products else None
+        last_sort_value = (last_product.rank_score if sort_by_score else last_product.created_at) if last_product else None
+        return jsonify({
+            'products': products_data,
+            'next_cursor': next_cursor(has_more, last_sort_value, last_product.id) if last_product else None,
+            'has_more': has_more
+        }), 200
+        
+    except CursorError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'خطأ في جلب المنتجات: {str(e)}'}), 500
+
+@products_bp.route('/facets', methods=['GET'])
+def get_category_facets():
+    try:
+        auth_result, error_response, status_code = require_auth()
+        if error_response:
+            return error_response, status_code
+        
+        profile = auth_result['profile']
+        
+        if profile.user_type != UserType.MARKETER:
+            return jsonify({'error': 'هذه الخدمة للمسوقين فقط'}), 403
+        
+        verified_only = request.args.get('verified_only', '').lower() in ('1', 'true')
+        
+        # العدادات محفوظة في نسخة الكتالوج وتُحدَّث مع كل تغيير
+        catalog_snapshot.ensure_loaded()
+        etag = catalog_snapshot.etag('facets', verified_only)
+        if request.if_none_match.contains(etag):
+            response = make_response('', 304)
+            response.set_etag(etag)
+            return response
+        
+        response = jsonify(catalog_snapshot.facets(verified_only))
+        response.set_etag(etag)
+        return response
+        
+    except Exception as e:
+        return jsonify({'error': f'خطأ في جلب التصنيفات: {str(e)}'}), 500
+
+@products_bp.route('/search', methods=['GET'])
+def search_products():
+    try:
+        auth_result, error_response, status_code = require_auth()
+        if error_response:
+            return error_response, status_code
+        
+        profile = auth_result['profile']
+        
+        if profile.user_type != UserType.MARKETER:
+            return jsonify({'error': 'هذه الخدمة للمسوقين فقط'}), 403
+        
+        query = request.args.get('q', '')
+        match_query = search.build_match_query(query)
+        if not match_query:
+            return jsonify({'error': 'نص البحث مطلوب'}), 400
+        
+        page = max(request.args.get('page', 1, type=int), 1)
+        limit = get_page_size(default=20)
+        
+        results = search.search_products_query(match_query).add_entity(UserProfile).join(
             UserProfile, Product.merchant_id == UserProfile.user_id
         ).filter(
-            and_(Product.is_active == True, UserProfile.subscription_status == SubscriptionStatus.ACTIVE)
-        ).order_by(Product.created_at.desc()).all()
+            UserProfile.subscription_status == SubscriptionStatus.ACTIVE
+        ).offset((page - 1) * limit).limit(limit + 1).all()
         
         products_data = []
-        for product, merchant_profile in products:
-            products_data.append({
-                'id': product.id,
-                'name': product.name,
-                'description': product.description,
-                'image_url': product.image_url,
-                'base_price': product.base_price,
-                'min_marketer_profit': product.min_marketer_profit,
-                'suggested_price': product.suggested_price,
-                'category': product.category,
-                'merchant_verified': merchant_profile.is_verified,
-                'merchant_completed_orders': merchant_profile.completed_orders,
-                'merchant_business_name': merchant_profile.business_name,
-                'created_at': product.created_at.isoformat()
-            })
+        terms = search.query_terms(query)
+        for product, rank, merchant_profile in results[:limit]:
+            product_data = serialize_catalog_product(product, merchant_profile)
+            product_data['snippet'] = search.product_snippet(product, terms)
+            product_data['score'] = -rank
+            products_data.append(product_data)
         
-        return jsonify({'products': products_data}), 200
+        return jsonify({
+            'products': products_data,
+            'page': page,
+            'has_more': len(results) > limit
+        }), 200
         
     except Exception as e:
-        return jsonify({'error': f'خطأ في جلب المنتجات: {str(e)}'}), 500
+        return jsonify({'error': f'خطأ في البحث عن المنتجات: {str(e)}'}), 500
 
 @products_bp.route('/<int:product_id>/toggle-status', methods=['PUT'])
 def toggle_product_status(product_id):
@@ -191,7 +549,10 @@ def toggle_product_status(product_id):
             return jsonify({'error': 'غير مسموح لك بتعديل هذا المنتج'}), 403
         
         product.is_active = not product.is_active
+        search.index_product(product)
         db.session.commit()
+        catalog_snapshot.upsert_product(product)
+        product_detail_cache.delete(product_id)
         
         status_text = 'مفعل' if product.is_active else 'معطل'
         return jsonify({
@@ -237,14 +598,14 @@ def update_product(product_id):
         if 'image_url' in data:
             product.image_url = data['image_url'].strip() if data['image_url'] else None
         
-        # التحقق من صحة الأسعار
-        if product.base_price <= 0 or product.min_marketer_profit <= 0:
-            return jsonify({'error': 'الأسعار يجب أن تكون أكبر من صفر'}), 400
-        
-        if product.suggested_price and product.suggested_price < product.base_price + product.min_marketer_profit:
-            return jsonify({'error': 'السعر المقترح يجب أن يكون أكبر من السعر الأساسي + أقل ربح للمسوق'}), 400
+        error = validate_prices(product.base_price, product.min_marketer_profit, product.suggested_price)
+        if error:
+            return jsonify({'error': error}), 400
         
+        search.index_product(product)
         db.session.commit()
+        catalog_snapshot.upsert_product(product)
+        product_detail_cache.delete(product_id)
         
         return jsonify({'message': 'تم تحديث المنتج بنجاح'}), 200
         
@@ -274,8 +635,12 @@ def delete_product(product_id):
         if product.orders:
             return jsonify({'error': 'لا يمكن حذف المنتج لوجود طلبات مرتبطة به'}), 400
         
+        search.remove_product(product.id)
+        feed.remove_product(product.id)
         db.session.delete(product)
         db.session.commit()
+        catalog_snapshot.remove_product(product_id)
+        product_detail_cache.delete(product_id)
         
         return jsonify({'message': 'تم حذف المنتج بنجاح'}), 200
         
@@ -286,12 +651,22 @@ def delete_product(product_id):
 @products_bp.route('/<int:product_id>', methods=['GET'])
 def get_product(product_id):
     try:
-        product = Product.query.get(product_id)
-        if not product:
+        invalidation.sync()
+        cached = product_detail_cache.get(product_id)
+        if cached is not None:
+            return current_app.response_class(cached, mimetype='application/json'), 200
+        
+        # تعديل يُحفظ بين القراءة والتخزين يُبطل ما قرأناه فلا نخزنه
+        generation = product_detail_cache.generation()
+        
+        # جلب المنتج مع معلومات التاجر باستعلام واحد
+        row = db.session.query(Product, UserProfile).outerjoin(
+            UserProfile, UserProfile.user_id == Product.merchant_id
+        ).filter(Product.id == product_id).first()
+        if not row:
             return jsonify({'error': 'المنتج غير موجود'}), 404
         
-        # جلب معلومات التاجر
-        merchant_profile = UserProfile.query.filter_by(user_id=product.merchant_id).first()
+        product, merchant_profile = row
         
         product_data = {
             'id': product.id,
@@ -306,10 +681,13 @@ def get_product(product_id):
             'merchant_verified': merchant_profile.is_verified if merchant_profile else False,
             'merchant_completed_orders': merchant_profile.completed_orders if merchant_profile else 0,
             'merchant_business_name': merchant_profile.business_name if merchant_profile else None,
-            'created_at': product.created_at.isoformat()
+            'created_at': product.created_at.isoformat(),
+            **image_variants(product.image_url)
         }
         
-        return jsonify({'product': product_data}), 200
+        response = jsonify({'product': product_data})
+        product_detail_cache.set(product_id, response.get_data(), tags=[('merchant', product.merchant_id)], generation=generation)
+        return response, 200
         
     except Exception as e:
         return jsonify({'error': f'خطأ في جلب المنتج: {str(e)}'}), 500
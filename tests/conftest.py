@@ -0,0 +1,106 @@
+import importlib.util
+import os
+import sys
+
+import pytest
+from flask import Flask
+
+# الوحدات تستورد بعضها بالبادئة src كما في بيئة النشر
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if 'src' not in sys.modules:
+    spec = importlib.util.spec_from_file_location('src', os.path.join(ROOT, '__init__.py'), submodule_search_locations=[ROOT])
+    sys.modules['src'] = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(sys.modules['src'])
+
+from src.models.user import db
+from src.routes.auth import auth_bp
+from src.routes.products import products_bp
+from src.routes.orders import orders_bp
+from src.routes.notifications import notifications_bp
+from src.routes.admin import admin_bp
+from src.routes.follows import follows_bp
+from src.routes.payouts import payouts_bp
+from src.utils.schema import ensure_schema
+from src.utils.search import ensure_search_index
+from src.utils.reputation import ensure_reputations
+from src.utils.notifications import ensure_unread_counters
+from src.utils import invalidation
+
+def create_app(db_path):
+    # قاعدة بيانات في ملف حتى تتشارك الخيوط والعمليات نفس البيانات كما في الخادم
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'test-secret'
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{db_path}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+
+    app.register_blueprint(auth_bp, url_prefix='/api/auth')
+    app.register_blueprint(products_bp, url_prefix='/api/products')
+    app.register_blueprint(orders_bp, url_prefix='/api/orders')
+    app.register_blueprint(notifications_bp, url_prefix='/api/notifications')
+    app.register_blueprint(admin_bp, url_prefix='/api/admin')
+    app.register_blueprint(follows_bp, url_prefix='/api/follows')
+    app.register_blueprint(payouts_bp, url_prefix='/api/payouts')
+
+    with app.app_context():
+        db.create_all()
+        ensure_schema()
+        ensure_search_index()
+        ensure_reputations()
+        ensure_unread_counters()
+        # ذاكرة العملية تخص قاعدة بيانات الاختبار السابق
+        invalidation.reset()
+    return app
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app(tmp_path / 'app.db')
+
+    yield app
+
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+def login(app, email):
+    client = app.test_client()
+    response = client.post('/api/auth/login', json={'email': email})
+    assert response.status_code == 200, response.get_json()
+    return client
+
+@pytest.fixture
+def users(app):
+    # مدير وتاجر ومسوق باشتراكات مفعلة
+    client = app.test_client()
+    for email, user_type in [('admin@test.com', 'admin'), ('merchant@test.com', 'merchant'), ('marketer@test.com', 'marketer')]:
+        response = client.post('/api/auth/register', json={'email': email, 'name': user_type, 'user_type': user_type})
+        assert response.status_code == 201, response.get_json()
+
+    admin = login(app, 'admin@test.com')
+    for user_id in (2, 3):
+        response = admin.put(f'/api/admin/users/{user_id}/subscription', json={'status': 'active'})
+        assert response.status_code == 200, response.get_json()
+
+    return {
+        'admin': admin,
+        'merchant': login(app, 'merchant@test.com'),
+        'marketer': login(app, 'marketer@test.com')
+    }
+
+def create_completed_orders(users, count, profit=5.0):
+    # منتج جديد للتاجر وطلبات مكتملة عليه من المسوق، تعيد معرفات الطلبات
+    response = users['merchant'].post('/api/products/create', json={
+        'name': 'منتج', 'description': 'وصف', 'base_price': 10, 'min_marketer_profit': 1
+    })
+    assert response.status_code == 201, response.get_json()
+    product_id = response.get_json()['product']['id']
+
+    line = {'product_id': product_id, 'customer_name': 'زبون', 'customer_phone': '07701234567',
+            'sale_price': 10 + profit, 'quantity': 1}
+    response = users['marketer'].post('/api/orders/batch', json={'orders': [line] * count})
+    assert response.status_code == 201, response.get_json()
+    order_ids = [result['order_id'] for result in response.get_json()['results']]
+
+    response = users['merchant'].put('/api/orders/bulk-status', json={'order_ids': order_ids, 'status': 'completed'})
+    assert response.status_code == 200, response.get_json()
+    return order_ids
@@ -0,0 +1,67 @@
+from conftest import login
+from src.models.user import db, UserProfile, MerchantFollow, FeedEntry
+from src.utils import feed
+
+def register_marketers(app, count):
+    client = app.test_client()
+    clients = []
+    for index in range(count):
+        email = f'follower{index}@test.com'
+        response = client.post('/api/auth/register', json={'email': email, 'name': email, 'user_type': 'marketer'})
+        assert response.status_code == 201, response.get_json()
+        clients.append(login(app, email))
+    return clients
+
+def create_product(users, name):
+    response = users['merchant'].post('/api/products/create', json={
+        'name': name, 'description': 'وصف', 'base_price': 10, 'min_marketer_profit': 1
+    })
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()['product']['id']
+
+def feed_ids(client):
+    response = client.get('/api/follows/feed')
+    assert response.status_code == 200, response.get_json()
+    return [product['id'] for product in response.get_json()['products']]
+
+def test_products_from_a_paused_fanout_reach_every_follower(app, users, monkeypatch):
+    monkeypatch.setattr(feed, 'FANOUT_FOLLOWER_LIMIT', 2)
+    monkeypatch.setattr(feed, 'FANOUT_RESUME_LIMIT', 1)
+    others = register_marketers(app, 3)
+    before = create_product(users, 'قبل')
+
+    for client in others:
+        assert client.post('/api/follows/merchants/2').status_code == 201
+    # المسوق يتابع أثناء التوقف، والمنتج الجديد لا يُنسخ لأحد
+    assert users['marketer'].post('/api/follows/merchants/2').status_code == 201
+    during = create_product(users, 'أثناء')
+    assert feed_ids(users['marketer']) == [during, before]
+
+    for client in others:
+        assert client.delete('/api/follows/merchants/2').status_code == 200
+    with app.app_context():
+        assert db.session.query(UserProfile.fanout_paused_at).filter_by(user_id=2).scalar() is None
+        entries = {product_id for (product_id,) in db.session.query(FeedEntry.product_id).filter_by(marketer_id=3)}
+    assert entries == {before, during}
+
+    after = create_product(users, 'بعد')
+    assert feed_ids(users['marketer']) == [after, during, before]
+
+def test_duplicate_follow_is_idempotent(app, users, monkeypatch):
+    assert users['marketer'].post('/api/follows/merchants/2').status_code == 201
+    assert users['marketer'].post('/api/follows/merchants/2').status_code == 200
+
+    assert users['marketer'].delete('/api/follows/merchants/2').status_code == 200
+    count_follower = feed.count_follower
+
+    def follow_concurrently(merchant_id, delta):
+        # طلب آخر يحفظ نفس المتابعة بين التحقق والإضافة
+        with db.engine.begin() as connection:
+            connection.execute(MerchantFollow.__table__.insert(), {'marketer_id': 3, 'merchant_id': merchant_id})
+        count_follower(merchant_id, delta)
+
+    monkeypatch.setattr(feed, 'count_follower', follow_concurrently)
+    response = users['marketer'].post('/api/follows/merchants/2')
+    assert response.status_code == 200, response.get_json()
+    with app.app_context():
+        assert MerchantFollow.query.filter_by(marketer_id=3, merchant_id=2).count() == 1
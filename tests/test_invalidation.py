@@ -0,0 +1,82 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+from conftest import login
+from src.models.user import db, Product
+from src.utils import invalidation
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def run_worker(db_path, script):
+    # عملية مستقلة على نفس قاعدة البيانات، كعامل آخر خلف موازن الأحمال أو أمر cron
+    code = textwrap.dedent(f"""
+        import sys
+        sys.path.insert(0, {TESTS_DIR!r})
+        from conftest import create_app, login
+        app = create_app({str(db_path)!r})
+    """) + textwrap.dedent(script)
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    return result.stdout.strip().splitlines()
+
+@pytest.fixture
+def no_sync_delay(monkeypatch):
+    monkeypatch.setattr(invalidation, 'SYNC_INTERVAL', 0)
+
+def test_catalog_etag_is_shared_and_follows_other_processes(app, users, tmp_path, no_sync_delay):
+    response = users['merchant'].post('/api/products/create', json={
+        'name': 'منتج', 'description': 'وصف', 'base_price': 10, 'min_marketer_profit': 1
+    })
+    product_id = response.get_json()['product']['id']
+
+    response = users['marketer'].get('/api/products/active')
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+
+    # عامل آخر يعطي نفس ETag، ثم يغير السعر
+    worker_etag, changed_etag = run_worker(tmp_path / 'app.db', f"""
+        marketer = login(app, 'marketer@test.com')
+        print(marketer.get('/api/products/active').headers['ETag'])
+        merchant = login(app, 'merchant@test.com')
+        assert merchant.put('/api/products/bulk-price', json={{'mode': 'amount', 'value': 5}}).status_code == 200
+        print(marketer.get('/api/products/active').headers['ETag'])
+    """)
+    assert worker_etag == etag
+    assert changed_etag != etag
+
+    # هذه العملية تلحق بالتغيير من السجل: لا 304 للنسخة القديمة، ونفس ETag الجديد
+    response = users['marketer'].get('/api/products/active', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] == changed_etag
+    assert response.get_json()['products'][0]['base_price'] == 15
+    response = users['marketer'].get(f'/api/products/{product_id}')
+    assert response.get_json()['product']['base_price'] == 15
+    assert users['marketer'].get('/api/products/active', headers={'If-None-Match': changed_etag}).status_code == 304
+
+def test_expired_merchant_disappears_from_other_processes(app, users, tmp_path, no_sync_delay):
+    users['merchant'].post('/api/products/create', json={
+        'name': 'منتج', 'description': 'وصف', 'base_price': 10, 'min_marketer_profit': 1
+    })
+    assert len(users['marketer'].get('/api/products/active').get_json()['products']) == 1
+
+    # مهمة انتهاء الاشتراكات تعمل كأمر مستقل
+    run_worker(tmp_path / 'app.db', """
+        from datetime import datetime, timedelta
+        from src.models.user import db, UserProfile
+        from src.utils.subscriptions import run_subscription_jobs
+        with app.app_context():
+            UserProfile.query.filter_by(user_id=2).update({'subscription_expiry': datetime.utcnow() - timedelta(days=1)})
+            db.session.commit()
+            run_subscription_jobs()
+    """)
+
+    assert users['marketer'].get('/api/products/active').get_json()['products'] == []
+    # بيانات التاجر المخزنة في هذه العملية أُبطلت أيضاً
+    response = users['merchant'].post('/api/products/create', json={
+        'name': 'منتج', 'description': 'وصف', 'base_price': 10, 'min_marketer_profit': 1
+    })
+    assert response.status_code == 403
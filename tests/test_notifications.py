@@ -0,0 +1,79 @@
+from sqlalchemy import text
+
+from src.models.user import db, NotificationCounter
+from src.utils.notifications import ensure_unread_counters, repair_unread_counters
+
+def unread(client):
+    response = client.get('/api/notifications/unread-count')
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()['unread_count']
+
+def notification_ids(client, unread_only=False):
+    response = client.get('/api/notifications/', query_string={'unread_only': 'true' if unread_only else ''})
+    assert response.status_code == 200, response.get_json()
+    return [notification['id'] for notification in response.get_json()['notifications']]
+
+def counters(app):
+    with app.app_context():
+        # صف بعداد صفر يساوي عدم وجود الصف
+        return {row.user_id: row.unread_count for row in NotificationCounter.query.all() if row.unread_count}
+
+def broadcast(users, title, user_type):
+    response = users['admin'].post('/api/admin/broadcast', json={'title': title, 'message': 'نص', 'user_type': user_type})
+    assert response.status_code == 200, response.get_json()
+
+def test_unread_counter_follows_every_write_path(app, users):
+    marketer = users['marketer']
+    start = unread(marketer)
+    assert start == len(notification_ids(marketer, unread_only=True))
+
+    for index in range(4):
+        broadcast(users, f'تنبيه {index}', 'marketer')
+    assert unread(marketer) == start + 4
+    first, second, third, fourth = notification_ids(marketer, unread_only=True)[:4]
+
+    assert marketer.put(f'/api/notifications/{first}/mark-read').status_code == 200
+    # تحديد إشعار مقروء مرة ثانية لا ينقص العداد
+    assert marketer.put(f'/api/notifications/{first}/mark-read').status_code == 200
+    assert unread(marketer) == start + 3
+
+    response = marketer.put('/api/notifications/mark-read', json={'ids': [first, second]})
+    assert (response.get_json()['updated'], response.get_json()['unread_count']) == (1, start + 2)
+
+    # حذف إشعار مقروء لا يغير العداد، وحذف غير المقروء ينقصه
+    assert marketer.delete(f'/api/notifications/{first}').status_code == 200
+    assert unread(marketer) == start + 2
+    assert marketer.delete(f'/api/notifications/{third}').status_code == 200
+    assert unread(marketer) == start + 1
+
+    # إشعارات أي مستخدم آخر لا تُعد له
+    assert users['merchant'].put(f'/api/notifications/{fourth}/mark-read').status_code == 403
+    assert unread(marketer) == start + 1
+
+    assert marketer.put('/api/notifications/mark-all-read').status_code == 200
+    assert unread(marketer) == 0
+    broadcast(users, 'جديد', 'all')
+    assert unread(marketer) == 1
+    assert marketer.delete('/api/notifications/clear-all').status_code == 200
+    assert unread(marketer) == 0
+
+    maintained = counters(app)
+    with app.app_context():
+        repair_unread_counters()
+    assert counters(app) == maintained
+
+def test_ensure_unread_counters_restores_triggers_on_older_databases(app, users):
+    broadcast(users, 'قديم', 'all')
+    expected = counters(app)
+    with app.app_context():
+        # قاعدة بيانات أُنشئ جدول إشعاراتها قبل المشغلات والعدادات
+        for name in ('insert', 'update', 'delete'):
+            db.session.execute(text(f'DROP TRIGGER trg_notifications_unread_{name}'))
+        db.session.execute(text('DELETE FROM notification_counters'))
+        db.session.commit()
+
+        ensure_unread_counters()
+    assert counters(app) == expected
+
+    broadcast(users, 'بعد', 'marketer')
+    assert unread(users['marketer']) == expected[3] + 1
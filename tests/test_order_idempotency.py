@@ -0,0 +1,80 @@
+from conftest import login
+from src.models.user import Order
+from src.routes import orders
+
+def create_product(users):
+    response = users['merchant'].post('/api/products/create', json={
+        'name': 'منتج', 'description': 'وصف', 'base_price': 10, 'min_marketer_profit': 1
+    })
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()['product']['id']
+
+def order_line(product_id, **fields):
+    line = {'product_id': product_id, 'customer_name': 'زبون', 'customer_phone': '07701234567',
+            'sale_price': 15, 'quantity': 1}
+    line.update(fields)
+    return line
+
+def order_count(app):
+    with app.app_context():
+        return Order.query.count()
+
+def test_create_retries_with_the_same_key_return_the_original_order(app, users):
+    product_id = create_product(users)
+    first = users['marketer'].post('/api/orders/create', json=order_line(product_id), headers={'Idempotency-Key': 'k1'})
+    assert first.status_code == 201, first.get_json()
+    retry = users['marketer'].post('/api/orders/create', json=order_line(product_id), headers={'Idempotency-Key': 'k1'})
+    assert retry.get_json()['order_id'] == first.get_json()['order_id']
+
+    body_key = users['marketer'].post('/api/orders/create', json=order_line(product_id, idempotency_key='k1'))
+    assert body_key.get_json()['order_id'] == first.get_json()['order_id']
+    assert order_count(app) == 1
+
+    # المفتاح خاص بكل مسوق
+    client = app.test_client()
+    assert client.post('/api/auth/register', json={'email': 'other@test.com', 'name': 'مسوق', 'user_type': 'marketer'}).status_code == 201
+    assert users['admin'].put('/api/admin/users/4/subscription', json={'status': 'active'}).status_code == 200
+    other = login(app, 'other@test.com').post('/api/orders/create', json=order_line(product_id), headers={'Idempotency-Key': 'k1'})
+    assert other.status_code == 201
+    assert other.get_json()['order_id'] != first.get_json()['order_id']
+
+    bad_key = users['marketer'].post('/api/orders/create', json=order_line(product_id), headers={'Idempotency-Key': 'x' * 101})
+    assert bad_key.status_code == 400
+    assert order_count(app) == 2
+
+def test_concurrent_create_with_the_same_key_returns_the_saved_order(app, users, monkeypatch):
+    product_id = create_product(users)
+    get_reputation = orders.get_reputation
+    concurrent = {}
+
+    def create_concurrently(phone):
+        # طلب آخر بنفس المفتاح يُحفظ بين البحث عن المفتاح وحفظ هذا الطلب
+        if 'response' not in concurrent:
+            concurrent['response'] = None
+            concurrent['response'] = users['marketer'].post('/api/orders/create', json=order_line(product_id),
+                                                            headers={'Idempotency-Key': 'race'})
+        return get_reputation(phone)
+
+    monkeypatch.setattr(orders, 'get_reputation', create_concurrently)
+    response = users['marketer'].post('/api/orders/create', json=order_line(product_id), headers={'Idempotency-Key': 'race'})
+    assert response.status_code == 201, response.get_json()
+    assert concurrent['response'].status_code == 201
+    assert response.get_json()['order_id'] == concurrent['response'].get_json()['order_id']
+    assert order_count(app) == 1
+
+def test_batch_retries_skip_created_lines(app, users):
+    product_id = create_product(users)
+    lines = [order_line(product_id), order_line(product_id, idempotency_key='own'),
+             order_line(product_id, idempotency_key='own'), order_line(product_id, quantity=0)]
+    first = users['marketer'].post('/api/orders/batch', json={'orders': lines, 'idempotency_key': 'batch-1'})
+    assert first.status_code == 201, first.get_json()
+    results = first.get_json()['results']
+    assert first.get_json()['created'] == 2
+    assert results[1]['order_id'] == results[2]['order_id']
+    assert 'error' in results[3]
+
+    retry = users['marketer'].post('/api/orders/batch', json={'orders': lines, 'idempotency_key': 'batch-1'})
+    assert retry.get_json()['created'] == 0
+    assert [result.get('order_id') for result in retry.get_json()['results'][:3]] == [result['order_id'] for result in results[:3]]
+    assert {result.get('status') for result in retry.get_json()['results'][:3]} == {'duplicate'}
+    assert order_count(app) == 2
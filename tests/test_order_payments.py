@@ -0,0 +1,94 @@
+import threading
+from collections import Counter
+
+from conftest import login, create_completed_orders
+from src.models.user import db, Order, OrderStats, MarketerDebt, UserProfile, Product, RankRefresh, CacheInvalidation, PaymentStatus
+from src.utils.order_flow import MARKETER_VERIFY_THRESHOLD, MERCHANT_VERIFY_THRESHOLD
+from src.utils.ranking import refresh_queued_scores, refresh_all_scores
+
+ORDERS = 24
+THREADS = 8
+MARKETER_PROFIT = 5.0
+
+def test_concurrent_payment_confirmations_lose_no_updates(app, users):
+    order_ids = create_completed_orders(users, ORDERS, MARKETER_PROFIT)
+
+    # تحميل ملخص الإحصائيات قبل التأكيد حتى تُختبر التحديثات التدريجية لا إعادة البناء
+    assert users['marketer'].get('/api/orders/marketer/stats').get_json()['pending_profit'] == ORDERS * MARKETER_PROFIT
+    assert users['merchant'].get('/api/orders/merchant/stats').get_json()['total_owed_to_marketers'] == ORDERS * MARKETER_PROFIT
+
+    codes = Counter()
+    codes_lock = threading.Lock()
+    start = threading.Barrier(THREADS)
+
+    def confirm(chunk):
+        client = login(app, 'marketer@test.com')
+        start.wait()
+        # كل خيط يعيد تأكيد أول طلبين له، والتأكيد المكرر يجب ألا يزيد العداد
+        for order_id in chunk + chunk[:2]:
+            status_code = client.put(f'/api/orders/{order_id}/confirm-payment').status_code
+            with codes_lock:
+                codes[status_code] += 1
+
+    threads = [threading.Thread(target=confirm, args=(order_ids[index::THREADS],)) for index in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert codes[200] == ORDERS
+    assert codes[400] + codes[409] == THREADS * 2
+    assert set(codes) <= {200, 400, 409}
+
+    with app.app_context():
+        assert Order.query.filter(Order.payment_status == PaymentStatus.PAID).count() == ORDERS
+
+        profiles = {profile.user_id: profile for profile in UserProfile.query.filter(UserProfile.user_id.in_([2, 3]))}
+        merchant, marketer = profiles[2], profiles[3]
+        assert merchant.completed_orders == ORDERS
+        assert marketer.completed_orders == ORDERS
+        assert ORDERS >= max(MARKETER_VERIFY_THRESHOLD, MERCHANT_VERIFY_THRESHOLD)
+        assert merchant.is_verified and marketer.is_verified
+
+        stats = {(row.user_id, row.role): row for row in OrderStats.query}
+        assert stats[(3, 'marketer')].completed_orders == ORDERS
+        assert stats[(3, 'marketer')].paid_profit == ORDERS * MARKETER_PROFIT
+        assert stats[(3, 'marketer')].pending_profit == 0
+        assert stats[(2, 'merchant')].completed_orders == ORDERS
+        assert db.session.query(MarketerDebt.amount).filter_by(merchant_id=2, marketer_id=3).scalar() == 0
+
+    response = users['marketer'].get('/api/orders/marketer/stats').get_json()
+    assert response['completed_orders'] == ORDERS
+    assert response['total_profit'] == ORDERS * MARKETER_PROFIT
+    assert response['pending_profit'] == 0
+    assert users['merchant'].get('/api/orders/merchant/stats').get_json()['marketer_debts'] == {}
+
+def test_payment_confirmation_defers_rescoring_and_catalog_refresh(app, users):
+    order_ids = create_completed_orders(users, MERCHANT_VERIFY_THRESHOLD + 1, MARKETER_PROFIT)
+
+    def published():
+        with app.app_context():
+            return CacheInvalidation.query.filter_by(scope='merchant', target_id=2).count()
+
+    with app.app_context():
+        product_id = db.session.get(Order, order_ids[0]).product_id
+        score_before = db.session.get(Product, product_id).rank_score
+
+    # التأكيد لا يعيد تحميل منتجات التاجر إلا عند تجاوز حد توثيقه
+    for index, order_id in enumerate(order_ids, 1):
+        before = published()
+        assert users['marketer'].put(f'/api/orders/{order_id}/confirm-payment').status_code == 200
+        assert published() - before == (1 if index == MERCHANT_VERIFY_THRESHOLD else 0)
+
+    with app.app_context():
+        assert db.session.get(Product, product_id).rank_score == score_before
+        assert {(row.scope, row.target_id) for row in RankRefresh.query} == {('product', product_id), ('merchant', 2)}
+
+        assert refresh_queued_scores() == 1
+        assert RankRefresh.query.count() == 0
+        score = db.session.get(Product, product_id).rank_score
+        assert score > score_before
+
+        # الطابور يوصل لنفس الدرجة التي تحسبها إعادة البناء الكاملة
+        refresh_all_scores()
+        assert db.session.get(Product, product_id).rank_score == score
@@ -0,0 +1,37 @@
+from conftest import create_completed_orders
+from src.utils.order_stats import reset_order_stats
+
+def stats(users):
+    merchant = users['merchant'].get('/api/orders/merchant/stats')
+    marketer = users['marketer'].get('/api/orders/marketer/stats')
+    assert merchant.status_code == 200 and marketer.status_code == 200
+    return merchant.get_json(), marketer.get_json()
+
+def test_incremental_rollups_match_a_rebuild_from_orders(app, users):
+    # قراءة أولى تنشئ الملخصات، فكل ما بعدها يُطبَّق عليها تدريجياً
+    merchant, marketer = stats(users)
+    assert (merchant['total_orders'], marketer['total_orders']) == (0, 0)
+
+    completed = create_completed_orders(users, 4, profit=5.0)
+    product_id = users['merchant'].get('/api/products/my-products').get_json()['products'][0]['id']
+    line = {'product_id': product_id, 'customer_name': 'زبون', 'customer_phone': '07701234567',
+            'sale_price': 12, 'quantity': 1}
+    response = users['marketer'].post('/api/orders/batch', json={'orders': [line] * 3})
+    assert response.status_code == 201, response.get_json()
+    rejected, not_serious, _ = [result['order_id'] for result in response.get_json()['results']]
+
+    assert users['merchant'].put(f'/api/orders/{rejected}/status', json={'status': 'rejected'}).status_code == 200
+    assert users['merchant'].put(f'/api/orders/{not_serious}/status', json={'status': 'not_serious'}).status_code == 200
+    assert users['marketer'].put(f'/api/orders/{completed[0]}/report-delay').status_code == 200
+    assert users['marketer'].put(f'/api/orders/{completed[0]}/confirm-payment').status_code == 200
+    assert users['marketer'].put(f'/api/orders/{completed[1]}/confirm-payment').status_code == 200
+
+    merchant, marketer = stats(users)
+    assert (merchant['total_orders'], merchant['completed_orders']) == (7, 4)
+    assert merchant['total_owed_to_marketers'] == 10.0
+    assert merchant['marketer_debts'] == {'3': 10.0}
+    assert (marketer['total_profit'], marketer['pending_profit']) == (10.0, 10.0)
+
+    with app.app_context():
+        assert reset_order_stats() == 2
+    assert stats(users) == (merchant, marketer)
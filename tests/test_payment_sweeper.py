@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta
+
+from conftest import create_completed_orders
+from src.models.user import Order, PaymentStatus
+from src.utils.payments import sweep_overdue_payments
+from src.utils.order_stats import reset_order_stats
+
+PROFIT = 5.0
+
+def owed(users):
+    merchant = users['merchant'].get('/api/orders/merchant/stats').get_json()
+    marketer = users['marketer'].get('/api/orders/marketer/stats').get_json()
+    return merchant['total_owed_to_marketers'], merchant['marketer_debts'], marketer['pending_profit']
+
+def test_swept_orders_stay_owed_until_paid(app, users):
+    order_ids = create_completed_orders(users, 3, PROFIT)
+    assert owed(users) == (3 * PROFIT, {'3': 3 * PROFIT}, 3 * PROFIT)
+
+    with app.app_context():
+        assert sweep_overdue_payments(now=datetime.utcnow() + timedelta(days=30)) == 3
+        assert Order.query.filter(Order.payment_status == PaymentStatus.DELAYED).count() == 3
+
+    # الملخص المحدث تدريجياً والمعاد بناؤه من الجدول يتفقان
+    assert owed(users) == (3 * PROFIT, {'3': 3 * PROFIT}, 3 * PROFIT)
+    with app.app_context():
+        reset_order_stats()
+    assert owed(users) == (3 * PROFIT, {'3': 3 * PROFIT}, 3 * PROFIT)
+
+    # دفع طلب متأخر منفرداً ثم تسوية الباقي بدفعة ينقص المستحق بنفس المبلغ
+    assert users['marketer'].put(f'/api/orders/{order_ids[0]}/confirm-payment').status_code == 200
+    assert owed(users) == (2 * PROFIT, {'3': 2 * PROFIT}, 2 * PROFIT)
+
+    response = users['merchant'].post('/api/payouts/', json={})
+    assert response.status_code == 201, response.get_json()
+    batch = response.get_json()['batch']
+    assert batch['orders_count'] == 2 and batch['total_amount'] == 2 * PROFIT
+    assert users['merchant'].put(f"/api/payouts/{batch['id']}/mark-paid").status_code == 200
+    assert owed(users) == (0, {}, 0)
@@ -0,0 +1,71 @@
+import csv
+import io
+
+from conftest import login, create_completed_orders
+from src.models.user import db, Notification, NotificationType, Order, PaymentStatus
+
+def add_marketer_orders(app, users, count, sale_price=17):
+    # مسوق ثانٍ بطلبات مكتملة على منتج التاجر الأول
+    client = app.test_client()
+    assert client.post('/api/auth/register', json={'email': 'other@test.com', 'name': 'مسوق', 'user_type': 'marketer'}).status_code == 201
+    assert users['admin'].put('/api/admin/users/4/subscription', json={'status': 'active'}).status_code == 200
+    marketer = login(app, 'other@test.com')
+
+    product_id = users['merchant'].get('/api/products/my-products').get_json()['products'][0]['id']
+    line = {'product_id': product_id, 'customer_name': 'زبون', 'customer_phone': '07701234567',
+            'sale_price': sale_price, 'quantity': 1}
+    response = marketer.post('/api/orders/batch', json={'orders': [line] * count})
+    assert response.status_code == 201, response.get_json()
+    order_ids = [result['order_id'] for result in response.get_json()['results']]
+    response = users['merchant'].put('/api/orders/bulk-status', json={'order_ids': order_ids, 'status': 'completed'})
+    assert response.status_code == 200, response.get_json()
+    return order_ids
+
+def create_batch(users):
+    response = users['merchant'].post('/api/payouts/', json={})
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()['batch']
+
+def test_payout_batch_lines_export_and_settlement(app, users):
+    own_orders = create_completed_orders(users, 3, profit=5.0)
+    add_marketer_orders(app, users, 2, sale_price=17)
+
+    batch = create_batch(users)
+    assert (batch['orders_count'], batch['marketers_count'], batch['total_amount']) == (5, 2, 29.0)
+    # الطلبات المضافة لدفعة لا تدخل دفعة أخرى
+    assert users['merchant'].post('/api/payouts/', json={}).status_code == 400
+
+    lines = users['merchant'].get(f"/api/payouts/{batch['id']}").get_json()['lines']
+    assert [(line['marketer_id'], line['orders_count'], line['amount']) for line in lines] == [(3, 3, 15.0), (4, 2, 14.0)]
+
+    export = users['merchant'].get(f"/api/payouts/{batch['id']}/export")
+    assert export.status_code == 200
+    rows = list(csv.DictReader(io.StringIO(export.get_data().decode('utf-8-sig'))))
+    assert [(row['marketer_id'], row['orders_count'], float(row['amount'])) for row in rows] == [('3', '3', 15.0), ('4', '2', 14.0)]
+
+    # طلب يؤكد المسوق استلامه منفرداً يخرج من الدفعة وإجمالياتها
+    assert users['marketer'].put(f'/api/orders/{own_orders[0]}/confirm-payment').status_code == 200
+    batch = users['merchant'].get(f"/api/payouts/{batch['id']}").get_json()['batch']
+    assert (batch['orders_count'], batch['marketers_count'], batch['total_amount']) == (4, 2, 24.0)
+
+    assert users['marketer'].put(f"/api/payouts/{batch['id']}/mark-paid").status_code == 403
+    response = users['merchant'].put(f"/api/payouts/{batch['id']}/mark-paid")
+    assert response.status_code == 200, response.get_json()
+    assert (response.get_json()['orders_paid'], response.get_json()['amount_paid']) == (4, 24.0)
+    assert users['merchant'].put(f"/api/payouts/{batch['id']}/mark-paid").status_code == 400
+    assert users['merchant'].delete(f"/api/payouts/{batch['id']}").status_code == 400
+
+    with app.app_context():
+        assert Order.query.filter(Order.payment_status != PaymentStatus.PAID).count() == 0
+        notified = db.session.query(Notification.user_id).filter_by(type=NotificationType.PAYMENT).all()
+        assert sorted(user_id for (user_id,) in notified) == [3, 4]
+
+def test_cancelled_batch_releases_its_orders(app, users):
+    create_completed_orders(users, 2, profit=5.0)
+    batch = create_batch(users)
+
+    assert users['merchant'].delete(f"/api/payouts/{batch['id']}").status_code == 200
+    assert users['merchant'].get(f"/api/payouts/{batch['id']}").status_code == 404
+
+    batch = create_batch(users)
+    assert (batch['orders_count'], batch['total_amount']) == (2, 10.0)
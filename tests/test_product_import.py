@@ -0,0 +1,64 @@
+import json
+
+from src.models.user import db, Product
+
+def import_ndjson(client, rows):
+    body = '\n'.join(row if isinstance(row, str) else json.dumps(row) for row in rows)
+    return client.post('/api/products/import?format=ndjson', data=body.encode('utf-8'), content_type='application/x-ndjson')
+
+def test_import_reports_bad_rows_and_keeps_omitted_columns(app, users):
+    merchant = users['merchant']
+    response = import_ndjson(merchant, [
+        {'sku': 'A1', 'name': 'أ', 'description': 'وصف', 'base_price': 10, 'min_marketer_profit': 2,
+         'suggested_price': 20, 'category': 'ملابس'},
+        {'sku': 'A2', 'name': 123, 'description': 'وصف', 'base_price': 10, 'min_marketer_profit': 2},
+        {'sku': ['A3'], 'name': 'ج', 'description': 'وصف', 'base_price': 10, 'min_marketer_profit': 2},
+        'not json',
+    ])
+    assert response.status_code == 200, response.get_json()
+    body = response.get_json()
+    assert (body['created'], body['updated'], body['failed']) == (1, 0, 3)
+    assert [result['status'] for result in body['results']] == ['created', 'error', 'error', 'error']
+
+    # تحديث السعر وحده لا يمحو السعر المقترح والتصنيف المحفوظين، ويُتحقق منه مقابلهما
+    response = import_ndjson(merchant, [
+        {'sku': 'A1', 'name': 'أ', 'description': 'وصف', 'base_price': 12, 'min_marketer_profit': 2},
+        {'sku': 'A1', 'name': 'أ', 'description': 'وصف', 'base_price': 19, 'min_marketer_profit': 2},
+    ])
+    body = response.get_json()
+    assert (body['updated'], body['failed']) == (1, 1), body
+    with app.app_context():
+        product = Product.query.filter_by(sku='A1').one()
+        assert (product.base_price, product.suggested_price, product.category) == (12, 20, 'ملابس')
+
+def test_bulk_price_validates_input_and_reports_skipped(app, users):
+    merchant = users['merchant']
+    ids = []
+    for suggested in (None, 13):
+        response = merchant.post('/api/products/create', json={
+            'name': 'منتج', 'description': 'وصف', 'base_price': 10, 'min_marketer_profit': 2, 'suggested_price': suggested
+        })
+        ids.append(response.get_json()['product']['id'])
+
+    for payload in [
+        {'mode': 'amount', 'value': None},
+        {'mode': 'amount', 'value': 'abc'},
+        {'mode': 'amount', 'value': True},
+        {'mode': 'amount', 'value': 1, 'category': 5},
+        {'mode': 'amount', 'value': 1, 'product_ids': 'x'},
+        {'mode': 'amount', 'value': 1, 'product_ids': [None]},
+        {'mode': 'amount', 'value': 1, 'skus': [1]},
+        {'mode': 'other', 'value': 1},
+    ]:
+        assert merchant.put('/api/products/bulk-price', json=payload).status_code == 400, payload
+
+    # المنتج الثاني يخالف السعر المقترح بعد الزيادة فيُعاد في skipped
+    response = merchant.put('/api/products/bulk-price', json={'mode': 'amount', 'value': 2, 'product_ids': ids})
+    assert response.status_code == 200, response.get_json()
+    assert response.get_json()['updated'] == 1
+    assert response.get_json()['skipped'] == [ids[1]]
+    with app.app_context():
+        assert [db.session.get(Product, product_id).base_price for product_id in ids] == [12, 10]
+
+    assert users['admin'].put('/api/admin/users/2/subscription', json={'status': 'inactive'}).status_code == 200
+    assert merchant.put('/api/products/bulk-price', json={'mode': 'amount', 'value': 1}).status_code == 403
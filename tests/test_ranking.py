@@ -0,0 +1,45 @@
+from conftest import create_completed_orders
+from src.models.user import db, Product
+from src.utils.order_flow import MERCHANT_VERIFY_THRESHOLD
+from src.utils.ranking import refresh_queued_scores, refresh_all_scores
+
+def scores(app):
+    with app.app_context():
+        return {product.id: product.rank_score for product in Product.query.order_by(Product.id)}
+
+def create_product(users):
+    response = users['merchant'].post('/api/products/create', json={
+        'name': 'منتج', 'description': 'وصف', 'base_price': 10, 'min_marketer_profit': 1
+    })
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()['product']['id']
+
+def test_admin_verification_rescores_all_merchant_products(app, users):
+    first, second = create_product(users), create_product(users)
+    before = scores(app)
+
+    assert users['admin'].put('/api/admin/users/2/verify').status_code == 200
+    after = scores(app)
+    assert after[first] > before[first] and after[second] > before[second]
+
+    with app.app_context():
+        refresh_all_scores()
+    assert scores(app) == after
+
+def test_completed_orders_rescore_the_merchants_other_products(app, users):
+    idle_product = create_product(users)
+    order_ids = create_completed_orders(users, MERCHANT_VERIFY_THRESHOLD - 1)
+    before = scores(app)
+
+    for order_id in order_ids:
+        assert users['marketer'].put(f'/api/orders/{order_id}/confirm-payment').status_code == 200
+    with app.app_context():
+        refresh_queued_scores()
+    after = scores(app)
+
+    # المنتج الذي لا طلبات عليه يرتفع أيضاً لأن عدد طلبات تاجره المكتملة زاد
+    assert after[idle_product] > before[idle_product]
+    with app.app_context():
+        refresh_all_scores()
+        db.session.commit()
+    assert scores(app) == after
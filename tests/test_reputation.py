@@ -0,0 +1,42 @@
+from src.models.user import CustomerReputation
+from src.utils.reputation import normalize_phone, rebuild_reputations
+
+def test_normalize_phone_folds_formats_to_the_local_number():
+    for phone in ('07701234567', '+964 770 123 4567', '00964-770-1234567', '٠٧٧٠١٢٣٤٥٦٧', '۰۷۷۰۱۲۳۴۵۶۷'):
+        assert normalize_phone(phone) == '07701234567', phone
+    assert normalize_phone('') is None
+    assert normalize_phone(None) is None
+
+def test_reputation_is_shared_across_phone_formats(app, users):
+    response = users['merchant'].post('/api/products/create', json={
+        'name': 'منتج', 'description': 'وصف', 'base_price': 10, 'min_marketer_profit': 1
+    })
+    assert response.status_code == 201, response.get_json()
+    product_id = response.get_json()['product']['id']
+
+    def order(phone):
+        return {'product_id': product_id, 'customer_name': 'زبون', 'customer_phone': phone, 'sale_price': 15, 'quantity': 1}
+
+    response = users['marketer'].post('/api/orders/batch', json={
+        'orders': [order('07701234567'), order('+964 770 123 4567'), order('٠٧٧٠١٢٣٤٥٦٧')]
+    })
+    assert response.status_code == 201, response.get_json()
+    rejected, not_serious, completed = [result['order_id'] for result in response.get_json()['results']]
+    assert users['merchant'].put(f'/api/orders/{rejected}/status', json={'status': 'rejected'}).status_code == 200
+    assert users['merchant'].put(f'/api/orders/{not_serious}/status', json={'status': 'not_serious'}).status_code == 200
+    assert users['merchant'].put(f'/api/orders/{completed}/status', json={'status': 'completed'}).status_code == 200
+
+    response = users['marketer'].post('/api/orders/create', json=order('00964-770-1234567'))
+    assert response.status_code == 201, response.get_json()
+    assert response.get_json()['customer_reputation'] == {
+        'total_orders': 3, 'completed_orders': 1, 'rejected_orders': 1, 'not_serious_orders': 1, 'is_risky': True
+    }
+
+    # السجل المحدث تدريجياً يطابق إعادة بنائه من الطلبات
+    with app.app_context():
+        incremental = [(row.phone, row.total_orders, row.completed_orders, row.rejected_orders, row.not_serious_orders)
+                       for row in CustomerReputation.query.all()]
+        rebuild_reputations()
+        rebuilt = [(row.phone, row.total_orders, row.completed_orders, row.rejected_orders, row.not_serious_orders)
+                   for row in CustomerReputation.query.all()]
+    assert incremental == rebuilt == [('07701234567', 4, 1, 1, 1)]
@@ -0,0 +1,52 @@
+from src.utils.search import normalize_arabic
+
+def create_product(users, **fields):
+    data = {'name': 'منتج', 'description': 'وصف', 'base_price': 10, 'min_marketer_profit': 1}
+    data.update(fields)
+    response = users['merchant'].post('/api/products/create', json=data)
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()['product']['id']
+
+def search(users, query):
+    response = users['marketer'].get('/api/products/search', query_string={'q': query})
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()['products']
+
+def test_normalize_arabic_folds_letter_variants_and_diacritics():
+    assert normalize_arabic('أَحْمَــد') == 'احمد'
+    assert normalize_arabic('إيمان آمنة') == 'ايمان امنه'
+    assert normalize_arabic('مستشفى مؤسسة') == 'مستشفي موسسه'
+    assert normalize_arabic(None) == ''
+
+def test_search_matches_spelling_variants_and_marks_the_original_text(app, users):
+    coffee = create_product(users, name='قهوة عربية أصلية', description='بن محمص طازج', category='مشروبات')
+    create_product(users, name='عطر الورد', description='زجاجة عطر فاخرة', category='عطور')
+
+    for query in ('قهوه اصليه', 'قَهْوَة', 'اصل', 'قهو'):
+        products = search(users, query)
+        assert [product['id'] for product in products] == [coffee], query
+
+    snippet = search(users, 'قهوه')[0]['snippet']
+    assert '[قهوة]' in snippet
+    assert [product['name'] for product in search(users, 'عطر')] == ['عطر الورد']
+
+def test_search_index_follows_product_changes(app, users):
+    product_id = create_product(users, name='ساعة يد', description='ساعة جلدية')
+    assert len(search(users, 'ساعه')) == 1
+
+    assert users['merchant'].put(f'/api/products/{product_id}/toggle-status').status_code == 200
+    assert search(users, 'ساعه') == []
+    assert users['merchant'].put(f'/api/products/{product_id}/toggle-status').status_code == 200
+    assert len(search(users, 'ساعه')) == 1
+
+    response = users['merchant'].put(f'/api/products/{product_id}', json={'name': 'نظارة شمسية', 'description': 'نظارة'})
+    assert response.status_code == 200, response.get_json()
+    assert search(users, 'ساعه') == []
+    assert len(search(users, 'نظاره')) == 1
+
+    assert users['merchant'].delete(f'/api/products/{product_id}').status_code == 200
+    assert search(users, 'نظاره') == []
+
+def test_search_rejects_empty_queries_and_non_marketers(app, users):
+    assert users['marketer'].get('/api/products/search', query_string={'q': ' ؟ '}).status_code == 400
+    assert users['merchant'].get('/api/products/search', query_string={'q': 'قهوة'}).status_code == 403
@@ -0,0 +1,86 @@
+import importlib
+import os
+import shutil
+import sys
+
+import pytest
+from sqlalchemy import text
+
+from src.models.user import db, User
+from src.utils.schema import ensure_schema
+
+SHIPPED_DB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'database', 'app.db')
+
+def boot_main(path, monkeypatch):
+    # تشغيل main.py الفعلي على قاعدة البيانات المعطاة
+    monkeypatch.setenv('DATABASE_URL', f'sqlite:///{path}')
+    sys.modules.pop('src.main', None)
+    return importlib.import_module('src.main')
+
+@pytest.fixture
+def main_module(tmp_path, monkeypatch):
+    module = boot_main(tmp_path / 'app.db', monkeypatch)
+
+    yield module
+
+    sys.modules.pop('src.main', None)
+    with module.app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+@pytest.fixture
+def shipped_main_module(tmp_path, monkeypatch):
+    # نسخة من قاعدة البيانات المرفقة بجداولها القديمة
+    shutil.copy(SHIPPED_DB, tmp_path / 'app.db')
+    module = boot_main(tmp_path / 'app.db', monkeypatch)
+
+    yield module
+
+    sys.modules.pop('src.main', None)
+    with module.app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+def test_main_boots_and_serves_requests(main_module):
+    app = main_module.app
+    with app.app_context():
+        names = {row[0] for row in db.session.execute(text("SELECT name FROM sqlite_master"))}
+    assert {'products_fts', 'trg_notifications_unread_insert', 'customer_reputations'} <= names
+
+    client = app.test_client()
+    assert client.get('/api/health').status_code == 200
+    response = client.post('/api/auth/register', json={'email': 'admin@test.com', 'name': 'admin', 'user_type': 'admin'})
+    assert response.status_code == 201, response.get_json()
+    assert client.post('/api/auth/login', json={'email': 'admin@test.com'}).status_code == 200
+    assert client.get('/api/admin/dashboard').status_code == 200
+
+def test_main_upgrades_an_existing_database(shipped_main_module):
+    app = shipped_main_module.app
+    with app.app_context():
+        columns = {(row[0], row[1]) for row in db.session.execute(text(
+            "SELECT m.name, p.name FROM sqlite_master m JOIN pragma_table_info(m.name) p WHERE m.type = 'table'"
+        ))}
+        indexes = {row[0] for row in db.session.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'"))}
+    assert {('products', 'sku'), ('products', 'rank_score'), ('orders', 'idempotency_key'),
+            ('orders', 'payout_batch_id'), ('user_profiles', 'followers_count')} <= columns
+    assert {'ix_products_merchant_sku', 'ix_orders_payout_batch', 'ix_user_profiles_subscription_expiry'} <= indexes
+
+    client = app.test_client()
+    for email, user_type in [('admin@new.com', 'admin'), ('merchant@new.com', 'merchant')]:
+        response = client.post('/api/auth/register', json={'email': email, 'name': user_type, 'user_type': user_type})
+        assert response.status_code == 201, response.get_json()
+    with app.app_context():
+        merchant_id = User.query.filter_by(email='merchant@new.com').one().id
+
+    assert client.post('/api/auth/login', json={'email': 'admin@new.com'}).status_code == 200
+    assert client.put(f'/api/admin/users/{merchant_id}/subscription', json={'status': 'active'}).status_code == 200
+    assert client.post('/api/auth/login', json={'email': 'merchant@new.com'}).status_code == 200
+    response = client.post('/api/products/create', json={
+        'name': 'منتج', 'description': 'وصف', 'base_price': 10, 'min_marketer_profit': 1, 'sku': 'S1'
+    })
+    assert response.status_code == 201, response.get_json()
+    assert client.get('/api/products/my-products').status_code == 200
+
+    # التشغيل مرة ثانية لا يضيف شيئاً
+    with app.app_context():
+        assert ensure_schema() == []
@@ -0,0 +1,48 @@
+import io
+import json
+
+from conftest import login
+from src.models.user import User, UserProfile, UserType
+
+def test_user_import_creates_valid_rows_and_reports_the_rest(app, users):
+    body = '\n'.join([
+        json.dumps({'email': 'New.Merchant@Test.com', 'name': 'تاجر جديد', 'user_type': 'merchant', 'business_name': 'متجر'}),
+        json.dumps({'email': 'marketer2@test.com', 'name': 'مسوق', 'user_type': 'marketer', 'phone': '07701234567'}),
+        json.dumps({'email': 'marketer@test.com', 'name': 'مكرر', 'user_type': 'marketer'}),
+        json.dumps({'email': 'marketer2@test.com', 'name': 'مكرر', 'user_type': 'marketer'}),
+        json.dumps({'email': 'boss@test.com', 'name': 'مدير', 'user_type': 'admin'}),
+        json.dumps({'email': 'bad', 'name': 'خطأ', 'user_type': 'marketer'}),
+        json.dumps({'email': 'numeric-name@test.com', 'name': 12, 'user_type': 'marketer'}),
+        '[1, 2]',
+    ])
+    response = users['admin'].post('/api/admin/users/import?format=ndjson', data=body.encode('utf-8'),
+                                   content_type='application/x-ndjson')
+    assert response.status_code == 200, response.get_json()
+    result = response.get_json()
+    assert result['created'] == 2
+    assert sorted((error['row'], error['email']) for error in result['errors']) == [
+        (3, 'marketer@test.com'), (4, 'marketer2@test.com'), (5, 'boss@test.com'),
+        (6, 'bad'), (7, 'numeric-name@test.com'), (8, None)
+    ]
+
+    with app.app_context():
+        merchant = User.query.filter_by(email='new.merchant@test.com').one()
+        profile = UserProfile.query.filter_by(user_id=merchant.id).one()
+        assert (profile.user_type, profile.business_name) == (UserType.MERCHANT, 'متجر')
+        assert User.query.filter_by(email='marketer2@test.com').one().phone == '07701234567'
+        assert User.query.filter_by(email='boss@test.com').first() is None
+    login(app, 'new.merchant@test.com')
+
+def test_user_import_reads_csv_uploads_and_requires_an_admin(app, users):
+    csv_body = 'email,name,user_type\nfirst@test.com,الأول,marketer\n,بلا بريد,marketer\n'
+    response = users['admin'].post('/api/admin/users/import', data={
+        'file': (io.BytesIO(csv_body.encode('utf-8')), 'users.csv')
+    }, content_type='multipart/form-data')
+    assert response.status_code == 200, response.get_json()
+    result = response.get_json()
+    assert (result['created'], result['failed']) == (1, 1)
+    assert result['errors'][0]['row'] == 3
+
+    response = users['merchant'].post('/api/admin/users/import?format=ndjson', data=b'{}',
+                                      content_type='application/x-ndjson')
+    assert response.status_code == 403
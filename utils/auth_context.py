@@ -0,0 +1,113 @@
+from types import SimpleNamespace
+from flask import jsonify, request, session, g, has_app_context
+from src.models.user import db, User, UserProfile, UserType
+from src.utils.cache import TTLCache
+from src.utils.tokens import verify_access_token, TokenError
+from src.utils import invalidation
+
+# مدة صلاحية بيانات المستخدم المخزنة مؤقتاً (بالثواني)
+AUTH_CACHE_TTL = 30
+
+_auth_cache = TTLCache(ttl_seconds=AUTH_CACHE_TTL)
+
+# نوع سجل الإبطال الخاص ببيانات المستخدم
+USER_SCOPE = 'user'
+
+def _snapshot(instance):
+    return {column.key: getattr(instance, column.key) for column in instance.__table__.columns}
+
+def _load_auth_data(user_id):
+    cached = _auth_cache.get(user_id)
+    if cached is not None:
+        return cached
+
+    # جلب المستخدم والملف الشخصي باستعلام واحد
+    row = db.session.query(User, UserProfile).outerjoin(
+        UserProfile, UserProfile.user_id == User.id
+    ).filter(User.id == user_id).first()
+
+    if not row:
+        return None
+
+    user, profile = row
+    data = {
+        'user': _snapshot(user),
+        'profile': _snapshot(profile) if profile else None
+    }
+    _auth_cache.set(user_id, data)
+    return data
+
+def invalidate_auth_cache(user_id):
+    _auth_cache.delete(user_id)
+    if has_app_context() and g.get('auth_context') and g.auth_context['user'].id == user_id:
+        g.pop('auth_context')
+    # بقية العمليات تحذف نسختها عند مزامنة سجل الإبطال
+    invalidation.publish([(USER_SCOPE, user_id)])
+
+invalidation.on_invalidate(USER_SCOPE, lambda user_id, changed_at: _auth_cache.delete(user_id))
+invalidation.on_reset(_auth_cache.clear)
+
+def _bearer_token():
+    header = request.headers.get('Authorization', '')
+    if header.startswith('Bearer '):
+        return header[len('Bearer '):].strip()
+    return None
+
+def _require_token_auth(token):
+    # الصلاحيات مأخوذة من الرمز الموقّع دون أي استعلام لقاعدة البيانات
+    try:
+        claims = verify_access_token(token)
+    except TokenError as e:
+        return None, jsonify({'error': str(e)}), 401
+
+    if claims['is_banned']:
+        return None, jsonify({'error': 'الحساب محظور'}), 403
+
+    g.auth_context = {
+        'user': SimpleNamespace(id=claims['uid']),
+        'profile': SimpleNamespace(
+            user_id=claims['uid'],
+            user_type=claims['user_type'],
+            subscription_status=claims['subscription_status'],
+            is_banned=claims['is_banned']
+        )
+    }
+    return g.auth_context, None, None
+
+def require_auth():
+    if g.get('auth_context'):
+        return g.auth_context, None, None
+
+    # تطبيق ما أبطلته العمليات الأخرى من بيانات المستخدمين والرموز
+    invalidation.sync()
+
+    token = _bearer_token()
+    if token:
+        return _require_token_auth(token)
+
+    user_id = session.get('user_id')
+    if not user_id:
+        return None, jsonify({'error': 'غير مسجل الدخول'}), 401
+
+    data = _load_auth_data(user_id)
+    if not data:
+        return None, jsonify({'error': 'المستخدم غير موجود'}), 404
+
+    if not data['profile']:
+        return None, jsonify({'error': 'الملف الشخصي غير موجود'}), 404
+
+    g.auth_context = {
+        'user': SimpleNamespace(**data['user']),
+        'profile': SimpleNamespace(**data['profile'])
+    }
+    return g.auth_context, None, None
+
+def require_admin():
+    auth_result, error_response, status_code = require_auth()
+    if error_response:
+        return None, error_response, status_code
+
+    if auth_result['profile'].user_type != UserType.ADMIN:
+        return None, jsonify({'error': 'هذه الخدمة للمديرين فقط'}), 403
+
+    return auth_result, None, None
@@ -0,0 +1,129 @@
+import threading
+import time
+from collections import OrderedDict
+
+# ذاكرة مؤقتة بسيطة داخل العملية مع مدة صلاحية لكل مفتاح
+class TTLCache:
+    def __init__(self, ttl_seconds=60, max_entries=10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            if len(self._data) >= self.max_entries and key not in self._data:
+                self._evict_expired()
+                if len(self._data) >= self.max_entries:
+                    # حذف أقدم مفتاح مضاف
+                    self._data.pop(next(iter(self._data)))
+            self._data[key] = (time.monotonic() + self.ttl_seconds, value)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        for key in [k for k, (expires_at, _) in self._data.items() if expires_at < now]:
+            del self._data[key]
+
+# ذاكرة مؤقتة بسياسة الأقل استخداماً مؤخراً، محدودة بحجم القيم بالبايت
+# مع وسوم لإبطال مجموعة مفاتيح دفعة واحدة
+class LRUCache:
+    def __init__(self, max_bytes=16 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._tags = {}
+        # يزداد مع كل إبطال، فلا تُحفظ قيمة قُرئت من قاعدة البيانات قبل إبطال تالٍ لها
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def generation(self):
+        return self._generation
+
+    def set(self, key, value, tags=(), generation=None):
+        size = len(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._remove(key)
+            self._data[key] = (value, tuple(tags))
+            self.current_bytes += size
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while self.current_bytes > self.max_bytes:
+                self._remove(next(iter(self._data)))
+
+    def delete(self, key):
+        with self._lock:
+            self._generation += 1
+            self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+            self._tags.clear()
+            self.current_bytes = 0
+
+    def invalidate_tag(self, tag):
+        with self._lock:
+            self._generation += 1
+            for key in list(self._tags.pop(tag, ())):
+                self._remove(key)
+
+    def _remove(self, key):
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return
+        value, tags = entry
+        self.current_bytes -= len(value)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._data),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits / lookups * 100) if lookups > 0 else 0
+            }
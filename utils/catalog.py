@@ -0,0 +1,220 @@
+import hashlib
+import json
+import threading
+from bisect import bisect_left, insort
+from collections import Counter
+from sqlalchemy import and_
+from src.models.user import db, Product, UserProfile, SubscriptionStatus
+from src.utils.pagination import encode_cursor
+from src.utils.images import image_variants
+from src.utils.cache import LRUCache
+from src.utils import invalidation
+
+# عدد الصفحات الجاهزة المحفوظة لكل إصدار من الكتالوج
+MAX_CACHED_PAGES = 256
+
+# أنواع سجلات الإبطال الخاصة بالكتالوج
+MERCHANT_SCOPE = 'merchant'
+PRODUCT_SCOPE = 'product'
+
+def serialize_catalog_product(product, merchant_profile):
+    product_data = {
+        'id': product.id,
+        'name': product.name,
+        'description': product.description,
+        'image_url': product.image_url,
+        'base_price': product.base_price,
+        'min_marketer_profit': product.min_marketer_profit,
+        'suggested_price': product.suggested_price,
+        'category': product.category,
+        'merchant_verified': merchant_profile.is_verified,
+        'merchant_completed_orders': merchant_profile.completed_orders,
+        'merchant_business_name': merchant_profile.business_name,
+        'created_at': product.created_at.isoformat()
+    }
+    product_data.update(image_variants(product.image_url))
+    return product_data
+
+def catalog_query():
+    # المنتجات المفعلة للتجار أصحاب الاشتراك المفعل
+    return db.session.query(Product, UserProfile).join(
+        UserProfile, Product.merchant_id == UserProfile.user_id
+    ).filter(
+        and_(Product.is_active == True, UserProfile.subscription_status == SubscriptionStatus.ACTIVE)
+    )
+
+# نسخة جاهزة من الكتالوج المفعل في ذاكرة العملية، تُحدَّث جزئياً عند كل تغيير
+# بدلاً من إعادة بنائها، ورقم الإصدار المحلي يفرّغ الصفحات الجاهزة عند كل تغيير
+# تغييرات العمليات الأخرى تصلها من سجل الإبطال لكل تاجر أو منتج على حدة
+class CatalogSnapshot:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._loaded = False
+        self.version = 0
+        self._reset()
+
+    def _reset(self):
+        self._entries = {}
+        self._keys = []
+        self._merchant_products = {}
+        self._pages = {}
+        # عدد المنتجات لكل تصنيف، للكل وللتجار الموثقين فقط
+        self._category_counts = Counter()
+        self._verified_category_counts = Counter()
+
+    def ensure_loaded(self):
+        # المزامنة قبل التحميل حتى لا يفوت النسخة تغيير حُفظ أثناءه
+        invalidation.sync()
+        if self._loaded:
+            return
+        with self._lock:
+            self._load_if_needed()
+
+    def _load_if_needed(self):
+        if self._loaded:
+            return
+        self._reset()
+        for product, merchant_profile in catalog_query().all():
+            self._put(product, merchant_profile)
+        self._loaded = True
+        self._bump()
+
+    def unload(self):
+        with self._lock:
+            self._loaded = False
+            self._reset()
+
+    def _bump(self):
+        self.version += 1
+        self._pages.clear()
+
+    def _put(self, product, merchant_profile):
+        self._discard(product.id)
+        key = (product.created_at, product.id)
+        entry = serialize_catalog_product(product, merchant_profile)
+        self._entries[product.id] = (key, product.merchant_id, entry)
+        insort(self._keys, key)
+        self._merchant_products.setdefault(product.merchant_id, set()).add(product.id)
+        self._count_category(entry, 1)
+
+    def _discard(self, product_id):
+        entry = self._entries.pop(product_id, None)
+        if not entry:
+            return False
+        key, merchant_id, data = entry
+        del self._keys[bisect_left(self._keys, key)]
+        self._merchant_products[merchant_id].discard(product_id)
+        self._count_category(data, -1)
+        return True
+
+    def _count_category(self, entry, delta):
+        category = entry['category']
+        self._category_counts[category] += delta
+        if entry['merchant_verified']:
+            self._verified_category_counts[category] += delta
+
+    def upsert_product(self, product):
+        with self._lock:
+            if self._loaded:
+                merchant_profile = UserProfile.query.filter_by(user_id=product.merchant_id).first()
+                if product.is_active and merchant_profile.subscription_status == SubscriptionStatus.ACTIVE:
+                    self._put(product, merchant_profile)
+                    self._bump()
+                elif self._discard(product.id):
+                    self._bump()
+        invalidation.publish([(PRODUCT_SCOPE, product.id)])
+
+    def remove_product(self, product_id):
+        with self._lock:
+            if self._loaded and self._discard(product_id):
+                self._bump()
+        invalidation.publish([(PRODUCT_SCOPE, product_id)])
+
+    def refresh_merchant(self, merchant_id):
+        # إعادة تحميل منتجات تاجر واحد بعد تغير توثيقه أو اشتراكه أو بياناته
+        self.reload_merchant(merchant_id)
+        invalidation.publish([(MERCHANT_SCOPE, merchant_id)])
+
+    def reload_merchant(self, merchant_id):
+        # تطبيق التغيير على نسخة هذه العملية فقط
+        with self._lock:
+            if not self._loaded:
+                return
+            rows = catalog_query().filter(Product.merchant_id == merchant_id).all()
+            previous = self._merchant_products.get(merchant_id, set())
+            if not rows and not previous:
+                return
+            for product_id in list(previous):
+                self._discard(product_id)
+            for product, merchant_profile in rows:
+                self._put(product, merchant_profile)
+            self._bump()
+
+    def reload_product(self, product_id):
+        with self._lock:
+            if not self._loaded:
+                return
+            row = catalog_query().filter(Product.id == product_id).first()
+            if row:
+                self._put(*row)
+            elif not self._discard(product_id):
+                return
+            self._bump()
+
+    def etag(self, *args):
+        # من آخر سجل إبطال للكتالوج لا من إصدار العملية، فكل العمليات تعطي نفس ETag لنفس البيانات
+        raw = json.dumps([invalidation.version(MERCHANT_SCOPE, PRODUCT_SCOPE), args]).encode('utf-8')
+        return hashlib.md5(raw).hexdigest()
+
+    def page(self, cursor_values, limit):
+        with self._lock:
+            self._load_if_needed()
+            cache_key = (cursor_values, limit)
+            cached = self._pages.get(cache_key)
+            if cached is None:
+                end = bisect_left(self._keys, cursor_values) if cursor_values else len(self._keys)
+                keys = self._keys[max(end - limit, 0):end][::-1]
+                has_more = end > limit
+                cached = {
+                    'products': [self._entries[product_id][2] for _, product_id in keys],
+                    'next_cursor': encode_cursor(*keys[-1]) if has_more and keys else None,
+                    'has_more': has_more,
+                    'catalog_version': self.version
+                }
+                if len(self._pages) < MAX_CACHED_PAGES:
+                    self._pages[cache_key] = cached
+            return cached
+
+    def facets(self, verified_only=False):
+        with self._lock:
+            self._load_if_needed()
+            counts = self._verified_category_counts if verified_only else self._category_counts
+            facets = [{'category': category, 'count': count} for category, count in counts.items() if count > 0]
+            facets.sort(key=lambda facet: (-facet['count'], facet['category'] or ''))
+            return {'categories': facets, 'catalog_version': self.version}
+
+catalog_snapshot = CatalogSnapshot()
+
+# تفاصيل المنتج الجاهزة للإرسال، موسومة بمعرف التاجر لإبطالها عند تغير بياناته
+PRODUCT_DETAIL_CACHE_BYTES = 16 * 1024 * 1024
+
+product_detail_cache = LRUCache(max_bytes=PRODUCT_DETAIL_CACHE_BYTES)
+
+def invalidate_merchant_products(merchant_id):
+    product_detail_cache.invalidate_tag(('merchant', merchant_id))
+
+def _merchant_changed(merchant_id, changed_at):
+    catalog_snapshot.reload_merchant(merchant_id)
+    invalidate_merchant_products(merchant_id)
+
+def _product_changed(product_id, changed_at):
+    catalog_snapshot.reload_product(product_id)
+    product_detail_cache.delete(product_id)
+
+def _reset_caches():
+    catalog_snapshot.unload()
+    product_detail_cache.clear()
+
+invalidation.on_invalidate(MERCHANT_SCOPE, _merchant_changed)
+invalidation.on_invalidate(PRODUCT_SCOPE, _product_changed)
+invalidation.on_reset(_reset_caches)
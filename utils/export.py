@@ -0,0 +1,74 @@
+import csv
+import io
+import json
+import re
+from datetime import datetime
+from enum import Enum
+from flask import Response, stream_with_context
+from src.models.user import db
+
+# عدد الصفوف في كل جزء يُرسل للعميل وفي كل دفعة تُقرأ من قاعدة البيانات
+EXPORT_CHUNK_ROWS = 500
+
+# القيم التي قد ينفذها برنامج الجداول كمعادلة عند فتح الملف
+_FORMULA_PREFIX = re.compile(r'^(?:[=@\t\r]|[+-](?![\d.]))')
+
+def _plain(value):
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+def _safe_cell(value):
+    if isinstance(value, str) and _FORMULA_PREFIX.match(value):
+        return "'" + value
+    return value
+
+def csv_chunks(header, rows, chunk_rows=EXPORT_CHUNK_ROWS):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')  # ليقرأ Excel النص العربي بشكل صحيح
+    writer.writerow(header)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow([_safe_cell(_plain(value)) for value in row])
+        if count % chunk_rows == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+    yield buffer.getvalue()
+
+def ndjson_chunks(header, rows, chunk_rows=EXPORT_CHUNK_ROWS):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(header, map(_plain, row))), ensure_ascii=False, default=str))
+        if len(lines) >= chunk_rows:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+def iter_keyset_chunks(query, id_column, chunk_rows=EXPORT_CHUNK_ROWS):
+    # قراءة النتائج على دفعات بمؤشر على المعرف، وكل دفعة في معاملة قراءة قصيرة
+    # حتى لا يمنع تصدير طويل عمليات الكتابة في SQLite طوال مدة البث
+    last_id = None
+    while True:
+        chunk_query = query if last_id is None else query.filter(id_column < last_id)
+        rows = chunk_query.order_by(id_column.desc()).limit(chunk_rows).all()
+        db.session.rollback()
+        yield from rows
+        if len(rows) < chunk_rows:
+            return
+        last_id = getattr(rows[-1], id_column.key)
+
+def export_response(filename, header, rows, fmt='csv'):
+    # بث الملف أثناء قراءة الصفوف دون تجميعه كاملاً في الذاكرة
+    if fmt == 'ndjson':
+        chunks, mimetype, extension = ndjson_chunks(header, rows), 'application/x-ndjson', 'ndjson'
+    else:
+        chunks, mimetype, extension = csv_chunks(header, rows), 'text/csv; charset=utf-8', 'csv'
+    return Response(
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}.{extension}'}
+    )
@@ -0,0 +1,118 @@
+from datetime import datetime
+from sqlalchemy import select, literal, or_
+from sqlalchemy.dialects.sqlite import insert
+from src.models.user import db, Product, UserProfile, MerchantFollow, FeedEntry
+from src.utils.catalog import catalog_query
+from src.utils.pagination import keyset_filter
+
+# التجار الذين يتجاوز عدد متابعيهم هذا الحد لا تُنسخ منتجاتهم لكل متابع،
+# بل تُقرأ منتجاتهم مباشرة عند عرض الخط الزمني
+FANOUT_FOLLOWER_LIMIT = 5000
+
+# يُستأنف النسخ عند نزول المتابعين لهذا الحد، فلا يتكرر ملء الخطوط عند التذبذب حول الحد
+FANOUT_RESUME_LIMIT = 4500
+
+# عدد المنتجات الأخيرة التي تُضاف للخط الزمني عند متابعة تاجر جديد
+FOLLOW_BACKFILL_SIZE = 50
+
+FEED_COLUMNS = ['marketer_id', 'product_id', 'merchant_id', 'product_created_at']
+
+def count_follower(merchant_id, delta):
+    # عداد المتابعين في ملف التاجر يغني عن عدّهم عند كل عرض للخط الزمني
+    UserProfile.query.filter_by(user_id=merchant_id).update(
+        {UserProfile.followers_count: UserProfile.followers_count + delta}, synchronize_session=False
+    )
+    _update_fanout(merchant_id)
+
+def _update_fanout(merchant_id):
+    # طريقة النشر محفوظة في ملف التاجر ولا تُستنتج من العدد الحالي،
+    # فالمنتجات التي لم تُنسخ أثناء التوقف تُضاف لكل المتابعين عند الاستئناف
+    followers, paused_at = db.session.query(
+        UserProfile.followers_count, UserProfile.fanout_paused_at
+    ).filter_by(user_id=merchant_id).one()
+    if paused_at is None and followers > FANOUT_FOLLOWER_LIMIT:
+        paused_at = datetime.utcnow()
+    elif paused_at is not None and followers <= FANOUT_RESUME_LIMIT:
+        _backfill_followers(merchant_id, paused_at)
+        paused_at = None
+    else:
+        return
+    UserProfile.query.filter_by(user_id=merchant_id).update(
+        {UserProfile.fanout_paused_at: paused_at}, synchronize_session=False
+    )
+
+def _backfill_followers(merchant_id, paused_at):
+    # منتجات فترة التوقف لكل المتابعين، وآخر المنتجات لمن تابع أثناءها
+    latest = select(Product.id).where(
+        Product.merchant_id == merchant_id, Product.is_active == True
+    ).order_by(Product.created_at.desc()).limit(FOLLOW_BACKFILL_SIZE)
+    source = select(
+        MerchantFollow.marketer_id, Product.id, Product.merchant_id, Product.created_at
+    ).join(
+        Product, Product.merchant_id == MerchantFollow.merchant_id
+    ).where(
+        MerchantFollow.merchant_id == merchant_id, Product.is_active == True,
+        or_(Product.created_at >= paused_at, Product.id.in_(latest))
+    )
+    db.session.execute(insert(FeedEntry.__table__).from_select(FEED_COLUMNS, source).on_conflict_do_nothing())
+
+def is_high_fanout(merchant_id):
+    paused_at = db.session.query(UserProfile.fanout_paused_at).filter_by(user_id=merchant_id).scalar()
+    return paused_at is not None
+
+def fan_out_products(merchant_id, product_ids):
+    # نسخ المنتجات الجديدة إلى الخط الزمني لكل متابع بجملة INSERT ... SELECT واحدة
+    if not product_ids or is_high_fanout(merchant_id):
+        return
+    source = select(
+        MerchantFollow.marketer_id, Product.id, Product.merchant_id, Product.created_at
+    ).join(
+        Product, Product.merchant_id == MerchantFollow.merchant_id
+    ).where(
+        MerchantFollow.merchant_id == merchant_id, Product.id.in_(product_ids)
+    )
+    db.session.execute(FeedEntry.__table__.insert().from_select(FEED_COLUMNS, source))
+
+def backfill_follow(marketer_id, merchant_id):
+    if is_high_fanout(merchant_id):
+        return
+    source = select(
+        literal(marketer_id), Product.id, Product.merchant_id, Product.created_at
+    ).where(
+        Product.merchant_id == merchant_id, Product.is_active == True
+    ).order_by(Product.created_at.desc()).limit(FOLLOW_BACKFILL_SIZE)
+    db.session.execute(FeedEntry.__table__.insert().from_select(FEED_COLUMNS, source))
+
+def remove_follow(marketer_id, merchant_id):
+    FeedEntry.query.filter_by(marketer_id=marketer_id, merchant_id=merchant_id).delete(synchronize_session=False)
+
+def remove_product(product_id):
+    FeedEntry.query.filter_by(product_id=product_id).delete(synchronize_session=False)
+
+def feed_page(marketer_id, cursor_values, limit):
+    # الخط الزمني المحفوظ مسبقاً
+    query = catalog_query().join(
+        FeedEntry, FeedEntry.product_id == Product.id
+    ).filter(FeedEntry.marketer_id == marketer_id)
+    if cursor_values:
+        query = query.filter(keyset_filter(FeedEntry.product_created_at, FeedEntry.product_id, cursor_values))
+    rows = query.order_by(
+        FeedEntry.product_created_at.desc(), FeedEntry.product_id.desc()
+    ).limit(limit + 1).all()
+
+    # منتجات التجار كثيري المتابعين تُقرأ مباشرة
+    big_merchants = [merchant_id for (merchant_id,) in db.session.query(MerchantFollow.merchant_id).join(
+        UserProfile, UserProfile.user_id == MerchantFollow.merchant_id
+    ).filter(
+        MerchantFollow.marketer_id == marketer_id,
+        UserProfile.fanout_paused_at.isnot(None)
+    )]
+    if big_merchants:
+        query = catalog_query().filter(Product.merchant_id.in_(big_merchants))
+        if cursor_values:
+            query = query.filter(keyset_filter(Product.created_at, Product.id, cursor_values))
+        rows += query.order_by(Product.created_at.desc(), Product.id.desc()).limit(limit + 1).all()
+
+    merged = {product.id: (product, merchant_profile) for product, merchant_profile in rows}
+    rows = sorted(merged.values(), key=lambda row: (row[0].created_at, row[0].id), reverse=True)
+    return rows[:limit], len(rows) > limit
@@ -0,0 +1,104 @@
+import glob
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from PIL import Image
+except ImportError:  # بدون Pillow تُحفظ الصورة الأصلية فقط
+    Image = None
+
+UPLOADS_URL_PREFIX = '/uploads/'
+MAX_IMAGE_SIZE = 5 * 1024 * 1024
+THUMBNAIL_SIZE = (320, 320)
+
+# مدة التخزين في المتصفح للملفات المسماة بالبصمة (سنة)
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+_SIGNATURES = [
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+]
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='thumbnails')
+
+class ImageError(ValueError):
+    pass
+
+def _detect_extension(data):
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+    for signature, extension in _SIGNATURES:
+        if data.startswith(signature):
+            return extension
+    return None
+
+def _variant_names(digest):
+    return {
+        'thumbnail_url': f'{digest}_thumb.jpg',
+        'thumbnail_webp_url': f'{digest}_thumb.webp',
+        'webp_url': f'{digest}.webp'
+    }
+
+def store_image(upload, static_folder):
+    # الملف يُسمّى ببصمة محتواه، فالرفع المكرر لنفس الصورة لا يُنشئ ملفاً جديداً
+    data = upload.stream.read(MAX_IMAGE_SIZE + 1)
+    if len(data) > MAX_IMAGE_SIZE:
+        raise ImageError('حجم الصورة يجب أن لا يزيد عن 5 ميغابايت')
+
+    extension = _detect_extension(data)
+    if not extension:
+        raise ImageError('نوع الصورة غير مدعوم')
+
+    digest = hashlib.sha256(data).hexdigest()
+    relative_dir = os.path.join('uploads', digest[:2])
+    directory = os.path.join(static_folder, relative_dir)
+    path = os.path.join(directory, f'{digest}.{extension}')
+
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    if Image is not None and not os.path.exists(os.path.join(directory, f'{digest}_thumb.webp')):
+        _executor.submit(_generate_variants, path, directory, digest)
+
+    image_url = f'{UPLOADS_URL_PREFIX}{digest[:2]}/{digest}.{extension}'
+    return dict(image_url=image_url, **image_variants(image_url))
+
+def _save(image, path, image_format, **options):
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    image.save(temp_path, image_format, **options)
+    os.replace(temp_path, path)
+
+def _generate_variants(path, directory, digest):
+    names = _variant_names(digest)
+    with Image.open(path) as image:
+        image = image.convert('RGB')
+        if not path.endswith('.webp'):
+            _save(image, os.path.join(directory, names['webp_url']), 'WEBP', quality=85)
+        image.thumbnail(THUMBNAIL_SIZE)
+        _save(image, os.path.join(directory, names['thumbnail_url']), 'JPEG', quality=80, optimize=True)
+        _save(image, os.path.join(directory, names['thumbnail_webp_url']), 'WEBP', quality=80)
+
+def image_variants(image_url):
+    # روابط النسخ المصغرة تُشتق من رابط الصورة دون أي قراءة من القرص
+    if not image_url or not image_url.startswith(UPLOADS_URL_PREFIX):
+        return {'thumbnail_url': None, 'thumbnail_webp_url': None, 'webp_url': None}
+
+    directory_url, filename = image_url.rsplit('/', 1)
+    digest = filename.split('.', 1)[0]
+    return {key: f'{directory_url}/{name}' for key, name in _variant_names(digest).items()}
+
+def find_original(static_folder, path):
+    # عند عدم جاهزية النسخة المصغرة بعد، نعيد الصورة الأصلية
+    directory, filename = os.path.split(path)
+    digest = filename.split('_', 1)[0].split('.', 1)[0]
+    for candidate in glob.glob(os.path.join(static_folder, directory, f'{digest}.*')):
+        if not candidate.endswith('.tmp'):
+            return os.path.relpath(candidate, static_folder)
+    return None
@@ -0,0 +1,63 @@
+import csv
+import io
+import json
+from itertools import islice
+from flask import request
+
+# حجم الدفعة الواحدة عند الاستيراد الجماعي
+IMPORT_CHUNK_SIZE = 500
+
+def _upload_format(upload):
+    fmt = request.args.get('format', '').lower()
+    if fmt in ('csv', 'ndjson'):
+        return fmt
+
+    filename = (upload.filename or '').lower() if upload else ''
+    content_type = (upload.mimetype if upload else request.mimetype) or ''
+    if filename.endswith(('.ndjson', '.jsonl')) or 'ndjson' in content_type or 'jsonl' in content_type:
+        return 'ndjson'
+    return 'csv'
+
+def iter_upload_rows():
+    # قراءة الملف المرفوع سطراً بسطر دون تحميله كاملاً في الذاكرة
+    # كل عنصر: (رقم السطر، بيانات السطر، رسالة الخطأ)
+    upload = request.files.get('file')
+    stream = upload.stream if upload else request.stream
+    fmt = _upload_format(upload)
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, {k.strip(): v for k, v in row.items() if k}, None
+        return
+
+    for line_number, line in enumerate(text, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield line_number, None, 'صيغة JSON غير صحيحة'
+            continue
+        if not isinstance(row, dict):
+            yield line_number, None, 'كل سطر يجب أن يكون كائن JSON'
+            continue
+        yield line_number, row, None
+
+def chunked(iterable, size=IMPORT_CHUNK_SIZE):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def non_text_field(row, fields):
+    # قيم NDJSON قد تكون أرقاماً أو قوائم، فنرفض السطر بدلاً من انهيار التحقق عليه
+    for field in fields:
+        value = row.get(field)
+        if value is not None and not isinstance(value, str):
+            return field
+    return None
@@ -0,0 +1,121 @@
+import threading
+import time
+from sqlalchemy import func
+from src.models.user import db, CacheInvalidation
+
+# أقصى مدة تخدم فيها العملية من ذاكرتها قبل قراءة سجل الإبطال (بالثواني)
+SYNC_INTERVAL = 1.0
+
+# مدة الاحتفاظ بالسجل، ولا تقل عن مدة صلاحية رمز التجديد لأن إلغاء الرموز يُعاد تحميله منه
+INVALIDATION_RETENTION = 30 * 24 * 60 * 60
+
+# scope -> [(handler, replay)]، والمعالج يستقبل (المعرف، وقت التغيير)
+_handlers = {}
+_reset_handlers = []
+
+_sync_lock = threading.Lock()
+_state = {'last_id': None, 'synced_at': 0.0}
+
+# آخر سجل قرأته العملية من كل نوع، وهو نفسه في كل العمليات التي لحقت بالسجل
+_scope_ids = {}
+
+# سجلات نشرتها هذه العملية بعد تطبيقها محلياً فلا تُطبق مرة ثانية
+_own_lock = threading.Lock()
+_own_ids = set()
+
+def on_invalidate(scope, handler, replay=False):
+    # replay: يُعاد تطبيق سجلات هذا النوع عند بدء العملية، لما لا يُستعاد من قاعدة البيانات
+    _handlers.setdefault(scope, []).append((handler, replay))
+
+def on_reset(handler):
+    # يُستدعى إذا فات العملية جزء من السجل فتُفرغ ذاكرتها كاملة
+    _reset_handlers.append(handler)
+
+def publish(entries, applied=True):
+    # يُستدعى بعد حفظ التغيير نفسه، ويُحفظ في معاملة قصيرة مستقلة
+    # applied: العملية الحالية طبقت التغيير بنفسها، وإلا طُبق عند المزامنة التي تلي الحفظ
+    if not entries:
+        return
+    now = time.time()
+    ids = db.session.execute(CacheInvalidation.__table__.insert().values([
+        {'scope': scope, 'target_id': target_id, 'created_at': now} for scope, target_id in entries
+    ]).returning(CacheInvalidation.id)).scalars().all()
+    # آخر سجل من كل نوع يبقى حتى لا يتراجع إصدار النوع عند العمليات التي تبدأ لاحقاً
+    latest_ids = db.session.query(func.max(CacheInvalidation.id)).group_by(CacheInvalidation.scope)
+    CacheInvalidation.query.filter(
+        CacheInvalidation.created_at < now - INVALIDATION_RETENTION,
+        CacheInvalidation.id.notin_(latest_ids.scalar_subquery())
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    if applied:
+        with _own_lock:
+            _own_ids.update(ids)
+    # اللحاق بالسجل فوراً حتى يشمل إصدار هذه العملية تغييرها، وما لم تطبقه يُطبق الآن
+    sync(force=True)
+
+def _log_query():
+    return db.session.query(
+        CacheInvalidation.id, CacheInvalidation.scope, CacheInvalidation.target_id, CacheInvalidation.created_at
+    )
+
+def _apply(row):
+    for handler, _ in _handlers.get(row.scope, ()):
+        handler(row.target_id, row.created_at)
+
+def _start():
+    # العملية تبدأ بذاكرة فارغة، فيكفي إعادة تطبيق ما لا يُقرأ من قاعدة البيانات
+    replay_scopes = [scope for scope, handlers in _handlers.items() if any(replay for _, replay in handlers)]
+    _scope_ids.update(db.session.query(CacheInvalidation.scope, func.max(CacheInvalidation.id)).group_by(CacheInvalidation.scope).all())
+    last_id = max(_scope_ids.values(), default=0)
+    if replay_scopes:
+        for row in _log_query().filter(
+            CacheInvalidation.scope.in_(replay_scopes),
+            CacheInvalidation.created_at >= time.time() - INVALIDATION_RETENTION,
+            CacheInvalidation.id <= last_id
+        ).order_by(CacheInvalidation.id):
+            _apply(row)
+    _state['last_id'] = last_id
+
+def sync(force=False):
+    # قراءة ما أُضيف للسجل منذ آخر مزامنة بالمفتاح الأساسي، مرة كل SYNC_INTERVAL على الأكثر
+    if not force and time.monotonic() - _state['synced_at'] < SYNC_INTERVAL:
+        return
+    with _sync_lock:
+        if not force and time.monotonic() - _state['synced_at'] < SYNC_INTERVAL:
+            return
+        if _state['last_id'] is None:
+            _start()
+        else:
+            last_id = _state['last_id']
+            rows = _log_query().filter(
+                CacheInvalidation.id > last_id
+            ).order_by(CacheInvalidation.id).all()
+            if rows and rows[0].id != last_id + 1:
+                # حُذف من السجل ما لم تقرأه العملية بعد
+                for handler in _reset_handlers:
+                    handler()
+            with _own_lock:
+                own_ids = set(_own_ids)
+            for row in rows:
+                if row.id not in own_ids:
+                    _apply(row)
+                _scope_ids[row.scope] = row.id
+            if rows:
+                _state['last_id'] = rows[-1].id
+            with _own_lock:
+                _own_ids.difference_update([own_id for own_id in _own_ids if own_id <= _state['last_id']])
+        _state['synced_at'] = time.monotonic()
+
+def reset():
+    # إعادة العملية لحالة البدء بعد تبديل قاعدة البيانات: تُفرغ الذاكرة ويُقرأ السجل من جديد
+    with _sync_lock:
+        for handler in _reset_handlers:
+            handler()
+        _state.update(last_id=None, synced_at=0.0)
+        _scope_ids.clear()
+    with _own_lock:
+        _own_ids.clear()
+
+def version(*scopes):
+    # إصدار مشترك بين العمليات لما تحفظه من هذه الأنواع، يصلح لبناء ETag
+    return max((_scope_ids.get(scope, 0) for scope in scopes), default=0)
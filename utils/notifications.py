@@ -0,0 +1,30 @@
+from sqlalchemy import text
+from src.models.user import db, Notification, NotificationCounter, NOTIFICATION_COUNTER_TRIGGERS
+
+def bulk_insert_notifications(rows):
+    # إدراج دفعة من الإشعارات بجملة INSERT واحدة ضمن المعاملة الحالية
+    # كل عنصر: قاموس فيه user_id و title و message و type و related_order_id
+    if rows:
+        db.session.execute(Notification.__table__.insert(), rows)
+
+def ensure_unread_counters():
+    # create_all ينشئ المشغلات مع الجدول، وهذا لقواعد البيانات التي أُنشئ جدولها قبلها
+    for trigger in NOTIFICATION_COUNTER_TRIGGERS:
+        db.session.execute(text(trigger))
+    is_empty = db.session.execute(text('SELECT NOT EXISTS (SELECT 1 FROM notification_counters)')).scalar()
+    if is_empty:
+        repair_unread_counters()
+    db.session.commit()
+
+def repair_unread_counters():
+    # إعادة حساب كل العدادات من جدول الإشعارات في معاملة واحدة
+    db.session.execute(text('DELETE FROM notification_counters'))
+    db.session.execute(text(
+        'INSERT INTO notification_counters (user_id, unread_count) '
+        'SELECT user_id, COUNT(*) FROM notifications WHERE is_read = 0 GROUP BY user_id'
+    ))
+    db.session.commit()
+
+def get_unread_counter(user_id):
+    counter = db.session.get(NotificationCounter, user_id)
+    return counter.unread_count if counter else 0
@@ -0,0 +1,97 @@
+from collections import namedtuple, Counter
+from sqlalchemy import func, case, bindparam
+from src.models.user import db, OrderEvent, UserProfile, OrderStatus, PaymentStatus
+from src.utils import order_stats, reputation
+from src.utils.ranking import queue_merchant_scores
+
+# الانتقالات المسموحة لحالة الطلب، والحالات غير المذكورة كمصدر نهائية
+STATUS_TRANSITIONS = {
+    OrderStatus.PENDING: {OrderStatus.IN_PROGRESS, OrderStatus.COMPLETED, OrderStatus.REJECTED, OrderStatus.NOT_SERIOUS},
+    OrderStatus.IN_PROGRESS: {OrderStatus.COMPLETED, OrderStatus.REJECTED, OrderStatus.NOT_SERIOUS},
+    OrderStatus.COMPLETED: set(),
+    OrderStatus.REJECTED: set(),
+    OrderStatus.NOT_SERIOUS: set()
+}
+
+# الانتقالات المسموحة لحالة الدفع، ولا تتغير إلا للطلبات المكتملة
+PAYMENT_TRANSITIONS = {
+    PaymentStatus.PENDING: {PaymentStatus.PAID, PaymentStatus.DELAYED},
+    PaymentStatus.DELAYED: {PaymentStatus.PAID},
+    PaymentStatus.PAID: set()
+}
+
+# عدد الطلبات المكتملة المدفوعة اللازم لتوثيق المسوق والتاجر
+MARKETER_VERIFY_THRESHOLD = 5
+MERCHANT_VERIFY_THRESHOLD = 3
+
+OrderChange = namedtuple('OrderChange', [
+    'order_id', 'merchant_id', 'marketer_id', 'marketer_profit',
+    'old_status', 'old_payment_status', 'new_status', 'new_payment_status', 'customer_phone'
+], defaults=(None,))
+
+def can_change_status(current, new):
+    return new in STATUS_TRANSITIONS.get(current, ())
+
+def can_change_payment(status, current, new):
+    return status == OrderStatus.COMPLETED and new in PAYMENT_TRANSITIONS.get(current, ())
+
+def sources_for_status(new):
+    return [source for source, targets in STATUS_TRANSITIONS.items() if new in targets]
+
+def order_change(order, old_status, old_payment_status, new_status=None, new_payment_status=None):
+    # يقبل كائن الطلب أو صفاً من استعلام أعمدة يحمل نفس الأسماء
+    return OrderChange(
+        order.id, order.merchant_id, order.marketer_id, order.marketer_profit,
+        old_status, old_payment_status,
+        new_status or order.status, new_payment_status or order.payment_status,
+        getattr(order, 'customer_phone', None)
+    )
+
+def _events(change, actor_id):
+    if change.old_status is None:
+        yield {'order_id': change.order_id, 'actor_id': actor_id, 'kind': 'created',
+               'from_value': None, 'to_value': change.new_status.value}
+        return
+    if change.old_status != change.new_status:
+        yield {'order_id': change.order_id, 'actor_id': actor_id, 'kind': 'status',
+               'from_value': change.old_status.value, 'to_value': change.new_status.value}
+    if change.old_payment_status != change.new_payment_status:
+        yield {'order_id': change.order_id, 'actor_id': actor_id, 'kind': 'payment',
+               'from_value': change.old_payment_status.value, 'to_value': change.new_payment_status.value}
+
+def record_order_changes(changes, actor_id=None):
+    # يُستدعى ضمن معاملة التغيير نفسها: سجل الأحداث ثم الملخصات وسجل الزبائن
+    changes = list(changes)
+    events = [event for change in changes for event in _events(change, actor_id)]
+    if events:
+        db.session.execute(OrderEvent.__table__.insert(), events)
+    order_stats.record_order_changes(changes)
+    reputation.record_order_changes(changes)
+
+def add_completed_orders(changes):
+    # زيادة عدد الطلبات المكتملة المدفوعة وتوثيق المسوقين والتجار بجملة UPDATE واحدة
+    # الزيادة والتوثيق يُحسبان داخل قاعدة البيانات فلا تضيع أي زيادة عند التزامن
+    # تعيد التجار الذين وُثقوا بهذه الزيادة
+    marketers = Counter(change.marketer_id for change in changes)
+    merchants = Counter(change.merchant_id for change in changes)
+    rows = [{'profile_user_id': user_id, 'increment': count, 'threshold': MARKETER_VERIFY_THRESHOLD}
+            for user_id, count in marketers.items()]
+    rows += [{'profile_user_id': user_id, 'increment': count, 'threshold': MERCHANT_VERIFY_THRESHOLD}
+             for user_id, count in merchants.items()]
+    if not rows:
+        return []
+    
+    profiles = UserProfile.__table__
+    completed_orders = func.coalesce(profiles.c.completed_orders, 0) + bindparam('increment')
+    db.session.execute(profiles.update().where(
+        profiles.c.user_id == bindparam('profile_user_id')
+    ).values(
+        completed_orders=completed_orders,
+        is_verified=case((completed_orders >= bindparam('threshold'), True), else_=profiles.c.is_verified)
+    ), rows)
+    queue_merchant_scores(merchants)
+    
+    # التجار الذين تجاوزوا حد التوثيق الآن، فتتغير شارتهم في الكتالوج فوراً
+    return [user_id for user_id, completed in db.session.query(UserProfile.user_id, UserProfile.completed_orders).filter(
+        UserProfile.user_id.in_(list(merchants))
+    ) if completed - merchants[user_id] < MERCHANT_VERIFY_THRESHOLD <= completed]
@@ -0,0 +1,115 @@
+from collections import defaultdict
+from sqlalchemy import func, case, select, literal, bindparam, and_
+from sqlalchemy.dialects.sqlite import insert
+from src.models.user import db, Order, OrderStats, MarketerDebt, OrderStatus, PaymentStatus
+
+ROLE_COLUMNS = {'merchant': Order.merchant_id, 'marketer': Order.marketer_id}
+
+# ربح المسوق مستحق ما دام الطلب مكتملاً ولم يُدفع، سواء كان في موعده أو متأخراً
+OUTSTANDING_PAYMENT_STATUSES = (PaymentStatus.PENDING, PaymentStatus.DELAYED)
+
+def _contribution(status, payment_status, profit):
+    # مساهمة الطلب الواحد في الملخص: (العدد، المكتمل، الربح المدفوع، الربح المستحق)
+    if status is None:
+        return 0, 0, 0, 0
+    completed = status == OrderStatus.COMPLETED
+    return (
+        1,
+        1 if completed else 0,
+        profit if payment_status == PaymentStatus.PAID else 0,
+        profit if completed and payment_status in OUTSTANDING_PAYMENT_STATUSES else 0
+    )
+
+def record_order_changes(changes):
+    # كل تغيير من نوع OrderChange، والحالة السابقة تكون None عند إنشاء الطلب
+    deltas = defaultdict(lambda: [0, 0, 0, 0])
+    debts = defaultdict(float)
+    for change in changes:
+        before = _contribution(change.old_status, change.old_payment_status, change.marketer_profit)
+        after = _contribution(change.new_status, change.new_payment_status, change.marketer_profit)
+        delta = [a - b for a, b in zip(after, before)]
+        for key in ((change.merchant_id, 'merchant'), (change.marketer_id, 'marketer')):
+            deltas[key] = [total + d for total, d in zip(deltas[key], delta)]
+        if delta[3]:
+            debts[(change.merchant_id, change.marketer_id)] += delta[3]
+
+    updates = [{
+        'stats_user_id': user_id, 'stats_role': role,
+        'total_delta': d[0], 'completed_delta': d[1], 'paid_delta': d[2], 'pending_delta': d[3]
+    } for (user_id, role), d in deltas.items() if any(d)]
+    if not updates:
+        return
+
+    # الملخصات غير الموجودة بعد لا تُعدَّل، بل تُحسب كاملة عند أول قراءة
+    stats_table = OrderStats.__table__
+    db.session.execute(stats_table.update().where(and_(
+        stats_table.c.user_id == bindparam('stats_user_id'),
+        stats_table.c.role == bindparam('stats_role')
+    )).values(
+        total_orders=stats_table.c.total_orders + bindparam('total_delta'),
+        completed_orders=stats_table.c.completed_orders + bindparam('completed_delta'),
+        paid_profit=stats_table.c.paid_profit + bindparam('paid_delta'),
+        pending_profit=stats_table.c.pending_profit + bindparam('pending_delta')
+    ), updates)
+
+    if debts:
+        merchant_ids = {merchant_id for merchant_id, _ in debts}
+        tracked = {user_id for (user_id,) in db.session.query(OrderStats.user_id).filter(
+            OrderStats.role == 'merchant', OrderStats.user_id.in_(merchant_ids)
+        )}
+        rows = [{'merchant_id': merchant_id, 'marketer_id': marketer_id, 'amount': amount}
+                for (merchant_id, marketer_id), amount in debts.items() if merchant_id in tracked]
+        if rows:
+            statement = insert(MarketerDebt.__table__)
+            db.session.execute(statement.on_conflict_do_update(
+                index_elements=['merchant_id', 'marketer_id'],
+                set_={'amount': MarketerDebt.__table__.c.amount + statement.excluded.amount}
+            ), rows)
+
+def _pending_condition():
+    return and_(Order.status == OrderStatus.COMPLETED, Order.payment_status.in_(OUTSTANDING_PAYMENT_STATUSES))
+
+def _ensure_stats(user_id, role):
+    # حساب الملخص كاملاً بجملة INSERT ... SELECT واحدة حتى لا يفوته أي تغيير متزامن
+    user_column = ROLE_COLUMNS[role]
+    aggregate = select(
+        literal(user_id), literal(role),
+        func.count(Order.id),
+        func.coalesce(func.sum(case((Order.status == OrderStatus.COMPLETED, 1), else_=0)), 0),
+        func.coalesce(func.sum(case((Order.payment_status == PaymentStatus.PAID, Order.marketer_profit), else_=0)), 0),
+        func.coalesce(func.sum(case((_pending_condition(), Order.marketer_profit), else_=0)), 0)
+    ).where(user_column == user_id)
+    result = db.session.execute(insert(OrderStats.__table__).from_select(
+        ['user_id', 'role', 'total_orders', 'completed_orders', 'paid_profit', 'pending_profit'], aggregate
+    ).on_conflict_do_nothing())
+
+    if result.rowcount and role == 'merchant':
+        debts = select(
+            Order.merchant_id, Order.marketer_id, func.sum(Order.marketer_profit)
+        ).where(Order.merchant_id == user_id, _pending_condition()).group_by(Order.merchant_id, Order.marketer_id)
+        db.session.execute(insert(MarketerDebt.__table__).from_select(
+            ['merchant_id', 'marketer_id', 'amount'], debts
+        ).on_conflict_do_nothing())
+
+    if result.rowcount:
+        db.session.commit()
+
+def get_order_stats(user_id, role):
+    stats = db.session.get(OrderStats, (user_id, role))
+    if stats is None:
+        _ensure_stats(user_id, role)
+        stats = db.session.get(OrderStats, (user_id, role))
+    return stats
+
+def get_marketer_debts(merchant_id):
+    rows = db.session.query(MarketerDebt.marketer_id, MarketerDebt.amount).filter(
+        MarketerDebt.merchant_id == merchant_id, MarketerDebt.amount > 0.005
+    )
+    return {marketer_id: amount for marketer_id, amount in rows}
+
+def reset_order_stats():
+    # حذف الملخصات ليُعاد حسابها من جدول الطلبات عند أول قراءة
+    MarketerDebt.query.delete()
+    deleted = OrderStats.query.delete()
+    db.session.commit()
+    return deleted
@@ -0,0 +1,52 @@
+import base64
+import json
+from datetime import datetime
+from flask import request
+from sqlalchemy import and_, or_
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+class CursorError(ValueError):
+    pass
+
+def get_page_size(default=DEFAULT_PAGE_SIZE):
+    limit = request.args.get('limit', default, type=int)
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+def encode_cursor(sort_value, row_id):
+    if isinstance(sort_value, datetime):
+        sort_value = sort_value.isoformat()
+    raw = json.dumps([sort_value, row_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_cursor(cursor, is_datetime=True):
+    # المؤشر يحمل قيمة الترتيب ومعرف آخر عنصر في الصفحة السابقة
+    try:
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        if is_datetime:
+            sort_value = datetime.fromisoformat(sort_value)
+        return sort_value, int(row_id)
+    except (ValueError, TypeError):
+        raise CursorError('المؤشر غير صالح')
+
+def keyset_filter(sort_column, id_column, cursor_values):
+    # العناصر التي تأتي بعد المؤشر بترتيب تنازلي على (قيمة الترتيب، المعرف)
+    sort_value, row_id = cursor_values
+    return or_(
+        sort_column < sort_value,
+        and_(sort_column == sort_value, id_column < row_id)
+    )
+
+def keyset_page(query, sort_column, id_column, limit, is_datetime=True):
+    # تطبيق المؤشر والترتيب والحد على الاستعلام وإرجاع الصفحة مع مؤشر الصفحة التالية
+    cursor = request.args.get('cursor')
+    if cursor:
+        query = query.filter(keyset_filter(sort_column, id_column, decode_cursor(cursor, is_datetime)))
+
+    rows = query.order_by(sort_column.desc(), id_column.desc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    return rows[:limit], has_more
+
+def next_cursor(has_more, sort_value, row_id):
+    return encode_cursor(sort_value, row_id) if has_more else None
@@ -0,0 +1,87 @@
+from datetime import datetime
+from sqlalchemy import update, func
+from src.models.user import db, Order, PayoutBatch, OrderStatus, PaymentStatus, NotificationType
+from src.utils.order_flow import record_order_changes, order_change
+from src.utils.notifications import bulk_insert_notifications
+
+# عدد الطلبات في كل دفعة، وكل دفعة في معاملة قصيرة مستقلة
+SWEEP_BATCH_SIZE = 500
+
+def _delay_notifications(rows):
+    for row in rows:
+        yield {
+            'user_id': row.merchant_id,
+            'title': 'تأخير في الدفع',
+            'message': f'تجاوز الطلب رقم {row.id} موعد دفع ربح المسوق',
+            'type': NotificationType.PAYMENT,
+            'is_read': False,
+            'related_order_id': row.id
+        }
+        yield {
+            'user_id': row.marketer_id,
+            'title': 'تأخير في الدفع',
+            'message': f'تأخر دفع ربحك عن الطلب رقم {row.id}',
+            'type': NotificationType.PAYMENT,
+            'is_read': False,
+            'related_order_id': row.id
+        }
+
+def sweep_overdue_payments(now=None, batch_size=SWEEP_BATCH_SIZE):
+    # تحويل الطلبات المكتملة التي تجاوزت موعد الدفع دون دفع إلى متأخرة
+    now = now or datetime.utcnow()
+    delayed = 0
+    while True:
+        rows = db.session.query(
+            Order.id, Order.merchant_id, Order.marketer_id, Order.marketer_profit,
+            Order.status, Order.payment_status
+        ).filter(
+            Order.payment_status == PaymentStatus.PENDING,
+            Order.payment_due_date < now,
+            Order.status == OrderStatus.COMPLETED
+        ).order_by(Order.payment_due_date, Order.id).limit(batch_size).all()
+        if not rows:
+            break
+        
+        # الطلبات التي دُفعت في نفس اللحظة يستبعدها الشرط ولا تعود في RETURNING
+        updated_ids = set(db.session.execute(update(Order).where(
+            Order.id.in_([row.id for row in rows]),
+            Order.status == OrderStatus.COMPLETED,
+            Order.payment_status == PaymentStatus.PENDING
+        ).values(
+            payment_status=PaymentStatus.DELAYED, updated_at=datetime.utcnow()
+        ).returning(Order.id)).scalars())
+        rows = [row for row in rows if row.id in updated_ids]
+        
+        record_order_changes([
+            order_change(row, row.status, row.payment_status, new_payment_status=PaymentStatus.DELAYED)
+            for row in rows
+        ])
+        bulk_insert_notifications(list(_delay_notifications(rows)))
+        db.session.commit()
+        delayed += len(rows)
+    
+    return delayed
+
+def refresh_batch_totals(batch_id):
+    # إجماليات الدفعة تُحسب من الطلبات المرتبطة بها فعلاً، ضمن معاملة التغيير
+    orders_count, marketers_count, total_amount = db.session.query(
+        func.count(Order.id),
+        func.count(func.distinct(Order.marketer_id)),
+        func.coalesce(func.sum(Order.marketer_profit), 0)
+    ).filter(Order.payout_batch_id == batch_id).one()
+    PayoutBatch.query.filter(PayoutBatch.id == batch_id).update({
+        PayoutBatch.orders_count: orders_count,
+        PayoutBatch.marketers_count: marketers_count,
+        PayoutBatch.total_amount: total_amount
+    }, synchronize_session=False)
+
+def remove_from_batch_totals(batch_id, marketer_id, profit):
+    # طرح طلب واحد خرج من الدفعة بعد فك ارتباطه، والمسوق يخرج من العدد إن لم يبق له طلب فيها
+    marketer_left = not db.session.query(Order.query.filter(
+        Order.payout_batch_id == batch_id, Order.marketer_id == marketer_id
+    ).exists()).scalar()
+    PayoutBatch.query.filter(PayoutBatch.id == batch_id).update({
+        PayoutBatch.orders_count: PayoutBatch.orders_count - 1,
+        PayoutBatch.marketers_count: PayoutBatch.marketers_count - (1 if marketer_left else 0),
+        PayoutBatch.total_amount: PayoutBatch.total_amount - profit
+    }, synchronize_session=False)
@@ -0,0 +1,126 @@
+import math
+from sqlalchemy import func, case, bindparam, delete, or_, tuple_
+from sqlalchemy.dialects.sqlite import insert
+from src.models.user import db, Product, Order, UserProfile, RankRefresh, OrderStatus
+from src.utils.catalog import catalog_snapshot, invalidate_merchant_products
+
+# أوزان مكونات درجة الترتيب (المجموع 100)
+COMPLETION_WEIGHT = 40
+RELIABILITY_WEIGHT = 20
+PROFIT_WEIGHT = 15
+MERCHANT_WEIGHT = 25
+
+# عدد الطلبات المكتملة الذي يصل عنده التاجر للدرجة الكاملة
+MERCHANT_ORDERS_CAP = 50
+
+# أنواع عناصر طابور إعادة الحساب
+PRODUCT_SCOPE = 'product'
+MERCHANT_SCOPE = 'merchant'
+
+def compute_score(total_orders, completed_orders, bad_orders, avg_profit, merchant_completed_orders, merchant_verified):
+    # تنعيم النسب حتى لا تحصل المنتجات قليلة الطلبات على درجات متطرفة
+    completion_rate = (completed_orders + 1) / (total_orders + 2)
+    bad_share = bad_orders / (total_orders + 2)
+    profit_component = math.log1p(max(avg_profit, 0)) / (1 + math.log1p(max(avg_profit, 0)))
+    merchant_component = (
+        min(merchant_completed_orders, MERCHANT_ORDERS_CAP) / MERCHANT_ORDERS_CAP * 0.5
+        + (0.5 if merchant_verified else 0)
+    )
+
+    return round(
+        COMPLETION_WEIGHT * completion_rate
+        + RELIABILITY_WEIGHT * (1 - bad_share)
+        + PROFIT_WEIGHT * profit_component
+        + MERCHANT_WEIGHT * merchant_component,
+        4
+    )
+
+def _aggregate_query():
+    return db.session.query(
+        Product.id,
+        func.count(Order.id),
+        func.sum(case((Order.status == OrderStatus.COMPLETED, 1), else_=0)),
+        func.sum(case((Order.status.in_([OrderStatus.REJECTED, OrderStatus.NOT_SERIOUS]), 1), else_=0)),
+        func.avg(Order.marketer_profit),
+        UserProfile.completed_orders,
+        UserProfile.is_verified
+    ).outerjoin(
+        Order, Order.product_id == Product.id
+    ).outerjoin(
+        UserProfile, UserProfile.user_id == Product.merchant_id
+    ).group_by(Product.id, UserProfile.completed_orders, UserProfile.is_verified)
+
+def _apply(rows):
+    updates = [{
+        'product_id': product_id,
+        'rank_score': compute_score(
+            total or 0, completed or 0, bad or 0, avg_profit or 0,
+            merchant_completed or 0, merchant_verified
+        )
+    } for product_id, total, completed, bad, avg_profit, merchant_completed, merchant_verified in rows]
+
+    if updates:
+        products_table = Product.__table__
+        db.session.execute(
+            products_table.update().where(products_table.c.id == bindparam('product_id')),
+            updates
+        )
+    return len(updates)
+
+def refresh_product_scores(product_ids):
+    # تحديث تدريجي لمنتجات محددة، يُستدعى ضمن معاملة تغيير الطلب
+    product_ids = list(set(product_ids))
+    if not product_ids:
+        return 0
+    return _apply(_aggregate_query().filter(Product.id.in_(product_ids)).all())
+
+def refresh_merchant_scores(merchant_id):
+    # تغيّر توثيق التاجر يغيّر درجة كل منتجاته، ضمن معاملة التغيير
+    return _apply(_aggregate_query().filter(Product.merchant_id == merchant_id).all())
+
+def _queue(scope, target_ids):
+    rows = [{'scope': scope, 'target_id': target_id} for target_id in set(target_ids) if target_id]
+    if rows:
+        db.session.execute(insert(RankRefresh.__table__).on_conflict_do_nothing(), rows)
+
+def queue_product_scores(product_ids):
+    # تغيّر سجل طلبات المنتج: يُضاف للطابور ضمن معاملة التغيير بدل إعادة التجميع فيها
+    _queue(PRODUCT_SCOPE, product_ids)
+
+def queue_merchant_scores(merchant_ids):
+    # تغيّر عدد الطلبات المكتملة للتاجر: تُعاد درجات كل منتجاته وبياناته في الكتالوج
+    _queue(MERCHANT_SCOPE, merchant_ids)
+
+def refresh_queued_scores(batch_size=1000):
+    # الدفعة تُحذف من الطابور قبل التجميع في نفس المعاملة، فأي تغيير يُحفظ بعدها يعيد إضافتها
+    updated = 0
+    while True:
+        queued = db.session.query(RankRefresh.scope, RankRefresh.target_id).limit(batch_size).all()
+        if not queued:
+            break
+        db.session.execute(delete(RankRefresh).where(
+            tuple_(RankRefresh.scope, RankRefresh.target_id).in_([tuple(row) for row in queued])
+        ))
+        product_ids = {target_id for scope, target_id in queued if scope == PRODUCT_SCOPE}
+        merchant_ids = {target_id for scope, target_id in queued if scope == MERCHANT_SCOPE}
+        updated += _apply(_aggregate_query().filter(
+            or_(Product.id.in_(product_ids), Product.merchant_id.in_(merchant_ids))
+        ).all())
+        db.session.commit()
+        for merchant_id in merchant_ids:
+            catalog_snapshot.refresh_merchant(merchant_id)
+            invalidate_merchant_products(merchant_id)
+    return updated
+
+def refresh_all_scores(batch_size=1000):
+    # إعادة حساب كل الدرجات على دفعات، كل دفعة في معاملة قصيرة
+    last_id = 0
+    updated = 0
+    while True:
+        rows = _aggregate_query().filter(Product.id > last_id).order_by(Product.id).limit(batch_size).all()
+        if not rows:
+            break
+        updated += _apply(rows)
+        db.session.commit()
+        last_id = rows[-1][0]
+    return updated
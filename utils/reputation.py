@@ -0,0 +1,112 @@
+import re
+from collections import defaultdict
+from sqlalchemy import text
+from sqlalchemy.dialects.sqlite import insert
+from src.models.user import db, Order, CustomerReputation, OrderStatus
+
+# الزبون خطر إذا تكررت طلباته المرفوضة أو غير الجدية وكانت نسبة كبيرة من طلباته
+RISKY_MIN_BAD_ORDERS = 2
+RISKY_BAD_RATIO = 0.5
+
+# رمز الدولة للأرقام العراقية التي يقبلها validate_phone بصيغتها المحلية 07XXXXXXXXX
+PHONE_COUNTRY_CODE = '964'
+
+_DIGITS = str.maketrans('٠١٢٣٤٥٦٧٨٩۰۱۲۳۴۵۶۷۸۹', '01234567890123456789')
+_NON_DIGITS = re.compile(r'\D')
+
+def normalize_phone(phone):
+    # توحيد صيغة الرقم: أرقام لاتينية فقط وبادئة محلية بدلاً من رمز الدولة
+    digits = _NON_DIGITS.sub('', (phone or '').translate(_DIGITS))
+    if digits.startswith('00'):
+        digits = digits[2:]
+    if digits.startswith(PHONE_COUNTRY_CODE):
+        digits = '0' + digits[len(PHONE_COUNTRY_CODE):]
+    return digits or None
+
+def _contribution(status):
+    # (العدد، المكتمل، المرفوض، غير الجدي)
+    if status is None:
+        return 0, 0, 0, 0
+    return (
+        1,
+        1 if status == OrderStatus.COMPLETED else 0,
+        1 if status == OrderStatus.REJECTED else 0,
+        1 if status == OrderStatus.NOT_SERIOUS else 0
+    )
+
+def _upsert(deltas):
+    rows = [{'phone': phone, 'total_orders': d[0], 'completed_orders': d[1],
+             'rejected_orders': d[2], 'not_serious_orders': d[3]}
+            for phone, d in deltas.items() if any(d)]
+    if not rows:
+        return
+    table = CustomerReputation.__table__
+    statement = insert(table)
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=['phone'],
+        set_={column: table.c[column] + statement.excluded[column]
+              for column in ('total_orders', 'completed_orders', 'rejected_orders', 'not_serious_orders')}
+    ), rows)
+
+def record_order_changes(changes):
+    # تغييرات حالة الدفع وحدها لا تؤثر على سجل الزبون
+    deltas = defaultdict(lambda: [0, 0, 0, 0])
+    for change in changes:
+        if change.old_status == change.new_status:
+            continue
+        phone = normalize_phone(change.customer_phone)
+        if not phone:
+            continue
+        before = _contribution(change.old_status)
+        after = _contribution(change.new_status)
+        deltas[phone] = [total + a - b for total, a, b in zip(deltas[phone], after, before)]
+    _upsert(deltas)
+
+def serialize_reputation(reputation):
+    if reputation is None:
+        return {'total_orders': 0, 'completed_orders': 0, 'rejected_orders': 0,
+                'not_serious_orders': 0, 'is_risky': False}
+    bad_orders = reputation.rejected_orders + reputation.not_serious_orders
+    return {
+        'total_orders': reputation.total_orders,
+        'completed_orders': reputation.completed_orders,
+        'rejected_orders': reputation.rejected_orders,
+        'not_serious_orders': reputation.not_serious_orders,
+        'is_risky': bad_orders >= RISKY_MIN_BAD_ORDERS and bad_orders >= reputation.total_orders * RISKY_BAD_RATIO
+    }
+
+def get_reputations(phones):
+    # قراءة سجلات عدة أرقام بالمفتاح الأساسي في استعلام واحد
+    normalized = {phone: normalize_phone(phone) for phone in phones}
+    keys = {key for key in normalized.values() if key}
+    found = {row.phone: row for row in CustomerReputation.query.filter(CustomerReputation.phone.in_(keys))} if keys else {}
+    return {phone: serialize_reputation(found.get(key)) for phone, key in normalized.items()}
+
+def get_reputation(phone):
+    return get_reputations([phone])[phone]
+
+def rebuild_reputations(batch_size=5000):
+    # إعادة بناء السجل من جدول الطلبات على دفعات
+    db.session.execute(text('DELETE FROM customer_reputations'))
+    last_id = 0
+    while True:
+        rows = db.session.query(Order.id, Order.customer_phone, Order.status).filter(
+            Order.id > last_id
+        ).order_by(Order.id).limit(batch_size).all()
+        if not rows:
+            break
+        deltas = defaultdict(lambda: [0, 0, 0, 0])
+        for _, phone, status in rows:
+            phone = normalize_phone(phone)
+            if phone:
+                deltas[phone] = [total + c for total, c in zip(deltas[phone], _contribution(status))]
+        _upsert(deltas)
+        last_id = rows[-1].id
+    db.session.commit()
+
+def ensure_reputations():
+    # بناء السجل أول مرة لقواعد البيانات التي فيها طلبات سابقة
+    is_empty = db.session.execute(text('SELECT NOT EXISTS (SELECT 1 FROM customer_reputations)')).scalar()
+    has_orders = db.session.execute(text('SELECT EXISTS (SELECT 1 FROM orders)')).scalar()
+    if is_empty and has_orders:
+        rebuild_reputations()
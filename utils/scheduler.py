@@ -0,0 +1,20 @@
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+def start_periodic_job(app, name, interval_seconds, job):
+    # تشغيل مهمة صيانة دورياً في خيط خلفي ضمن سياق التطبيق
+    stop_event = threading.Event()
+    
+    def run():
+        while not stop_event.wait(interval_seconds):
+            with app.app_context():
+                try:
+                    job()
+                except Exception:
+                    logger.exception('فشل تنفيذ المهمة الدورية %s', name)
+    
+    thread = threading.Thread(target=run, name=name, daemon=True)
+    thread.start()
+    return stop_event
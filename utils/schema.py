@@ -0,0 +1,54 @@
+from sqlalchemy import inspect, literal, text
+from src.models.user import db
+from src.utils.ranking import refresh_all_scores
+from src.utils.feed import FANOUT_FOLLOWER_LIMIT
+
+# أعمدة مشتقة تُملأ من بقية الجداول عند إضافتها لقاعدة بيانات قائمة
+_BACKFILLS = {
+    ('user_profiles', 'followers_count'): (
+        'UPDATE user_profiles SET followers_count = '
+        '(SELECT COUNT(*) FROM merchant_follows WHERE merchant_follows.merchant_id = user_profiles.user_id)'
+    ),
+    # التجار كثيرو المتابعين لم تُنسخ منتجاتهم للمتابعين من قبل
+    ('user_profiles', 'fanout_paused_at'): (
+        'UPDATE user_profiles SET fanout_paused_at = CURRENT_TIMESTAMP '
+        f'WHERE followers_count > {FANOUT_FOLLOWER_LIMIT}'
+    ),
+}
+
+def _column_ddl(column, dialect):
+    ddl = f'{column.name} {column.type.compile(dialect=dialect)}'
+    default = column.default.arg if column.default is not None and column.default.is_scalar else None
+    if default is not None:
+        ddl += ' DEFAULT ' + str(literal(default, column.type).compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+        if not column.nullable:
+            ddl += ' NOT NULL'
+    for foreign_key in column.foreign_keys:
+        ddl += f' REFERENCES {foreign_key.column.table.name} ({foreign_key.column.name})'
+    return ddl
+
+def ensure_schema():
+    # create_all لا يعدّل الجداول الموجودة، فتُضاف الأعمدة والفهارس الجديدة لها هنا
+    # تعيد الأعمدة المضافة بصيغة (الجدول، العمود)
+    engine = db.engine
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    added = []
+    with engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing_columns:
+                    connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {_column_ddl(column, engine.dialect)}'))
+                    added.append((table.name, column.name))
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+        for key in added:
+            if key in _BACKFILLS:
+                connection.execute(text(_BACKFILLS[key]))
+    # درجات الترتيب تُحسب من سجل الطلبات الموجود
+    if ('products', 'rank_score') in added:
+        refresh_all_scores()
+    return added
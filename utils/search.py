@@ -0,0 +1,147 @@
+import re
+import unicodedata
+from sqlalchemy import text, func, literal_column, table, column
+from src.models.user import db, Product
+
+# الحركات والتطويل
+_TASHKEEL = re.compile('[\u0610-\u061A\u064B-\u065F\u0670\u06D6-\u06ED\u0640]')
+_CHAR_MAP = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ة': 'ه',
+    'ى': 'ي', 'ئ': 'ي',
+    'ؤ': 'و'
+})
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+_products_fts = table('products_fts', column('rowid'))
+
+# أوزان bm25 للأعمدة: الاسم، الوصف، التصنيف
+_BM25_WEIGHTS = (10.0, 1.0, 5.0)
+
+# عدد كلمات مقتطف نتيجة البحث
+SNIPPET_TOKENS = 12
+
+def normalize_arabic(value):
+    if not value:
+        return ''
+    value = _TASHKEEL.sub('', value)
+    return value.translate(_CHAR_MAP).lower()
+
+def ensure_search_index():
+    db.session.execute(text(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5("
+        "name, description, category, prefix='2 3', tokenize='unicode61 remove_diacritics 2')"
+    ))
+    is_empty = db.session.execute(text('SELECT NOT EXISTS (SELECT 1 FROM products_fts)')).scalar()
+    if is_empty:
+        rebuild_search_index()
+    db.session.commit()
+
+def rebuild_search_index(batch_size=1000):
+    db.session.execute(text('DELETE FROM products_fts'))
+    last_id = 0
+    while True:
+        products = Product.query.filter(
+            Product.is_active == True, Product.id > last_id
+        ).order_by(Product.id).limit(batch_size).all()
+        if not products:
+            break
+        index_products(products)
+        last_id = products[-1].id
+
+def _index_row(product):
+    return {
+        'id': product.id,
+        'name': normalize_arabic(product.name),
+        'description': normalize_arabic(product.description),
+        'category': normalize_arabic(product.category)
+    }
+
+def index_product(product):
+    # يُستدعى قبل حفظ التغييرات ليبقى الفهرس ضمن نفس المعاملة
+    index_products([product])
+
+def index_products(products):
+    if not products:
+        return
+    db.session.execute(text('DELETE FROM products_fts WHERE rowid = :id'), [{'id': product.id} for product in products])
+    rows = [_index_row(product) for product in products if product.is_active]
+    if rows:
+        db.session.execute(text(
+            'INSERT INTO products_fts (rowid, name, description, category) '
+            'VALUES (:id, :name, :description, :category)'
+        ), rows)
+
+def remove_product(product_id):
+    db.session.execute(text('DELETE FROM products_fts WHERE rowid = :id'), {'id': product_id})
+
+def query_terms(query):
+    return _TOKEN.findall(normalize_arabic(query))
+
+def build_match_query(query):
+    # كل كلمة تطابق كبادئة، والكلمات مجتمعة بـ AND
+    return ' '.join('"{}"*'.format(token.replace('"', '""')) for token in query_terms(query))
+
+def search_products_query(match_query):
+    fts = literal_column('products_fts')
+    rank = func.bm25(fts, *_BM25_WEIGHTS).label('rank')
+
+    return db.session.query(Product, rank).select_from(
+        _products_fts
+    ).join(
+        Product, Product.id == _products_fts.c.rowid
+    ).filter(
+        fts.op('MATCH')(match_query)
+    ).order_by(rank)
+
+def _fold_char(char):
+    # نفس توحيد الفهرس مع إزالة العلامات اللاتينية كما يفعل unicode61
+    decomposed = unicodedata.normalize('NFKD', char)
+    return normalize_arabic(''.join(c for c in decomposed if not unicodedata.combining(c)))
+
+def _tokens(value):
+    # كلمات النص بصيغتها الموحدة مع موضعها في النص الأصلي
+    folded = []
+    offsets = []
+    for index, char in enumerate(value):
+        for folded_char in _fold_char(char):
+            folded.append(folded_char)
+            offsets.append(index)
+    tokens = []
+    for match in _TOKEN.finditer(''.join(folded)):
+        end = offsets[match.end() - 1] + 1
+        # ضم الحركات التي تلي آخر حرف في الكلمة
+        while end < len(value) and not _fold_char(value[end]):
+            end += 1
+        tokens.append((offsets[match.start()], end, match.group()))
+    return tokens
+
+def product_snippet(product, terms):
+    # المقتطف يُبنى من النص الأصلي للمنتج، فالنسخة الموحدة في الفهرس للمطابقة فقط
+    best = None
+    for value in (product.name, product.description, product.category):
+        if not value:
+            continue
+        tokens = _tokens(value)
+        hits = [index for index, (_, _, token) in enumerate(tokens) if any(token.startswith(term) for term in terms)]
+        if hits and (best is None or len(hits) > len(best[2])):
+            best = (value, tokens, hits)
+    if best is None:
+        return ''
+
+    value, tokens, hits = best
+    start = max(min(hits[0] - SNIPPET_TOKENS // 4, len(tokens) - SNIPPET_TOKENS), 0)
+    end = min(start + SNIPPET_TOKENS, len(tokens))
+    hits = set(hits)
+
+    parts = ['…'] if start > 0 else []
+    position = tokens[start][0]
+    for index in range(start, end):
+        token_start, token_end, _ = tokens[index]
+        parts.append(value[position:token_start])
+        word = value[token_start:token_end]
+        parts.append(f'[{word}]' if index in hits else word)
+        position = token_end
+    if end < len(tokens):
+        parts.append('…')
+    return ''.join(parts)
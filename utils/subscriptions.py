@@ -0,0 +1,97 @@
+from datetime import datetime, timedelta
+from sqlalchemy import update
+from src.models.user import db, UserProfile, UserType, SubscriptionStatus, NotificationType
+from src.utils.notifications import bulk_insert_notifications
+from src.utils import invalidation
+from src.utils.auth_context import USER_SCOPE
+from src.utils.tokens import TOKEN_SCOPES
+from src.utils.catalog import MERCHANT_SCOPE
+
+# عدد الملفات في كل دفعة، وكل دفعة في معاملة قصيرة مستقلة
+SUBSCRIPTION_BATCH_SIZE = 500
+
+# عدد الأيام قبل انتهاء الاشتراك لإرسال التذكير
+EXPIRY_REMINDER_DAYS = 3
+
+def _active_profiles(*conditions):
+    return db.session.query(UserProfile.user_id).filter(
+        UserProfile.subscription_status == SubscriptionStatus.ACTIVE, *conditions
+    ).order_by(UserProfile.subscription_expiry, UserProfile.user_id)
+
+def expire_subscriptions(now=None, batch_size=SUBSCRIPTION_BATCH_SIZE):
+    # تحويل الاشتراكات المنتهية إلى EXPIRED ليبقى التحقق في الطلبات مقارنة حالة فقط
+    now = now or datetime.utcnow()
+    expired = 0
+    while True:
+        user_ids = [user_id for (user_id,) in _active_profiles(
+            UserProfile.subscription_expiry < now
+        ).limit(batch_size)]
+        if not user_ids:
+            break
+        
+        # الشرط يستبعد من جُدد اشتراكه في نفس اللحظة
+        rows = db.session.execute(update(UserProfile).where(
+            UserProfile.user_id.in_(user_ids),
+            UserProfile.subscription_status == SubscriptionStatus.ACTIVE,
+            UserProfile.subscription_expiry < now
+        ).values(
+            subscription_status=SubscriptionStatus.EXPIRED
+        ).returning(UserProfile.user_id, UserProfile.user_type)).all()
+        
+        bulk_insert_notifications([{
+            'user_id': user_id,
+            'title': 'تحديث الاشتراك',
+            'message': 'انتهت صلاحية اشتراكك',
+            'type': NotificationType.GENERAL,
+            'is_read': False,
+            'related_order_id': None
+        } for user_id, _ in rows])
+        db.session.commit()
+        
+        # إبطال ما في ذاكرة كل العمليات بعد الحفظ بسجل واحد للدفعة، فالمهمة قد تعمل
+        # كأمر صيانة في عملية منفصلة عن الخادم، ثم تطبيقه على هذه العملية بالمزامنة
+        entries = []
+        for user_id, user_type in rows:
+            entries += [(USER_SCOPE, user_id), (TOKEN_SCOPES['access'], user_id)]
+            if user_type == UserType.MERCHANT:
+                entries.append((MERCHANT_SCOPE, user_id))
+        invalidation.publish(entries, applied=False)
+        expired += len(rows)
+    
+    return expired
+
+def send_expiry_reminders(now=None, batch_size=SUBSCRIPTION_BATCH_SIZE):
+    # تذكير واحد لكل فترة اشتراك قبل انتهائها بأيام
+    now = now or datetime.utcnow()
+    reminded = 0
+    while True:
+        user_ids = [user_id for (user_id,) in _active_profiles(
+            UserProfile.subscription_expiry >= now,
+            UserProfile.subscription_expiry < now + timedelta(days=EXPIRY_REMINDER_DAYS),
+            UserProfile.expiry_reminder_sent_at == None
+        ).limit(batch_size)]
+        if not user_ids:
+            break
+        
+        rows = db.session.execute(update(UserProfile).where(
+            UserProfile.user_id.in_(user_ids),
+            UserProfile.expiry_reminder_sent_at == None
+        ).values(
+            expiry_reminder_sent_at=now
+        ).returning(UserProfile.user_id, UserProfile.subscription_expiry)).all()
+        
+        bulk_insert_notifications([{
+            'user_id': user_id,
+            'title': 'تذكير بالاشتراك',
+            'message': f'سينتهي اشتراكك بتاريخ {expiry.strftime("%Y-%m-%d")}، يرجى التجديد',
+            'type': NotificationType.GENERAL,
+            'is_read': False,
+            'related_order_id': None
+        } for user_id, expiry in rows])
+        db.session.commit()
+        reminded += len(rows)
+    
+    return reminded
+
+def run_subscription_jobs():
+    return send_expiry_reminders(), expire_subscriptions()
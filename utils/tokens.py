@@ -0,0 +1,85 @@
+import threading
+import time
+from flask import current_app
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+from src.models.user import UserType, SubscriptionStatus
+from src.utils import invalidation
+
+# مدة صلاحية رموز الدخول والتجديد (بالثواني)
+ACCESS_TOKEN_TTL = 15 * 60
+REFRESH_TOKEN_TTL = 30 * 24 * 60 * 60
+
+# أنواع سجلات الإبطال لإلغاء كل نوع رمز
+TOKEN_SCOPES = {'access': 'access_tokens', 'refresh': 'refresh_tokens'}
+
+# المستخدمون الذين أُلغيت رموزهم مع وقت الإلغاء لكل نوع رمز
+_revoked_users = {'access': {}, 'refresh': {}}
+_revoked_lock = threading.Lock()
+
+class TokenError(Exception):
+    pass
+
+def _serializer(kind):
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt=f'{kind}-token')
+
+def issue_tokens(user, profile):
+    now = time.time()
+    access_token = _serializer('access').dumps({
+        'uid': user.id,
+        'user_type': profile.user_type.value,
+        'subscription_status': profile.subscription_status.value,
+        'is_banned': bool(profile.is_banned),
+        'iat': now
+    })
+    refresh_token = _serializer('refresh').dumps({'uid': user.id, 'iat': now})
+
+    return {
+        'access_token': access_token,
+        'refresh_token': refresh_token,
+        'token_type': 'Bearer',
+        'expires_in': ACCESS_TOKEN_TTL
+    }
+
+def _load(kind, token, max_age):
+    try:
+        claims = _serializer(kind).loads(token, max_age=max_age)
+    except SignatureExpired:
+        raise TokenError('انتهت صلاحية الرمز')
+    except BadSignature:
+        raise TokenError('الرمز غير صالح')
+
+    with _revoked_lock:
+        revoked_at = _revoked_users[kind].get(claims['uid'])
+    if revoked_at is not None and claims['iat'] <= revoked_at:
+        raise TokenError('تم إلغاء الرمز')
+
+    return claims
+
+def verify_access_token(token):
+    claims = _load('access', token, ACCESS_TOKEN_TTL)
+    claims['user_type'] = UserType(claims['user_type'])
+    claims['subscription_status'] = SubscriptionStatus(claims['subscription_status'])
+    return claims
+
+def verify_refresh_token(token):
+    return _load('refresh', token, REFRESH_TOKEN_TTL)
+
+def _revoke(kind, user_id, revoked_at):
+    with _revoked_lock:
+        revoked = _revoked_users[kind]
+        # لا حاجة للاحتفاظ بإلغاء أقدم من عمر رمز التجديد
+        for uid in [uid for uid, previous in revoked.items() if previous < time.time() - REFRESH_TOKEN_TTL]:
+            del revoked[uid]
+        revoked[user_id] = max(revoked.get(user_id, 0), revoked_at)
+
+def revoke_user_tokens(user_id, include_refresh=True):
+    # تغيير الصلاحيات يكفيه إلغاء رموز الدخول، فالتجديد يعيد قراءتها من قاعدة البيانات
+    kinds = ('access', 'refresh') if include_refresh else ('access',)
+    now = time.time()
+    for kind in kinds:
+        _revoke(kind, user_id, now)
+    # الإلغاء يصل لبقية العمليات عبر سجل الإبطال، ويُعاد تحميله عند بدء أي عملية
+    invalidation.publish([(TOKEN_SCOPES[kind], user_id) for kind in kinds])
+
+invalidation.on_invalidate(TOKEN_SCOPES['access'], lambda user_id, revoked_at: _revoke('access', user_id, revoked_at), replay=True)
+invalidation.on_invalidate(TOKEN_SCOPES['refresh'], lambda user_id, revoked_at: _revoke('refresh', user_id, revoked_at), replay=True)